@@ -0,0 +1,54 @@
+"""chat_message search_vector and GIN index
+
+Revision ID: 4d9c2a7e81b3
+Revises: c3a81f5d6e27
+Create Date: 2026-10-18 15:48:03.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '4d9c2a7e81b3'
+down_revision = 'c3a81f5d6e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NOTE: adding a stored generated column rewrites the table under an
+    # exclusive lock, run it in a maintenance window on large databases.
+    op.add_column(
+        'chat_message',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('english'::regconfig, coalesce(content, ''))", persisted=True),
+            nullable=True,
+        ),
+    )
+    # Built concurrently so that writes to the table are not blocked, which has
+    # to happen outside of the migration transaction.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'chat_message_search_vector_idx',
+            'chat_message',
+            ['search_vector'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'chat_message_search_vector_idx',
+            table_name='chat_message',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column('chat_message', 'search_vector')
@@ -0,0 +1,68 @@
+"""ai_context_entry and ai_thread_summary tables
+
+Revision ID: 5b7e2f90a1c4
+Revises: cd14fcafbc10
+Create Date: 2026-10-18 13:40:27.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e2f90a1c4'
+down_revision = 'cd14fcafbc10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'ai_context_entry',
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('thread_id', sa.Integer(), nullable=False),
+        sa.Column('token_count', sa.Integer(), nullable=False),
+        sa.Column('token_offset', sa.BigInteger(), nullable=False),
+        sa.Column('created_ts', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['message_id'],
+            ['chat_message.id'],
+            name=op.f('ai_context_entry_message_id_fkey'),
+            ondelete='CASCADE',
+        ),
+        sa.ForeignKeyConstraint(
+            ['thread_id'],
+            ['chat_thread.id'],
+            name=op.f('ai_context_entry_thread_id_fkey'),
+            ondelete='CASCADE',
+        ),
+        sa.PrimaryKeyConstraint('message_id', name=op.f('ai_context_entry_message_id_pkey')),
+    )
+    op.create_index(
+        'ai_context_entry_thread_id_token_offset_idx',
+        'ai_context_entry',
+        ['thread_id', 'token_offset'],
+        unique=False,
+    )
+    op.create_table(
+        'ai_thread_summary',
+        sa.Column('thread_id', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('token_count', sa.Integer(), nullable=False),
+        sa.Column('covers_until_offset', sa.BigInteger(), nullable=False),
+        sa.Column('created_ts', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('modified_ts', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['thread_id'],
+            ['chat_thread.id'],
+            name=op.f('ai_thread_summary_thread_id_fkey'),
+            ondelete='CASCADE',
+        ),
+        sa.PrimaryKeyConstraint('thread_id', name=op.f('ai_thread_summary_thread_id_pkey')),
+    )
+
+
+def downgrade():
+    op.drop_table('ai_thread_summary')
+    op.drop_index('ai_context_entry_thread_id_token_offset_idx', table_name='ai_context_entry')
+    op.drop_table('ai_context_entry')
@@ -0,0 +1,98 @@
+"""chat_message workspace_id and workspace scoped search index
+
+Revision ID: 6a1f3c9d2e75
+Revises: b8d4e2f61a93
+Create Date: 2026-10-18 21:02:44.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a1f3c9d2e75'
+down_revision = 'b8d4e2f61a93'
+branch_labels = None
+depends_on = None
+
+# Rows updated per statement by the backfill, each in its own transaction
+BACKFILL_BATCH_SIZE = 10000
+
+# Threads never change workspace, so the workspace of a message is set once,
+# from its thread, whatever code path writes it.
+WORKSPACE_FUNCTION = """
+CREATE OR REPLACE FUNCTION steago_set_message_workspace() RETURNS trigger AS $$
+BEGIN
+    NEW.workspace_id := (SELECT workspace_id FROM chat_thread WHERE id = NEW.thread_id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade():
+    # Nullable without a default: no table rewrite
+    op.add_column('chat_message', sa.Column('workspace_id', sa.Integer(), nullable=True))
+    op.execute(WORKSPACE_FUNCTION)
+    op.execute(
+        'CREATE TRIGGER "chat_message_set_workspace" '
+        'BEFORE INSERT OR UPDATE OF thread_id ON "chat_message" '
+        'FOR EACH ROW EXECUTE FUNCTION steago_set_message_workspace()'
+    )
+
+    # Backfilled by id ranges, committing each one, so that no long
+    # transaction holds the locks of the whole table. The index is built
+    # concurrently, which has to happen outside of the migration transaction.
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        max_id = connection.execute(sa.text('SELECT max(id) FROM chat_message')).scalar() or 0
+        for start in range(0, max_id, BACKFILL_BATCH_SIZE):
+            connection.execute(
+                sa.text(
+                    'UPDATE chat_message AS m SET workspace_id = t.workspace_id '
+                    'FROM chat_thread AS t '
+                    'WHERE t.id = m.thread_id AND m.id > :start AND m.id <= :end '
+                    'AND m.workspace_id IS NULL'
+                ),
+                {'start': start, 'end': start + BACKFILL_BATCH_SIZE},
+            )
+
+        # `=` on the integer column inside a GIN index
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gin')
+        op.create_index(
+            'chat_message_workspace_id_search_vector_idx',
+            'chat_message',
+            ['workspace_id', 'search_vector'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            'chat_message_search_vector_idx',
+            table_name='chat_message',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'chat_message_search_vector_idx',
+            'chat_message',
+            ['search_vector'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            'chat_message_workspace_id_search_vector_idx',
+            table_name='chat_message',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.execute('DROP TRIGGER IF EXISTS "chat_message_set_workspace" ON "chat_message"')
+    op.execute('DROP FUNCTION IF EXISTS steago_set_message_workspace()')
+    op.drop_column('chat_message', 'workspace_id')
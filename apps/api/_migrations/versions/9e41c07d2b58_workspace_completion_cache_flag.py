@@ -0,0 +1,31 @@
+"""core_workspace is_completion_cache_enabled
+
+Revision ID: 9e41c07d2b58
+Revises: 5b7e2f90a1c4
+Create Date: 2026-10-18 14:22:09.000000
+
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e41c07d2b58'
+down_revision = '5b7e2f90a1c4'
+branch_labels = None
+depends_on = None
+
+WORKSPACE_TABLE = os.environ["STEAGO_CORE_WORKSPACE_MODEL_TABLE"]
+
+
+def upgrade():
+    op.add_column(
+        WORKSPACE_TABLE,
+        sa.Column('is_completion_cache_enabled', sa.Boolean(), server_default=sa.true(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_column(WORKSPACE_TABLE, 'is_completion_cache_enabled')
@@ -0,0 +1,65 @@
+"""core_job table
+
+Revision ID: a5d0c8e3f719
+Revises: e7f3b19c0d42
+Create Date: 2026-10-18 18:02:44.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5d0c8e3f719'
+down_revision = 'e7f3b19c0d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'core_job',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('kind', sa.String(length=64), nullable=False),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), server_default='{}', nullable=False),
+        sa.Column('idempotency_key', sa.String(length=255), nullable=True),
+        sa.Column('status', sa.SmallInteger(), nullable=False),
+        sa.Column('priority', sa.SmallInteger(), server_default='0', nullable=False),
+        sa.Column('run_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('attempts', sa.SmallInteger(), server_default='0', nullable=False),
+        sa.Column('max_attempts', sa.SmallInteger(), server_default='5', nullable=False),
+        sa.Column('locked_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_ts', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('modified_ts', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('id', name=op.f('core_job_id_pkey')),
+    )
+    op.create_index(
+        'core_job_priority_run_at_id_idx',
+        'core_job',
+        [sa.text('priority DESC'), 'run_at', 'id'],
+        unique=False,
+        postgresql_where=sa.text('status = 0'),
+    )
+    op.create_index(
+        'core_job_idempotency_key_idx',
+        'core_job',
+        ['idempotency_key'],
+        unique=True,
+        postgresql_where=sa.text('status IN (0, 1)'),
+    )
+    op.create_index(
+        'core_job_locked_at_idx',
+        'core_job',
+        ['locked_at'],
+        unique=False,
+        postgresql_where=sa.text('status = 1'),
+    )
+
+
+def downgrade():
+    op.drop_index('core_job_locked_at_idx', table_name='core_job', postgresql_where=sa.text('status = 1'))
+    op.drop_index('core_job_idempotency_key_idx', table_name='core_job', postgresql_where=sa.text('status IN (0, 1)'))
+    op.drop_index('core_job_priority_run_at_id_idx', table_name='core_job', postgresql_where=sa.text('status = 0'))
+    op.drop_table('core_job')
@@ -0,0 +1,49 @@
+"""watermark indexes
+
+Revision ID: b8d4e2f61a93
+Revises: f2b6e9a4c158
+Create Date: 2026-10-18 20:02:41.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8d4e2f61a93'
+down_revision = 'f2b6e9a4c158'
+branch_labels = None
+depends_on = None
+
+# (table, key column) of each watermark, see modules/chat/utils/watermarks.py
+WATERMARKS = [
+    ('chat_channel', 'workspace_id'),
+    ('chat_thread', 'workspace_id'),
+    ('chat_message', 'thread_id'),
+]
+
+
+def upgrade():
+    # Built concurrently so that writes to the (large) tables are not blocked,
+    # which has to happen outside of the migration transaction.
+    with op.get_context().autocommit_block():
+        for table, column in WATERMARKS:
+            op.create_index(
+                f'{table}_{column}_modified_ts_idx',
+                table,
+                [column, 'modified_ts'],
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table, column in WATERMARKS:
+            op.drop_index(
+                f'{table}_{column}_modified_ts_idx',
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
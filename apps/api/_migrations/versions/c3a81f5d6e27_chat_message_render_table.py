@@ -0,0 +1,45 @@
+"""chat_message_render table
+
+Revision ID: c3a81f5d6e27
+Revises: 9e41c07d2b58
+Create Date: 2026-10-18 15:05:41.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a81f5d6e27'
+down_revision = '9e41c07d2b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'chat_message_render',
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('renderer_version', sa.SmallInteger(), nullable=False),
+        sa.Column('html', sa.Text(), nullable=False),
+        sa.Column('rendered_ts', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['message_id'],
+            ['chat_message.id'],
+            name=op.f('chat_message_render_message_id_fkey'),
+            ondelete='CASCADE',
+        ),
+        sa.PrimaryKeyConstraint('message_id', name=op.f('chat_message_render_message_id_pkey')),
+    )
+    op.create_index(
+        'chat_message_render_renderer_version_idx',
+        'chat_message_render',
+        ['renderer_version'],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('chat_message_render_renderer_version_idx', table_name='chat_message_render')
+    op.drop_table('chat_message_render')
@@ -0,0 +1,40 @@
+"""chat_message keyset indexes
+
+Revision ID: cd14fcafbc10
+Revises: 
+Create Date: 2026-10-18 13:05:12.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cd14fcafbc10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built concurrently so that writes to the (large) table are not blocked,
+    # which has to happen outside of the migration transaction.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'chat_message_thread_id_created_ts_id_idx',
+            'chat_message',
+            ['thread_id', 'created_ts', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'chat_message_thread_id_created_ts_id_idx',
+            table_name='chat_message',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,68 @@
+"""ai_message_embedding table
+
+Revision ID: e7f3b19c0d42
+Revises: 4d9c2a7e81b3
+Create Date: 2026-10-18 16:31:18.000000
+
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7f3b19c0d42'
+down_revision = '4d9c2a7e81b3'
+branch_labels = None
+depends_on = None
+
+WORKSPACE_TABLE = os.environ["STEAGO_CORE_WORKSPACE_MODEL_TABLE"]
+
+
+def upgrade():
+    op.create_table(
+        'ai_message_embedding',
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('thread_id', sa.Integer(), nullable=False),
+        sa.Column('workspace_id', sa.Integer(), nullable=False),
+        sa.Column('model', sa.String(length=128), nullable=False),
+        sa.Column('vector', sa.LargeBinary(), nullable=False),
+        sa.Column('created_ts', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['message_id'],
+            ['chat_message.id'],
+            name=op.f('ai_message_embedding_message_id_fkey'),
+            ondelete='CASCADE',
+        ),
+        sa.ForeignKeyConstraint(
+            ['thread_id'],
+            ['chat_thread.id'],
+            name=op.f('ai_message_embedding_thread_id_fkey'),
+            ondelete='CASCADE',
+        ),
+        sa.ForeignKeyConstraint(
+            ['workspace_id'],
+            [f'{WORKSPACE_TABLE}.id'],
+            name=op.f('ai_message_embedding_workspace_id_fkey'),
+        ),
+        sa.PrimaryKeyConstraint('message_id', name=op.f('ai_message_embedding_message_id_pkey')),
+    )
+    op.create_index(
+        'ai_message_embedding_workspace_id_model_message_id_idx',
+        'ai_message_embedding',
+        ['workspace_id', 'model', 'message_id'],
+        unique=False,
+    )
+    op.create_index(
+        'ai_message_embedding_workspace_id_model_created_ts_idx',
+        'ai_message_embedding',
+        ['workspace_id', 'model', 'created_ts'],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ai_message_embedding_workspace_id_model_created_ts_idx', table_name='ai_message_embedding')
+    op.drop_index('ai_message_embedding_workspace_id_model_message_id_idx', table_name='ai_message_embedding')
+    op.drop_table('ai_message_embedding')
@@ -0,0 +1,54 @@
+"""status notify triggers
+
+Revision ID: f2b6e9a4c158
+Revises: a5d0c8e3f719
+Create Date: 2026-10-18 19:10:27.000000
+
+"""
+import os
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b6e9a4c158'
+down_revision = 'a5d0c8e3f719'
+branch_labels = None
+depends_on = None
+
+USER_TABLE = os.environ["STEAGO_CORE_USER_MODEL_TABLE"]
+WORKSPACE_TABLE = os.environ["STEAGO_CORE_WORKSPACE_MODEL_TABLE"]
+
+# Payload: `<kind>:<id>:<status>`, status -1 for a deleted row. The kind is
+# the first trigger argument. See `modules.core.utils.status`.
+NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION steago_notify_status() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('steago_status', TG_ARGV[0] || ':' || OLD.id || ':-1');
+        RETURN OLD;
+    END IF;
+    IF TG_OP = 'UPDATE' AND OLD.status IS NOT DISTINCT FROM NEW.status THEN
+        RETURN NEW;
+    END IF;
+    PERFORM pg_notify('steago_status', TG_ARGV[0] || ':' || NEW.id || ':' || NEW.status);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade():
+    op.execute(NOTIFY_FUNCTION)
+    for table, kind in ((USER_TABLE, 'u'), (WORKSPACE_TABLE, 'w')):
+        op.execute(
+            f'CREATE TRIGGER "{table}_status_notify" '
+            f'AFTER INSERT OR UPDATE OF status OR DELETE ON "{table}" '
+            f"FOR EACH ROW EXECUTE FUNCTION steago_notify_status('{kind}')"
+        )
+
+
+def downgrade():
+    for table in (USER_TABLE, WORKSPACE_TABLE):
+        op.execute(f'DROP TRIGGER IF EXISTS "{table}_status_notify" ON "{table}"')
+    op.execute('DROP FUNCTION IF EXISTS steago_notify_status()')
@@ -0,0 +1,90 @@
+"""
+Benchmark of rendering a streamed reply, re-rendering the whole text on every
+update versus the incremental renderer:
+
+    python benchmarks/bench_markdown.py [--tokens 20000] [--every 100]
+
+A token is taken as 4 characters, the HTML is rendered every `--every` tokens
+(i.e. once per streamed update).
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.chat.utils.markdown import (  # noqa: E402
+    IncrementalMarkdownRenderer,
+    render_markdown,
+)
+
+BLOCKS = [
+    "## Step {i}\n",
+    "This is paragraph {i} of the reply, with **bold**, *emphasis*, `inline code` and\n"
+    "a [link](https://steago.ai/{i}). It goes on for a little while to look like\n"
+    "what a model would write when it explains something.\n",
+    "- First point of list {i}\n- Second point, a bit longer than the first one\n"
+    "  - A nested point\n- Last point\n",
+    "1. Do this\n2. Then that\n3. And finally {i}\n",
+    "```python\ndef step_{i}(value):\n    # Double it\n    return value * 2\n```\n",
+    "> A quoted remark number {i},\n> on two lines.\n",
+    "| Column | Value |\n|--------|-------|\n| a | {i} |\n| b | {i} |\n",
+]
+
+
+def generate_reply(tokens: int) -> str:
+    random.seed(0)
+    parts, size, i = [], 0, 0
+    while size < tokens * 4:
+        block = random.choice(BLOCKS).format(i=i)
+        parts.append(block)
+        size += len(block) + 1
+        i += 1
+    return "\n".join(parts)
+
+
+def stream(text: str):
+    return [text[i : i + 4] for i in range(0, len(text), 4)]
+
+
+def bench_full(deltas: list[str], every: int) -> tuple[float, str]:
+    started = time.perf_counter()
+    text = ""
+    html = ""
+    for i, delta in enumerate(deltas, 1):
+        text += delta
+        if i % every == 0 or i == len(deltas):
+            html = render_markdown(text)
+    return time.perf_counter() - started, html
+
+
+def bench_incremental(deltas: list[str], every: int) -> tuple[float, str]:
+    started = time.perf_counter()
+    renderer = IncrementalMarkdownRenderer()
+    html = ""
+    for i, delta in enumerate(deltas, 1):
+        renderer.feed(delta)
+        if i % every == 0 or i == len(deltas):
+            html = renderer.html
+    return time.perf_counter() - started, html
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--every", type=int, default=100)
+    args = parser.parse_args()
+
+    deltas = stream(generate_reply(args.tokens))
+    updates = -(-len(deltas) // args.every)
+    print(f"{len(deltas)} tokens, {updates} updates")
+
+    full, full_html = bench_full(deltas, args.every)
+    incremental, incremental_html = bench_incremental(deltas, args.every)
+    assert incremental_html == full_html, "incremental output differs"
+
+    print(f"{'full re-render':<16} {full:>8.2f} s")
+    print(f"{'incremental':<16} {incremental:>8.2f} s  ({full / incremental:.0f}x)")
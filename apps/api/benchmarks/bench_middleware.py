@@ -0,0 +1,78 @@
+"""
+Microbenchmark of the per-request overhead of the browser context middleware.
+
+Compares the old eager `before_request` parsing with the lazy
+`flask_g.browser_context`, for requests that do and do not read it:
+
+    python benchmarks/bench_middleware.py [--requests 20000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from flask import Flask, request
+from flask import g as flask_g
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.core.utils.browser_context import SteagoAppGlobals  # noqa: E402
+
+CONTEXT_HEADER = json.dumps(
+    {"browser": "Firefox", "os": "Linux", "screen": "2560x1440", "locale": "en-US"}
+)
+
+
+def eager_browser_context():
+    context = json.loads(request.headers.get("C-Browser-Context", "null"))
+    if context and "ip" not in context:
+        context["ip"] = request.environ.get("HTTP_X_FORWARDED_FOR", request.remote_addr)
+    flask_g.browser_context = context
+
+
+def create_app(lazy: bool) -> Flask:
+    app = Flask(__name__)
+    if lazy:
+        app.app_ctx_globals_class = SteagoAppGlobals
+    else:
+        app.before_request(eager_browser_context)
+
+    @app.get("/ping")
+    def ping():
+        return {"ping": "pong"}
+
+    @app.get("/tracked")
+    def tracked():
+        return {"browser": flask_g.browser_context["browser"]}
+
+    @app.get("/untracked")
+    def untracked():
+        return {"ok": True}
+
+    return app
+
+
+def bench(app: Flask, path: str, requests: int) -> float:
+    client = app.test_client()
+    headers = {"C-Browser-Context": CONTEXT_HEADER}
+    for _ in range(200):
+        client.get(path, headers=headers)
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        client.get(path, headers=headers)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'route':<12} {'eager (us)':>12} {'lazy (us)':>12}")
+    for path in ("/ping", "/untracked", "/tracked"):
+        eager = bench(create_app(lazy=False), path, args.requests)
+        lazy = bench(create_app(lazy=True), path, args.requests)
+        print(f"{path:<12} {eager:>12.1f} {lazy:>12.1f}")
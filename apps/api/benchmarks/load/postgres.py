@@ -0,0 +1,117 @@
+"""
+Throwaway local Postgres cluster for the load tests.
+
+The cluster is created with `initdb` in a temporary directory (or in
+`data_dir`, kept between runs so the seeded data can be reused) and listens
+on a free local port. The binaries are looked up on the `PATH`, or in
+`PG_BIN` (e.g. `/usr/lib/postgresql/16/bin`).
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from typing import Optional
+
+DB_NAME = "steago_bench"
+DB_USER = "steago"
+
+# Enough for every gunicorn worker pool and the harness itself
+MAX_CONNECTIONS = 300
+
+
+def find_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _binary(name: str) -> str:
+    bin_dir = os.environ.get("PG_BIN")
+    path = os.path.join(bin_dir, name) if bin_dir else shutil.which(name)
+    if not path or not os.path.exists(path):
+        raise RuntimeError(f"`{name}` not found, install Postgres or set PG_BIN")
+    return path
+
+
+class ThrowawayPostgres:
+    def __init__(self, data_dir: Optional[str] = None) -> None:
+        self.keep = data_dir is not None
+        self.data_dir = data_dir or tempfile.mkdtemp(prefix="steago-bench-pg-")
+        self.port = find_free_port()
+        self.created = False
+
+    @property
+    def uri(self) -> str:
+        return f"postgresql://{DB_USER}@127.0.0.1:{self.port}/{DB_NAME}"
+
+    def start(self) -> str:
+        """
+        Start the cluster (creating it first if needed).
+
+        Returns:
+            str: The URI of the benchmark database
+        """
+        if not os.path.exists(os.path.join(self.data_dir, "PG_VERSION")):
+            subprocess.run(
+                [
+                    _binary("initdb"),
+                    "-D", self.data_dir,
+                    "-U", DB_USER,
+                    "--auth=trust",
+                    "--encoding=UTF8",
+                    "--no-sync",
+                ],
+                check=True,
+                stdout=subprocess.DEVNULL,
+            )
+            self.created = True
+
+        options = f"-p {self.port} -k {self.data_dir} -c max_connections={MAX_CONNECTIONS}"
+        subprocess.run(
+            [
+                _binary("pg_ctl"),
+                "-D", self.data_dir,
+                "-l", os.path.join(self.data_dir, "server.log"),
+                "-o", options,
+                "-w",
+                "start",
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        self._create_database()
+        return self.uri
+
+    def _create_database(self) -> None:
+        import psycopg2
+
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                connection = psycopg2.connect(
+                    host="127.0.0.1", port=self.port, user=DB_USER, dbname="postgres"
+                )
+                break
+            except psycopg2.OperationalError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (DB_NAME,))
+            if cursor.fetchone() is None:
+                cursor.execute(f"CREATE DATABASE {DB_NAME}")
+        connection.close()
+
+    def stop(self) -> None:
+        subprocess.run(
+            [_binary("pg_ctl"), "-D", self.data_dir, "-m", "fast", "-w", "stop"],
+            check=False,
+            stdout=subprocess.DEVNULL,
+        )
+        if not self.keep:
+            shutil.rmtree(self.data_dir, ignore_errors=True)
@@ -0,0 +1,105 @@
+"""
+Load test results, and their comparison with a stored baseline.
+
+A baseline is the JSON summary of an earlier run (`--save-baseline`). A run
+regresses when a request's p50 or p99 latency grows, or its throughput drops,
+by more than the tolerance. Results are only comparable between runs of the
+same settings (`meta`) on the same machine.
+"""
+
+import json
+import os
+from typing import Optional
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    Nearest-rank percentile of sorted `values`.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def summarize(
+    latencies: dict[str, list[float]], errors: dict[str, int], seconds: float, meta: dict
+) -> dict:
+    """
+    Requests, errors, requests per second and p50/p99 latency (ms) of each
+    request name, and of all requests (`total`, streams counted once).
+    """
+
+    def stats(values: list[float], error_count: int) -> dict:
+        values = sorted(values)
+        return {
+            "requests": len(values),
+            "errors": error_count,
+            "rps": round(len(values) / seconds, 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+        }
+
+    names = sorted(set(latencies) | set(errors))
+    requests = {name: stats(latencies.get(name, []), errors.get(name, 0)) for name in names}
+    everything = [
+        value
+        for name, values in latencies.items()
+        if not name.endswith("_ttfb")
+        for value in values
+    ]
+    requests["total"] = stats(everything, sum(errors.values()))
+    return {"meta": meta, "seconds": round(seconds, 2), "requests": requests}
+
+
+def format_summary(summary: dict) -> str:
+    lines = [f"{'request':<14}{'count':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}"]
+    for name, stats in summary["requests"].items():
+        lines.append(
+            f"{name:<14}{stats['requests']:>9}{stats['errors']:>8}{stats['rps']:>10.1f}"
+            f"{stats['p50_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+# =============================================================================
+
+
+def load_baseline(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(path: str, summary: dict) -> None:
+    with open(path, "w") as file:
+        json.dump(summary, file, indent=2)
+        file.write("\n")
+
+
+def compare_to_baseline(
+    summary: dict, baseline: dict, tolerance: float, p99_tolerance: float
+) -> list[str]:
+    """
+    Compare a run with a baseline.
+
+    Returns:
+        list[str]: The regressions, empty if there are none
+    """
+    regressions = []
+    for name, base in baseline["requests"].items():
+        current = summary["requests"].get(name)
+        if current is None or not base["requests"]:
+            continue
+        for key, limit in (("p50_ms", tolerance), ("p99_ms", p99_tolerance)):
+            if current[key] > base[key] * (1 + limit):
+                regressions.append(
+                    f"{name}: {key} {current[key]:.1f} > {base[key]:.1f} (+{limit:.0%})"
+                )
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: req/s {current['rps']:.1f} < {base['rps']:.1f} (-{tolerance:.0%})"
+            )
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: {current['errors']} errors (was {base['errors']})")
+    return regressions
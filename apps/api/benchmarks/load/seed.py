@@ -0,0 +1,324 @@
+"""
+Schema and synthetic data of the load tests.
+
+The schema is created from the models, like a fresh install, and the rows
+are generated by Postgres itself (`INSERT ... SELECT generate_series`), so
+that millions of messages load in a few minutes. Message traffic is skewed:
+a few threads hold most of the messages, like in a real workspace.
+"""
+
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.types import (
+    JSON,
+    Boolean,
+    DateTime,
+    Float,
+    Integer,
+    LargeBinary,
+    Numeric,
+    String,
+    Uuid,
+)
+
+# Messages per statement, so progress can be reported
+BATCH_SIZE = 200_000
+
+WORDS = (
+    "deploy release migration database index query latency cache replica "
+    "budget invoice customer contract renewal pricing discount forecast "
+    "roadmap sprint backlog estimate review design mockup feedback launch "
+    "campaign newsletter audience conversion funnel retention churn survey "
+    "incident outage rollback alert dashboard metrics logging tracing "
+    "onboarding hiring interview offer payroll benefits policy handbook "
+    "security audit compliance password token permission access firewall "
+    "model prompt embedding summary assistant training dataset evaluation "
+    "meeting agenda notes decision action owner deadline quarter goals "
+    "python flask postgres redis docker kubernetes terraform pipeline build "
+    "mobile android ios browser extension plugin integration webhook api "
+    "report analysis chart spreadsheet export import upload download sync"
+).split()
+
+
+@dataclass
+class SeedSize:
+    workspaces: int = 10
+    # Per workspace
+    users: int = 20
+    channels: int = 5
+    # Per channel
+    threads: int = 40
+    # In total
+    messages: int = 1_000_000
+
+    @property
+    def thread_count(self) -> int:
+        return self.workspaces * self.channels * self.threads
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+# =============================================================================
+
+
+def create_schema_app(uri: str):
+    """
+    A bare app bound to the benchmark DB, with every model loaded.
+    """
+    from flask import Flask
+
+    import modules.chat.search  # noqa: F401 (declares `search_vector`)
+    import steago
+    from modules.core.db.primary import primary_db
+
+    steago.load_models()
+
+    app = Flask("steago-bench")
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    primary_db.init_app(app)
+    return app
+
+
+def _filler(column):
+    """
+    SQL value of a required column the seed does not set.
+    """
+    if column.nullable or column.server_default is not None or column.computed is not None:
+        return None
+    for type_, value in (
+        (Uuid, "gen_random_uuid()"),
+        (DateTime, "now()"),
+        (Boolean, "false"),
+        ((Integer, Numeric, Float), "0"),
+        (JSON, "'{}'"),
+        (String, "''"),
+        (LargeBinary, "''::bytea"),
+    ):
+        if isinstance(column.type, type_):
+            return value
+    raise RuntimeError(f"No seed value for {column.table.name}.{column.name}")
+
+
+def _insert_select(connection, table, values: dict, source: str, prefix: str = "") -> None:
+    columns, expressions = [], []
+    for column in table.columns:
+        value = values.get(column.name)
+        if value is None:
+            value = _filler(column)
+        if value is not None:
+            columns.append(f'"{column.name}"')
+            expressions.append(value)
+    connection.execute(
+        text(
+            f"{prefix} INSERT INTO {table.name} ({', '.join(columns)}) "
+            f"SELECT {', '.join(expressions)} FROM {source}"
+        )
+    )
+
+
+def _reset_sequence(connection, table) -> None:
+    connection.execute(
+        text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"(SELECT coalesce(max(id), 1) FROM {table.name}))"
+        )
+    )
+
+
+# =============================================================================
+
+
+def is_seeded(app) -> bool:
+    from sqlalchemy import inspect
+
+    from modules.chat.models.message import ChatMessage
+    from modules.core.db.primary import primary_db as db
+
+    with app.app_context():
+        if not inspect(db.engine).has_table(ChatMessage.__tablename__):
+            return False
+        with db.engine.connect() as connection:
+            query = f"SELECT EXISTS (SELECT 1 FROM {ChatMessage.__tablename__})"
+            return bool(connection.scalar(text(query)))
+
+
+def seed(app, size: SeedSize, log=print) -> None:
+    """
+    Create the schema and fill it with `size` rows.
+    """
+    from modules.chat.models.channel import ChatChannel
+    from modules.chat.models.message import ChatMessage
+    from modules.chat.models.thread import ChatThread
+    from modules.core.db.primary import primary_db as db
+    from modules.core.models.enums import USER_STATUS, USER_TYPE, WORKSPACE_STATUS
+    from modules.core.models.unified import get_unified_user, get_unified_workspace
+
+    User = get_unified_user()
+    Workspace = get_unified_workspace()
+    messages = ChatMessage.__table__
+
+    with app.app_context():
+        db.create_all()
+        engine = db.engine
+
+        with engine.begin() as connection:
+            _insert_select(
+                connection,
+                Workspace.__table__,
+                {
+                    "id": "i",
+                    "uuid": "gen_random_uuid()",
+                    "name": "'Workspace ' || i",
+                    "status": str(WORKSPACE_STATUS.ACTIVE.value),
+                },
+                f"generate_series(1, {size.workspaces}) AS i",
+            )
+            _insert_select(
+                connection,
+                User.__table__,
+                {
+                    "id": "i",
+                    "uuid": "gen_random_uuid()",
+                    "name": "'User ' || i",
+                    "email": "'user' || i || '@bench.steago.ai'",
+                    "status": str(USER_STATUS.ACTIVE.value),
+                    "type": str(USER_TYPE.HUB_USER.value),
+                    "workspace_id": f"(i - 1) / {size.users} + 1",
+                },
+                f"generate_series(1, {size.workspaces * size.users}) AS i",
+            )
+            _insert_select(
+                connection,
+                ChatChannel.__table__,
+                {
+                    "id": "i",
+                    "uuid": "gen_random_uuid()",
+                    "name": "'channel-' || i",
+                    "workspace_id": f"(i - 1) / {size.channels} + 1",
+                },
+                f"generate_series(1, {size.workspaces * size.channels}) AS i",
+            )
+            _insert_select(
+                connection,
+                ChatThread.__table__,
+                {
+                    "id": "i",
+                    "uuid": "gen_random_uuid()",
+                    "title": "'Thread ' || i",
+                    "workspace_id": f"(i - 1) / {size.channels * size.threads} + 1",
+                    "channel_id": f"(i - 1) / {size.threads} + 1",
+                },
+                f"generate_series(1, {size.thread_count}) AS i",
+            )
+            for model in (Workspace, User, ChatChannel, ChatThread):
+                _reset_sequence(connection, model.__table__)
+
+        # Loading first and indexing after is much faster than maintaining
+        # the indexes row by row
+        with engine.begin() as connection:
+            for index in messages.indexes:
+                index.drop(connection)
+
+        _seed_messages(engine, messages, size, log)
+
+        with engine.begin() as connection:
+            _reset_sequence(connection, messages)
+        log("Building the message indexes...")
+        with engine.begin() as connection:
+            for index in messages.indexes:
+                index.create(connection)
+            # Created by the `chat_message_keyset_indexes` migration
+            connection.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS chat_message_thread_id_created_ts_id_idx "
+                    f"ON {messages.name} (thread_id, created_ts, id)"
+                )
+            )
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("VACUUM ANALYZE"))
+
+
+def _seed_messages(engine, messages, size: SeedSize, log) -> None:
+    words = ", ".join(f"'{word}'" for word in WORDS)
+    word_count = len(WORDS)
+    # Oldest first, a second apart, ending now
+    first_ts = datetime.now(timezone.utc) - timedelta(seconds=size.messages)
+    threads_per_workspace = size.channels * size.threads
+    # Array subscripts are integers, the products are not
+    first = f"((i::bigint * 7919) % {word_count - 20})::int"
+    second = f"((i::bigint * 104729) % {word_count - 20})::int"
+
+    values = {
+        "id": "i",
+        "uuid": "gen_random_uuid()",
+        "thread_id": "t",
+        # Every other message is an assistant reply
+        "user_id": (
+            "CASE WHEN i % 2 = 0 THEN NULL "
+            f"ELSE ((t - 1) / {threads_per_workspace}) * {size.users} + 1 + i % {size.users} END"
+        ),
+        # 7 to 40 words, from two runs of the vocabulary
+        "content": (
+            f"array_to_string(w.a[1 + {first} : 1 + {first} + 5 + i % 15], ' ') || ' ' || "
+            f"array_to_string(w.a[1 + {second} : 1 + {second} + i % 20], ' ')"
+        ),
+        "created_ts": f"'{first_ts.isoformat()}'::timestamptz + make_interval(secs => i)",
+        "modified_ts": f"'{first_ts.isoformat()}'::timestamptz + make_interval(secs => i)",
+    }
+
+    started = time.monotonic()
+    with engine.connect() as connection:
+        connection.execute(text("SELECT setseed(0.42)"))
+        for start in range(1, size.messages + 1, BATCH_SIZE):
+            end = min(start + BATCH_SIZE - 1, size.messages)
+            # Squared uniform: low thread ids get most of the messages
+            source = (
+                "w, (SELECT i, 1 + floor("
+                f"{size.thread_count} * power(random(), 2))::int AS t "
+                f"FROM generate_series({start}, {end}) AS i) AS s"
+            )
+            _insert_select(
+                connection,
+                messages,
+                values,
+                source,
+                prefix=f"WITH w AS (SELECT ARRAY[{words}]::text[] AS a)",
+            )
+            connection.commit()
+            log(f"Seeded {end:,} / {size.messages:,} messages ({time.monotonic() - started:.0f} s)")
+
+
+# =============================================================================
+
+
+def load_targets(app) -> tuple[list[tuple], dict[int, list[str]]]:
+    """
+    The users and threads to send traffic to.
+
+    Returns:
+        tuple: `(uuid, workspace_id)` of every user, and the thread uuids of
+        each workspace, oldest first
+    """
+    from sqlalchemy import select
+
+    from modules.chat.models.thread import ChatThread
+    from modules.core.db.primary import primary_db as db
+    from modules.core.models.unified import get_unified_user
+
+    User = get_unified_user()
+    with app.app_context():
+        users = [
+            (str(uuid), workspace_id)
+            for uuid, workspace_id in db.session.execute(select(User.uuid, User.workspace_id))
+        ]
+        threads: dict[int, list[str]] = {}
+        for uuid, workspace_id in db.session.execute(
+            select(ChatThread.uuid, ChatThread.workspace_id).order_by(ChatThread.id)
+        ):
+            threads.setdefault(workspace_id, []).append(str(uuid))
+        db.session.remove()
+    return users, threads
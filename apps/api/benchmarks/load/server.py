@@ -0,0 +1,33 @@
+"""
+The app under load, served by gunicorn:
+
+    gunicorn "load.server:create_bench_app()"
+
+It is the production app, pointed at the benchmark DB (`STEAGO_BENCH_DB_URI`),
+with the rate limits off, plus a `/bench/auth` route that only goes through
+authentication (JWT, identity lookup, status check).
+"""
+
+import os
+
+
+def create_bench_app():
+    from flask_jwt_extended import current_user
+
+    from modules.core.utils.config import CONFIG
+
+    CONFIG.DATABASE_PRIMARY_POSTGRES_URI = os.environ["STEAGO_BENCH_DB_URI"]
+    # Limits would throttle the load generator, not measure the app
+    CONFIG.FLASK_LIMITER_IS_ENABLED = False
+
+    from modules.core.utils.auth import auth_required
+    from steago import create_app
+
+    app = create_app()
+
+    @app.get("/bench/auth")
+    @auth_required()
+    def bench_auth():
+        return {"uuid": current_user.uuid, "workspace_id": current_user.workspace_id}
+
+    return app
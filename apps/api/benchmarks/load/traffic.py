@@ -0,0 +1,230 @@
+"""
+Closed-loop traffic against the app under load.
+
+Each of `concurrency` clients picks a scenario by weight, runs it, and starts
+the next one as soon as it is done. Clients pick their thread the way the
+seed spread the messages, so most traffic goes to the busiest threads.
+
+    auth      Authentication only (JWT, identity lookup, status check)
+    history   Latest page of a thread, then up to 2 older pages
+    search    Full-text search of the workspace
+    stream    Streamed assistant reply, persisted at the end (`stream` is
+              the full reply, `stream_ttfb` the first byte)
+"""
+
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+DEFAULT_MIX = {"auth": 20, "history": 45, "search": 20, "stream": 15}
+
+HISTORY_PAGE_SIZE = 50
+REQUEST_TIMEOUT = 120
+
+
+@dataclass
+class Targets:
+    # (uuid, workspace_id) of every user
+    users: list[tuple]
+    # Thread uuids of each workspace, oldest (and busiest) first
+    threads: dict[int, list[str]]
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    """
+    Parse `auth=20,history=45,...`.
+    """
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown scenario: {name}")
+        mix[name] = int(weight)
+    return mix
+
+
+def make_token(user_uuid: str, secret: str) -> str:
+    """
+    An access token, as `flask_jwt_extended.create_access_token` makes them.
+    """
+    import jwt
+
+    now = datetime.now(timezone.utc)
+    claims = {
+        "sub": user_uuid,
+        "type": "access",
+        "fresh": False,
+        "jti": str(uuid.uuid4()),
+        "iat": now,
+        "nbf": now,
+        "exp": now + timedelta(days=1),
+    }
+    return jwt.encode(claims, secret, algorithm="HS256")
+
+
+# =============================================================================
+# Scenarios
+# =============================================================================
+
+
+def _auth(client: "Client", thread_uuid: str) -> None:
+    client.request("auth", "GET", "/bench/auth")
+
+
+def _history(client: "Client", thread_uuid: str) -> None:
+    path = f"/chat/threads/{thread_uuid}/messages"
+    params = {"limit": HISTORY_PAGE_SIZE}
+    for _ in range(1 + client.rng.randint(0, 2)):
+        response = client.request("history", "GET", path, params=params)
+        if response is None:
+            return
+        page = response.json()
+        if not page.get("has_more") or not page.get("cursor"):
+            return
+        params = {"limit": HISTORY_PAGE_SIZE, "cursor": page["cursor"]}
+
+
+def _search(client: "Client", thread_uuid: str) -> None:
+    from .seed import WORDS
+
+    words = client.rng.sample(WORDS, client.rng.choice((1, 1, 2, 3)))
+    query = " ".join(words)
+    if len(words) > 1 and client.rng.random() < 0.2:
+        query = f'"{query}"'
+    params = {"q": query}
+    if client.rng.random() < 0.3:
+        params["sort"] = "recent"
+    client.request("search", "GET", "/chat/search", params=params)
+
+
+def _stream(client: "Client", thread_uuid: str) -> None:
+    path = f"/chat/threads/{thread_uuid}/reply/stream"
+    client.request("stream", "POST", path, json={"html": True}, stream=True)
+
+
+SCENARIOS: dict[str, Callable] = {
+    "auth": _auth,
+    "history": _history,
+    "search": _search,
+    "stream": _stream,
+}
+
+
+# =============================================================================
+# Clients
+# =============================================================================
+
+
+class Client:
+    """
+    One simulated user agent, recording into its own lists (no locking).
+    """
+
+    def __init__(self, base_url: str, targets: Targets, tokens: dict, seed: int) -> None:
+        import requests
+
+        self.base_url = base_url
+        self.targets = targets
+        self.tokens = tokens
+        self.rng = random.Random(seed)
+        self.session = requests.Session()
+        self.headers: dict = {}
+        # Only recorded after the warmup
+        self.recording = False
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    def record(self, name: str, seconds: float, ok: bool) -> None:
+        if not self.recording:
+            return
+        if ok:
+            self.latencies.setdefault(name, []).append(seconds)
+        else:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def request(self, name: str, method: str, path: str, stream: bool = False, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(
+                method,
+                self.base_url + path,
+                headers=self.headers,
+                timeout=REQUEST_TIMEOUT,
+                stream=stream,
+                **kwargs,
+            )
+            if stream and response.ok:
+                chunks = response.iter_content(chunk_size=None)
+                next(chunks, None)
+                self.record(f"{name}_ttfb", time.perf_counter() - started, True)
+                for _ in chunks:
+                    pass
+        except Exception:
+            self.record(name, time.perf_counter() - started, False)
+            return None
+        self.record(name, time.perf_counter() - started, response.ok)
+        return response if response.ok else None
+
+    def run_once(self, names: list[str], weights: list[int]) -> None:
+        name = self.rng.choices(names, weights)[0]
+        user_uuid, workspace_id = self.rng.choice(self.targets.users)
+        threads = self.targets.threads[workspace_id]
+        # Squared uniform, like the seed: the first threads are the busiest
+        thread_uuid = threads[int(len(threads) * self.rng.random() ** 2)]
+        self.headers = {"Authorization": f"Bearer {self.tokens[user_uuid]}"}
+        SCENARIOS[name](self, thread_uuid)
+
+
+def run_traffic(
+    base_url: str,
+    targets: Targets,
+    secret: str,
+    duration: float,
+    warmup: float,
+    concurrency: int,
+    mix: dict[str, int] = DEFAULT_MIX,
+) -> tuple[dict[str, list[float]], dict[str, int], float]:
+    """
+    Send traffic for `warmup` then `duration` seconds.
+
+    Returns:
+        tuple: Latencies (seconds) and error counts by request name, and the
+        measured duration
+    """
+    tokens = {user_uuid: make_token(user_uuid, secret) for user_uuid, _ in targets.users}
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+    clients = [Client(base_url, targets, tokens, seed) for seed in range(concurrency)]
+
+    started = time.monotonic()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def work(client: Client) -> None:
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                return
+            client.recording = now >= measure_from
+            client.run_once(names, weights)
+
+    threads = [threading.Thread(target=work, args=(client,), daemon=True) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    measured = time.monotonic() - measure_from
+
+    latencies: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    for client in clients:
+        for name, values in client.latencies.items():
+            latencies.setdefault(name, []).extend(values)
+        for name, count in client.errors.items():
+            errors[name] = errors.get(name, 0) + count
+    return latencies, errors, measured
@@ -0,0 +1,195 @@
+"""
+Load test of the API: throughput and p50/p99 latency of authentication,
+history paging, streamed replies and search, against a seeded Postgres and a
+fake LLM provider, compared with a stored baseline:
+
+    python benchmarks/load_test.py [--messages 2000000] [--duration 60]
+                                   [--concurrency 32] [--save-baseline]
+
+By default a throwaway Postgres cluster is created (`initdb` must be on the
+`PATH`, or in `PG_BIN`). Pass `--data-dir` to keep it, and its seeded data,
+for the next runs, or `--db-uri` to use an existing, empty database. The app
+runs under gunicorn like in production (`--workers`, `--worker-threads`).
+
+Exits with status 1 when a request regressed against the baseline
+(`benchmarks/load/baseline.json`, written by `--save-baseline`), and with
+status 2 before running anything when there is no baseline to compare with:
+baselines depend on the machine, record one locally first.
+"""
+
+import argparse
+import os
+import secrets
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, API_DIR)
+
+# Table names of the unified models, required by the app
+os.environ.setdefault("STEAGO_CORE_USER_MODEL_TABLE", "core_user")
+os.environ.setdefault("STEAGO_CORE_WORKSPACE_MODEL_TABLE", "core_workspace")
+
+from load.postgres import ThrowawayPostgres, find_free_port  # noqa: E402
+from load.report import (  # noqa: E402
+    compare_to_baseline,
+    format_summary,
+    load_baseline,
+    save_baseline,
+    summarize,
+)
+from load.seed import SeedSize, create_schema_app, is_seeded, load_targets, seed  # noqa: E402
+from load.traffic import DEFAULT_MIX, Targets, parse_mix, run_traffic  # noqa: E402
+from modules.ai.utils.fake_provider import FakeProvider  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "load", "baseline.json")
+SERVER_START_TIMEOUT = 120
+
+
+def start_server(args, db_uri: str, llm_url: str, jwt_secret: str) -> tuple:
+    port = find_free_port()
+    env = {
+        **os.environ,
+        "STEAGO_BENCH_DB_URI": db_uri,
+        "JWT_SECRET_KEY": jwt_secret,
+        "OPENAI_BASE_URL": llm_url,
+        "OPENAI_API_KEY": "bench",
+        # The Groq SDK adds `/openai/v1` itself
+        "GROQ_BASE_URL": llm_url.removesuffix("/v1"),
+        "GROQ_API_KEY": "bench",
+    }
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn",
+            "--workers", str(args.workers),
+            "--worker-class", "gthread",
+            "--threads", str(args.worker_threads),
+            "--bind", f"127.0.0.1:{port}",
+            "--pythonpath", f"{API_DIR},{BENCH_DIR}",
+            "--log-level", "warning",
+            # Like production: prompts are synced once, before forking
+            "--preload",
+            "load.server:create_bench_app()",
+        ],
+        cwd=API_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+
+    import requests
+
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError("The app failed to start, see the gunicorn logs above")
+        try:
+            if requests.get(f"{base_url}/ping", timeout=1).ok:
+                return process, base_url
+        except requests.ConnectionError:
+            pass
+        if time.monotonic() > deadline:
+            process.terminate()
+            raise RuntimeError("The app did not start in time")
+        time.sleep(0.5)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db-uri", help="Existing, empty database to use")
+    parser.add_argument("--data-dir", help="Keep the throwaway cluster in this directory")
+    parser.add_argument("--workspaces", type=int, default=SeedSize.workspaces)
+    parser.add_argument("--users", type=int, default=SeedSize.users, help="Per workspace")
+    parser.add_argument("--channels", type=int, default=SeedSize.channels, help="Per workspace")
+    parser.add_argument("--threads", type=int, default=SeedSize.threads, help="Per channel")
+    parser.add_argument("--messages", type=int, default=SeedSize.messages, help="In total")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds measured")
+    parser.add_argument("--warmup", type=float, default=10, help="Seconds before measuring")
+    parser.add_argument("--concurrency", type=int, default=32, help="Simulated clients")
+    parser.add_argument("--workers", type=int, default=4, help="Gunicorn workers")
+    parser.add_argument("--worker-threads", type=int, default=8, help="Threads per worker")
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="Scenario weights, e.g. auth=20,history=45,search=20,stream=15",
+    )
+    parser.add_argument("--llm-tokens", type=int, default=60, help="Tokens per fake provider reply")
+    parser.add_argument("--llm-token-delay", type=float, default=0.01)
+    parser.add_argument("--llm-first-token-delay", type=float, default=0.2)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="p50 and req/s")
+    parser.add_argument("--p99-tolerance", type=float, default=0.3)
+    args = parser.parse_args()
+
+    baseline = None
+    if not args.save_baseline:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            parser.error(f"no baseline at {args.baseline}, record one with --save-baseline")
+
+    size = SeedSize(args.workspaces, args.users, args.channels, args.threads, args.messages)
+    meta = {
+        **size.as_dict(),
+        "duration": args.duration,
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        "worker_threads": args.worker_threads,
+        "mix": args.mix,
+        "llm": [args.llm_tokens, args.llm_token_delay, args.llm_first_token_delay],
+    }
+
+    postgres = None if args.db_uri else ThrowawayPostgres(args.data_dir)
+    llm = FakeProvider(args.llm_tokens, args.llm_token_delay, args.llm_first_token_delay)
+    server = None
+    try:
+        db_uri = args.db_uri or postgres.start()
+        app = create_schema_app(db_uri)
+        if is_seeded(app):
+            print("Reusing the seeded data.")
+        else:
+            seed(app, size)
+        targets = Targets(*load_targets(app))
+
+        jwt_secret = secrets.token_hex(32)
+        server, base_url = start_server(args, db_uri, llm.start(), jwt_secret)
+        print(f"Sending traffic for {args.warmup:.0f} + {args.duration:.0f} s...")
+        latencies, errors, seconds = run_traffic(
+            base_url,
+            targets,
+            jwt_secret,
+            duration=args.duration,
+            warmup=args.warmup,
+            concurrency=args.concurrency,
+            mix=args.mix,
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        llm.stop()
+        if postgres is not None:
+            postgres.stop()
+
+    summary = summarize(latencies, errors, seconds, meta)
+    print(format_summary(summary))
+
+    if args.save_baseline:
+        save_baseline(args.baseline, summary)
+        print(f"Saved the baseline to {args.baseline}")
+        return 0
+
+    if baseline["meta"] != meta:
+        print("Warning: the baseline was run with other settings, compare with care")
+    regressions = compare_to_baseline(summary, baseline, args.tolerance, args.p99_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("No regression against the baseline.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
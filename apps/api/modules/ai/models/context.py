@@ -0,0 +1,119 @@
+from datetime import datetime
+
+from pytz import utc
+
+from ...core.db.primary import primary_db as db
+from ...core.utils.db import PrimaryDBUtils
+
+# =============================================================================
+
+
+class AIContextEntry(db.Model, PrimaryDBUtils):
+    """
+    Token accounting of a chat message, computed once per message.
+
+    `token_offset` is the prefix sum of the token counts of all the earlier
+    messages of the thread, so the tokens of the messages from `m` onwards are
+    `thread_total - m.token_offset`.
+    """
+
+    # Identity
+    # -------------------------------------------------------------------------
+    message_id: int = db.Column(
+        db.Integer,
+        db.ForeignKey("chat_message.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    # Relationships
+    # -------------------------------------------------------------------------
+    thread_id: int = db.Column(
+        db.Integer,
+        db.ForeignKey("chat_thread.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+
+    # Tokens
+    # -------------------------------------------------------------------------
+    token_count: int = db.Column(db.Integer, nullable=False)
+    token_offset: int = db.Column(db.BigInteger, nullable=False)
+
+    # Metadata
+    # -------------------------------------------------------------------------
+    # Copied from the message, so that entries keep the message order
+    created_ts: datetime = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    # Class meta and hierarchy mapping
+    # -------------------------------------------------------------------------
+    __tablename__ = "ai_context_entry"
+    __table_args__ = (
+        db.Index(
+            "ai_context_entry_thread_id_token_offset_idx", "thread_id", "token_offset"
+        ),
+    )
+
+    # -------------------------------------------------------------------------
+
+    def __init__(
+        self,
+        message_id: int,
+        thread_id: int,
+        token_count: int,
+        token_offset: int,
+        created_ts: datetime,
+    ) -> None:
+        self.message_id = message_id
+        self.thread_id = thread_id
+        self.token_count = token_count
+        self.token_offset = token_offset
+        self.created_ts = created_ts
+
+    # -------------------------------------------------------------------------
+
+
+# =============================================================================
+
+
+class AIThreadSummary(db.Model, PrimaryDBUtils):
+    """
+    Rolling summary of the older turns of a thread.
+
+    Covers every message with a `token_offset` below `covers_until_offset`.
+    """
+
+    # Identity
+    # -------------------------------------------------------------------------
+    thread_id: int = db.Column(
+        db.Integer,
+        db.ForeignKey("chat_thread.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    # Summary
+    # -------------------------------------------------------------------------
+    content: str = db.Column(db.Text, nullable=False)
+    token_count: int = db.Column(db.Integer, nullable=False)
+    covers_until_offset: int = db.Column(db.BigInteger, nullable=False)
+
+    # Metadata
+    # -------------------------------------------------------------------------
+    created_ts: datetime = db.Column(db.DateTime(timezone=True), nullable=False)
+    modified_ts: datetime = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    # Class meta and hierarchy mapping
+    # -------------------------------------------------------------------------
+    __tablename__ = "ai_thread_summary"
+
+    # -------------------------------------------------------------------------
+
+    def __init__(
+        self, thread_id: int, content: str, token_count: int, covers_until_offset: int
+    ) -> None:
+        self.thread_id = thread_id
+        self.content = content
+        self.token_count = token_count
+        self.covers_until_offset = covers_until_offset
+        self.created_ts = datetime.now(tz=utc)
+        self.modified_ts = self.created_ts
+
+    # -------------------------------------------------------------------------
@@ -0,0 +1,83 @@
+import os
+from datetime import datetime
+
+from pytz import utc
+
+from ...core.db.primary import primary_db as db
+from ...core.utils.db import PrimaryDBUtils
+
+# =============================================================================
+
+
+class AIMessageEmbedding(db.Model, PrimaryDBUtils):
+    """
+    Embedding of a chat message, for semantic retrieval.
+
+    `vector` holds the raw float32 (little endian) unit vector, loaded as is
+    into the in-memory index of the workspace.
+    """
+
+    # Identity
+    # -------------------------------------------------------------------------
+    message_id: int = db.Column(
+        db.Integer,
+        db.ForeignKey("chat_message.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    # Relationships
+    # -------------------------------------------------------------------------
+    thread_id: int = db.Column(
+        db.Integer,
+        db.ForeignKey("chat_thread.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    # Copied from the thread, the index of a workspace is loaded in one scan
+    workspace_id: int = db.Column(
+        db.Integer,
+        db.ForeignKey(f"{os.environ["STEAGO_CORE_WORKSPACE_MODEL_TABLE"]}.id"),
+        nullable=False,
+    )
+
+    # Embedding
+    # -------------------------------------------------------------------------
+    # Provider and model, e.g. "openai:text-embedding-3-small:256"
+    model: str = db.Column(db.String(128), nullable=False)
+    vector: bytes = db.Column(db.LargeBinary, nullable=False)
+
+    # Metadata
+    # -------------------------------------------------------------------------
+    created_ts: datetime = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    # Class meta and hierarchy mapping
+    # -------------------------------------------------------------------------
+    __tablename__ = "ai_message_embedding"
+    __table_args__ = (
+        db.Index(
+            "ai_message_embedding_workspace_id_model_message_id_idx",
+            "workspace_id",
+            "model",
+            "message_id",
+        ),
+        # Workers top up their indexes with the rows stored since a time
+        db.Index(
+            "ai_message_embedding_workspace_id_model_created_ts_idx",
+            "workspace_id",
+            "model",
+            "created_ts",
+        ),
+    )
+
+    # -------------------------------------------------------------------------
+
+    def __init__(
+        self, message_id: int, thread_id: int, workspace_id: int, model: str, vector: bytes
+    ) -> None:
+        self.message_id = message_id
+        self.thread_id = thread_id
+        self.workspace_id = workspace_id
+        self.model = model
+        self.vector = vector
+        self.created_ts = datetime.now(tz=utc)
+
+    # -------------------------------------------------------------------------
@@ -0,0 +1,249 @@
+"""
+Cache of deterministic LLM completions.
+
+Identical requests (same model, messages and params), such as title
+generation or `AIPrompt` driven summaries, are answered from:
+
+    1. A small in-process LRU (per worker)
+    2. The shared Flask-Caching backend
+
+Concurrent identical requests in a worker are collapsed into one provider
+call (single-flight). Workspaces can opt out with
+`is_completion_cache_enabled`, and cached replies can be replayed over the
+streaming path as if they were produced by the model.
+
+The opt-out flags are kept in the shared cache, and dropped whenever their
+workspace is written (`invalidate_completion_cache_flag`), so that every
+worker stops caching as soon as a workspace opts out.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Iterator, Optional
+
+from ...core.utils.cache import cache
+from ...core.utils.lru import CacheStats, LRUCache
+from ...core.utils.metrics import LLM_TOKENS, observe_llm_call
+from .providers import get_client_for_model, get_provider_name
+from .stream import iter_completion_deltas
+
+COMPLETION_CACHE_TIMEOUT = int(os.environ.get("STEAGO_COMPLETION_CACHE_TIMEOUT", 86400))
+COMPLETION_CACHE_LOCAL_TTL = float(os.environ.get("STEAGO_COMPLETION_CACHE_LOCAL_TTL", 300))
+COMPLETION_CACHE_LOCAL_SIZE = int(os.environ.get("STEAGO_COMPLETION_CACHE_LOCAL_SIZE", 512))
+
+# Size of the chunks a cached reply is replayed in over the streaming path
+REPLAY_CHUNK_SIZE = 32
+
+_local_cache = LRUCache(maxsize=COMPLETION_CACHE_LOCAL_SIZE, ttl=COMPLETION_CACHE_LOCAL_TTL)
+
+# Opt-out flags of workspaces are cached, so that checking them is not a
+# query per call
+WORKSPACE_FLAG_TIMEOUT = 3600
+
+# Single-flight: cache key -> future of the provider call in progress
+_inflight: dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+# Per-process hit / miss counters
+completion_cache_stats = CacheStats(
+    ("local_hits", "shared_hits", "misses", "coalesced", "bypassed")
+)
+
+
+# =============================================================================
+
+
+def completion_cache_key(model: str, messages: list[dict], params: dict) -> str:
+    """
+    Canonical hash of a completion request, independent of key order.
+    """
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return "ai:completion:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_completion_cache_enabled(workspace_id: Optional[int]) -> bool:
+    """
+    Check whether a workspace allows caching of its completions.
+    """
+    if workspace_id is None:
+        return True
+
+    cache_key = _workspace_flag_key(workspace_id)
+    enabled = cache.get(cache_key)
+    if enabled is None:
+        from ...core.db.primary import primary_db as db
+        from ...core.models.unified import get_unified_workspace
+
+        Workspace = get_unified_workspace()
+        column = getattr(Workspace, "is_completion_cache_enabled", None)
+        if column is None:
+            enabled = True
+        else:
+            enabled = bool(
+                db.session.query(column).filter(Workspace.id == workspace_id).scalar()
+            )
+        cache.set(cache_key, enabled, timeout=WORKSPACE_FLAG_TIMEOUT)
+    return enabled
+
+
+def invalidate_completion_cache_flag(workspace_id: int) -> None:
+    """
+    Drop the cached opt-out flag of a workspace. Call this after the
+    workspace is written.
+    """
+    cache.delete(_workspace_flag_key(workspace_id))
+
+
+def _workspace_flag_key(workspace_id: int) -> str:
+    return f"ai:completion-cache-enabled:{workspace_id}"
+
+
+def get_cached_completion(key: str) -> Optional[str]:
+    content = _local_cache.get(key)
+    if content is not None:
+        completion_cache_stats.incr("local_hits")
+        return content
+
+    content = cache.get(key)
+    if content is not None:
+        completion_cache_stats.incr("shared_hits")
+        _local_cache.set(key, content)
+        return content
+
+    completion_cache_stats.incr("misses")
+    return None
+
+
+def set_cached_completion(key: str, content: str) -> None:
+    _local_cache.set(key, content)
+    cache.set(key, content, timeout=COMPLETION_CACHE_TIMEOUT)
+
+
+# =============================================================================
+
+
+def _create_completion(model: str, messages: list[dict], **params: Any) -> str:
+    provider = get_provider_name(model)
+    started_at = time.perf_counter()
+    client = get_client_for_model(model)
+    try:
+        response = client.chat.completions.create(model=model, messages=messages, **params)
+    except Exception:
+        observe_llm_call(provider, model, "complete", started_at, "error")
+        raise
+    observe_llm_call(provider, model, "complete", started_at)
+
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        LLM_TOKENS.inc(provider, model, "prompt", amount=usage.prompt_tokens or 0)
+        LLM_TOKENS.inc(provider, model, "completion", amount=usage.completion_tokens or 0)
+    return response.choices[0].message.content
+
+
+def cached_completion(
+    model: str,
+    messages: list[dict],
+    workspace_id: Optional[int] = None,
+    **params: Any,
+) -> str:
+    """
+    Get a completion, from the cache when possible.
+
+    Only use this for deterministic requests (e.g. `temperature=0`), where any
+    earlier reply to the same request is as good as a new one. Empty replies
+    are not cached.
+
+    Returns:
+        string: The completion text
+    """
+    if not is_completion_cache_enabled(workspace_id):
+        completion_cache_stats.incr("bypassed")
+        return _create_completion(model, messages, **params)
+
+    key = completion_cache_key(model, messages, params)
+    content = get_cached_completion(key)
+    if content is not None:
+        return content
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = _inflight[key] = Future()
+
+    if not is_leader:
+        completion_cache_stats.incr("coalesced")
+        return future.result()
+
+    try:
+        content = _create_completion(model, messages, **params)
+        # An empty reply is a failure rather than an answer, keep asking
+        if content:
+            set_cached_completion(key, content)
+        future.set_result(content)
+        return content
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def replay_deltas(content: str, chunk_size: int = REPLAY_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Replay a complete reply as a stream of text deltas.
+    """
+    for i in range(0, len(content), chunk_size):
+        yield content[i : i + chunk_size]
+
+
+def cached_completion_deltas(
+    model: str,
+    messages: list[dict],
+    workspace_id: Optional[int] = None,
+    **params: Any,
+) -> Iterator[str]:
+    """
+    Streaming counterpart of `cached_completion`.
+
+    A cached reply is replayed; otherwise the provider stream is relayed and
+    the reply is cached once the stream completes (a cancelled stream, or an
+    empty reply, is never cached).
+
+    Returns:
+        Iterator[str]: The text deltas, in order
+    """
+    if not is_completion_cache_enabled(workspace_id):
+        completion_cache_stats.incr("bypassed")
+        yield from iter_completion_deltas(model, messages, **params)
+        return
+
+    key = completion_cache_key(model, messages, params)
+    content = get_cached_completion(key)
+    if content is not None:
+        yield from replay_deltas(content)
+        return
+
+    parts = []
+    deltas = iter_completion_deltas(model, messages, **params)
+    try:
+        for delta in deltas:
+            parts.append(delta)
+            yield delta
+    finally:
+        deltas.close()
+
+    content = "".join(parts)
+    if content:
+        set_cached_completion(key, content)
@@ -0,0 +1,308 @@
+"""
+Token budgeted prompt context for chat threads.
+
+Every message is tokenized once and its count stored in `AIContextEntry`
+along with the prefix sum of the earlier messages (`token_offset`). Picking
+the newest messages that fit a budget is then a single indexed range query,
+`token_offset >= thread_total - budget`, returning only the `k` messages that
+are used. Older turns that do not fit are replaced by the stored rolling
+summary of the thread (`AIThreadSummary`), when there is one.
+
+Editing or deleting a message drops the entries from that message on (and
+the summary covering it), so that the next sync counts them again. Syncs
+only look at the messages after the last entry, less `CONTEXT_SYNC_OVERLAP`:
+a message committed after newer ones were counted is picked up as long as it
+commits within that window, and the offsets are rebuilt from it.
+"""
+
+from datetime import timedelta
+from typing import NamedTuple, Optional
+
+from sqlalchemy import delete, event, func, inspect, select, tuple_
+
+from ...chat.models.message import ChatMessage
+from ...core.db.primary import primary_db as db
+from ...core.db.replica import RoutingSession
+from ..models.context import AIContextEntry, AIThreadSummary
+
+# Context window of each model, in tokens
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-3.5-turbo": 16385,
+    "llama3-70b-8192": 8192,
+    "llama3-8b-8192": 8192,
+    "mixtral-8x7b-32768": 32768,
+    "gemma2-9b-it": 8192,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+
+# Tokens kept free for the reply
+REPLY_RESERVED_TOKENS = 1024
+
+# Per message formatting overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Namespace of the advisory locks serializing token accounting per thread
+CONTEXT_LOCK_NAMESPACE = 5005
+
+# `created_ts` is the start of the writing transaction, so a message can
+# commit after newer ones were counted. Messages that recent are checked for
+# an entry again.
+CONTEXT_SYNC_OVERLAP = timedelta(seconds=30)
+
+# `tiktoken` is optional and only imported on the first count. `False` means it
+# is not installed and the estimate is used instead.
+_encoding = None
+
+
+# =============================================================================
+
+
+class ThreadContext(NamedTuple):
+    # Provider messages, oldest first
+    messages: list[dict]
+    # Prompt tokens of the messages (as counted by `count_tokens`)
+    token_count: int
+    # Whether older turns were left out without a summary covering them
+    summary_needed: bool = False
+
+
+# =============================================================================
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """
+    Count the tokens of a text, with `tiktoken` if it is installed, otherwise
+    with the usual ~4 characters per token estimate.
+    """
+    global _encoding
+    if not text:
+        return 0
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def get_context_budget(model: str) -> int:
+    return MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS) - REPLY_RESERVED_TOKENS
+
+
+# =============================================================================
+
+
+def _get_last_entry(thread_id: int) -> Optional[AIContextEntry]:
+    return (
+        AIContextEntry.query.filter_by(thread_id=thread_id)
+        .order_by(AIContextEntry.token_offset.desc())
+        .first()
+    )
+
+
+def _get_first_untracked_message(thread_id: int):
+    # Keyset from the last entry, so only the new messages (and the ones of
+    # the overlap) are read, whatever the length of the thread
+    query = (
+        db.session.query(ChatMessage.id, ChatMessage.created_ts)
+        .outerjoin(AIContextEntry, AIContextEntry.message_id == ChatMessage.id)
+        .filter(ChatMessage.thread_id == thread_id, AIContextEntry.message_id.is_(None))
+    )
+    last = _get_last_entry(thread_id)
+    if last is not None:
+        query = query.filter(ChatMessage.created_ts > last.created_ts - CONTEXT_SYNC_OVERLAP)
+    return query.order_by(ChatMessage.created_ts, ChatMessage.id).first()
+
+
+def _get_messages_from(thread_id: int, created_ts, message_id: int) -> list:
+    return (
+        db.session.query(ChatMessage.id, ChatMessage.created_ts, ChatMessage.content)
+        .filter(
+            ChatMessage.thread_id == thread_id,
+            tuple_(ChatMessage.created_ts, ChatMessage.id) >= tuple_(created_ts, message_id),
+        )
+        .order_by(ChatMessage.created_ts, ChatMessage.id)
+        .all()
+    )
+
+
+def sync_thread_tokens(thread_id: int) -> int:
+    """
+    Count the tokens of the messages of a thread that were not counted yet.
+
+    Only the messages from the first one without an entry are tokenized
+    (usually just the new ones), so this is cheap to call before every
+    context build.
+
+    Returns:
+        int: The total tokens of the thread
+    """
+    first = _get_first_untracked_message(thread_id)
+    if first is not None:
+        # Serialize concurrent syncs of the thread so offsets never overlap,
+        # and re-read under the lock (released on commit).
+        db.session.execute(
+            select(func.pg_advisory_xact_lock(CONTEXT_LOCK_NAMESPACE, thread_id))
+        )
+        first = _get_first_untracked_message(thread_id)
+
+    if first is None:
+        last = _get_last_entry(thread_id)
+        return last.token_offset + last.token_count if last is not None else 0
+
+    # The offsets of the entries after the first gap are off, count them again
+    db.session.execute(
+        delete(AIContextEntry).where(
+            AIContextEntry.thread_id == thread_id,
+            tuple_(AIContextEntry.created_ts, AIContextEntry.message_id)
+            > tuple_(first.created_ts, first.id),
+        )
+    )
+    last = _get_last_entry(thread_id)
+    total = last.token_offset + last.token_count if last is not None else 0
+
+    entries = []
+    for message_id, created_ts, content in _get_messages_from(thread_id, first.created_ts, first.id):
+        token_count = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        entries.append(
+            AIContextEntry(message_id, thread_id, token_count, total, created_ts)
+        )
+        total += token_count
+
+    db.session.add_all(entries)
+    db.session.commit()
+    return total
+
+
+def invalidate_thread_tokens(connection, thread_id: int, created_ts, message_id: int) -> None:
+    """
+    Drop the entries of a thread from a message on, and the summary covering
+    the message, so that the next sync counts them again.
+    """
+    # The entry of a deleted message is already gone, the next one is at its
+    # offset
+    offset = (
+        select(func.min(AIContextEntry.token_offset))
+        .where(
+            AIContextEntry.thread_id == thread_id,
+            tuple_(AIContextEntry.created_ts, AIContextEntry.message_id)
+            >= tuple_(created_ts, message_id),
+        )
+        .scalar_subquery()
+    )
+    connection.execute(
+        delete(AIThreadSummary).where(
+            AIThreadSummary.thread_id == thread_id,
+            AIThreadSummary.covers_until_offset > offset,
+        )
+    )
+    connection.execute(
+        delete(AIContextEntry).where(
+            AIContextEntry.thread_id == thread_id,
+            tuple_(AIContextEntry.created_ts, AIContextEntry.message_id)
+            >= tuple_(created_ts, message_id),
+        )
+    )
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _invalidate_changed_messages(session, _flush_context) -> None:
+    changed = [
+        message
+        for message in session.dirty
+        if isinstance(message, ChatMessage)
+        and inspect(message).attrs.content.history.has_changes()
+    ]
+    changed.extend(m for m in session.deleted if isinstance(m, ChatMessage))
+    if not changed:
+        return
+    connection = session.connection()
+    for message in changed:
+        invalidate_thread_tokens(
+            connection, message.thread_id, message.created_ts, message.id
+        )
+
+
+def save_thread_summary(thread_id: int, content: str, covers_until_offset: int) -> None:
+    """
+    Store the rolling summary of the messages below `covers_until_offset`.
+    """
+    summary = db.session.get(AIThreadSummary, thread_id)
+    token_count = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    if summary is None:
+        summary = AIThreadSummary(thread_id, content, token_count, covers_until_offset)
+    else:
+        summary.content = content
+        summary.token_count = token_count
+        summary.covers_until_offset = covers_until_offset
+    summary.persist()
+
+
+# =============================================================================
+
+
+def build_thread_context(
+    thread_id: int, model: str, system_prompt: Optional[str] = None
+) -> ThreadContext:
+    """
+    Build the provider messages of a thread that fit the context of `model`.
+
+    Returns:
+        ThreadContext: The system prompt, the summary of the older turns (if
+        they do not fit and a summary exists) and the newest messages, with
+        their token count
+    """
+    budget = get_context_budget(model)
+    messages = []
+    token_count = 0
+
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+        token_count = count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        budget -= token_count
+
+    total = sync_thread_tokens(thread_id)
+    start_offset = max(total - budget, 0)
+
+    summary_needed = False
+    if start_offset > 0:
+        summary = db.session.get(AIThreadSummary, thread_id)
+        if summary is not None and summary.token_count < budget:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation:\n{summary.content}",
+                }
+            )
+            token_count += summary.token_count
+            start_offset = max(
+                total - (budget - summary.token_count), summary.covers_until_offset
+            )
+        # Some of the older turns are neither summarized nor in the context
+        summary_needed = summary is None or summary.covers_until_offset < start_offset
+
+    rows = (
+        db.session.query(
+            ChatMessage.user_id, ChatMessage.content, AIContextEntry.token_count
+        )
+        .join(AIContextEntry, AIContextEntry.message_id == ChatMessage.id)
+        .filter(
+            AIContextEntry.thread_id == thread_id,
+            AIContextEntry.token_offset >= start_offset,
+        )
+        .order_by(AIContextEntry.token_offset)
+        .all()
+    )
+    for user_id, content, message_token_count in rows:
+        messages.append(
+            {"role": "assistant" if user_id is None else "user", "content": content}
+        )
+        token_count += message_token_count
+    return ThreadContext(messages, token_count, summary_needed)
@@ -0,0 +1,135 @@
+"""
+Text embedding providers.
+
+Every provider returns unit length float32 vectors of a fixed dimension. The
+provider is chosen with `STEAGO_EMBEDDING_PROVIDER`:
+
+    openai   OpenAI embeddings API (default)
+    local    Deterministic feature hashing embedder, no network. Meant for
+             offline development and tests, not for quality retrieval.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+EMBEDDING_PROVIDER = os.environ.get("STEAGO_EMBEDDING_PROVIDER", "openai")
+EMBEDDING_MODEL = os.environ.get("STEAGO_EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIM = int(os.environ.get("STEAGO_EMBEDDING_DIM", 256))
+
+# Texts per provider call
+EMBEDDING_BATCH_SIZE = 64
+# Longer texts are truncated (characters, roughly 2k tokens)
+EMBEDDING_MAX_CHARS = 8000
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class EmbeddingProvider:
+    # Stored with the vectors, vectors of different models are not comparable
+    name: str
+    dim: int
+
+    def embed(self, texts: list[str]):
+        """
+        Embed texts.
+
+        Returns:
+            np.ndarray: A `(len(texts), dim)` float32 array of unit vectors
+        """
+        raise NotImplementedError
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    def __init__(self, model: str = EMBEDDING_MODEL, dim: int = EMBEDDING_DIM) -> None:
+        self.name = f"openai:{model}:{dim}"
+        self.model = model
+        self.dim = dim
+
+    def embed(self, texts: list[str]):
+        import numpy as np
+
+        from ...core.utils.metrics import LLM_TOKENS, observe_llm_call
+        from .providers import get_provider_client
+        from .vector_index import normalize
+
+        client = get_provider_client("openai")
+        vectors = []
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            batch = texts[start : start + EMBEDDING_BATCH_SIZE]
+            started_at = time.perf_counter()
+            try:
+                response = client.embeddings.create(
+                    model=self.model,
+                    # Empty inputs are rejected by the API
+                    input=[text[:EMBEDDING_MAX_CHARS] or " " for text in batch],
+                    dimensions=self.dim,
+                )
+            except Exception:
+                observe_llm_call("openai", self.model, "embed", started_at, "error")
+                raise
+            observe_llm_call("openai", self.model, "embed", started_at)
+            if getattr(response, "usage", None) is not None:
+                LLM_TOKENS.inc("openai", self.model, "prompt", amount=response.usage.prompt_tokens)
+            vectors.extend(item.embedding for item in response.data)
+        return normalize(np.array(vectors, dtype=np.float32).reshape(-1, self.dim))
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    Hashes lowercased words and word bigrams into `dim` signed buckets. Texts
+    sharing words get similar vectors, and the same text always gets the same
+    vector, on any machine.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM) -> None:
+        self.name = f"local:hashing:{dim}"
+        self.dim = dim
+
+    def _features(self, text: str) -> list[str]:
+        words = _WORD_RE.findall(text[:EMBEDDING_MAX_CHARS].lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: list[str]):
+        import numpy as np
+
+        from .vector_index import normalize
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vectors[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        return normalize(vectors)
+
+
+# =============================================================================
+
+_provider: Optional[EmbeddingProvider] = None
+_provider_lock = threading.Lock()
+
+
+def create_embedding_provider(name: str) -> EmbeddingProvider:
+    if name == "openai":
+        return OpenAIEmbeddingProvider()
+    if name == "local":
+        return LocalEmbeddingProvider()
+    raise ValueError(f"Unknown embedding provider: {name}")
+
+
+def get_embedding_provider() -> EmbeddingProvider:
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = create_embedding_provider(EMBEDDING_PROVIDER)
+    return _provider
+
+
+def set_embedding_provider(provider: Optional[EmbeddingProvider]) -> None:
+    global _provider
+    _provider = provider
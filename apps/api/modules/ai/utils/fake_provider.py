@@ -0,0 +1,257 @@
+"""
+Fake LLM provider server, for tests and offline load tests.
+
+Serves the API shapes the app uses (OpenAI chat completions, streamed or not,
+embeddings, and Anthropic messages) with a canned reply at a fixed token rate,
+so the measured latency is the app's own plus a known, constant model time.
+Any path ending in `/chat/completions` is answered, so both the OpenAI and
+Groq SDKs can be pointed at it (`OPENAI_BASE_URL`, `GROQ_BASE_URL`), and the
+LLM gateway too (`STEAGO_LLM_<NAME>_BASE_URL`). Run it with:
+
+    python -m modules.ai.utils.fake_provider --port 9271 --first-token-delay 0.25
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = """## Summary
+
+Here is what the thread decided, in short:
+
+- The **release** goes out on Thursday, after the migration is reviewed.
+- Latency of the history endpoint stays under budget with the new index.
+- The dashboard gets a chart of the cache hit ratio.
+
+```python
+def rollout(percent):
+    # Ramp up slowly, and watch the alerts
+    return min(percent * 2, 100)
+```
+
+> Ping the owner of each action before the deadline.
+
+Let me know if anything is missing from the notes.
+"""
+
+
+def split_tokens(text: str, count: int) -> list[str]:
+    """
+    `count` tokens of the reply (repeated as needed), about a word each.
+    """
+    words = re.findall(r"\S+\s*", text)
+    tokens = []
+    while len(tokens) < count:
+        tokens.extend(words)
+    return tokens[:count]
+
+
+class FakeProvider:
+    def __init__(
+        self,
+        tokens: int = 60,
+        token_delay: float = 0.01,
+        first_token_delay: float = 0.2,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.tokens = split_tokens(REPLY, tokens)
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.host = host
+        self.port = port
+        self.requests_served = 0
+        self._server = None
+
+    def start(self) -> str:
+        """
+        Start serving in a background thread.
+
+        Returns:
+            str: The base URL to give the SDKs
+        """
+        stub = self
+
+        class Handler(_Handler):
+            pass
+
+        Handler.stub = stub
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        # Pick up the actual port when started with port 0
+        self.port = self._server.server_address[1]
+        threading.Thread(
+            target=self._server.serve_forever, name="fake-provider", daemon=True
+        ).start()
+        return self.base_url
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real providers
+    protocol_version = "HTTP/1.1"
+    stub: FakeProvider
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.endswith("/chat/completions"):
+            if body.get("stream"):
+                self._stream_completion(body)
+            else:
+                self._send_json(self._completion(body))
+        elif self.path.endswith("/messages"):
+            self._send_json(self._message(body))
+        elif self.path.endswith("/embeddings"):
+            self._send_json(self._embeddings(body))
+        else:
+            self._send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+        self.stub.requests_served += 1
+
+    # -------------------------------------------------------------------------
+
+    def _send_json(self, data: dict, status: int = 200) -> None:
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _prompt_tokens(self, body: dict) -> int:
+        # About 4 characters per token
+        return sum(len(str(m.get("content") or "")) for m in body.get("messages", [])) // 4
+
+    def _completion(self, body: dict) -> dict:
+        stub = self.stub
+        time.sleep(stub.first_token_delay + stub.token_delay * len(stub.tokens))
+        completion_tokens = len(stub.tokens)
+        prompt_tokens = self._prompt_tokens(body)
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(stub.tokens)},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _message(self, body: dict) -> dict:
+        # Anthropic style
+        stub = self.stub
+        time.sleep(stub.first_token_delay + stub.token_delay * len(stub.tokens))
+        return {
+            "id": "msg_bench",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": [{"type": "text", "text": "".join(stub.tokens)}],
+            "stop_reason": "end_turn",
+            "usage": {
+                "input_tokens": self._prompt_tokens(body),
+                "output_tokens": len(stub.tokens),
+            },
+        }
+
+    def _stream_completion(self, body: dict) -> None:
+        stub = self.stub
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(delta: dict, finish_reason=None) -> bytes:
+            chunk = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(chunk)}\n\n".encode()
+
+        try:
+            time.sleep(stub.first_token_delay)
+            self._write_chunk(event({"role": "assistant", "content": ""}))
+            for token in stub.tokens:
+                self._write_chunk(event({"content": token}))
+                time.sleep(stub.token_delay)
+            self._write_chunk(event({}, finish_reason="stop"))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # The app cancelled the completion
+            self.close_connection = True
+
+    def _embeddings(self, body: dict) -> dict:
+        inputs = body.get("input") or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dim = body.get("dimensions") or 256
+        data = []
+        for index, text in enumerate(inputs):
+            seed = sum(map(ord, text[:64])) or 1
+            data.append(
+                {
+                    "object": "embedding",
+                    "index": index,
+                    "embedding": [((seed * (i + 1)) % 97) / 97 - 0.5 for i in range(dim)],
+                }
+            )
+        tokens = sum(len(text) for text in inputs) // 4
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+
+# =============================================================================
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake LLM provider server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9271)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    args = parser.parse_args()
+
+    provider = FakeProvider(
+        args.tokens, args.token_delay, args.first_token_delay, args.host, args.port
+    )
+    print(f"--> Fake provider: listening on {provider.start()}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        provider.stop()
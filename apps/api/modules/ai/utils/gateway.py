@@ -0,0 +1,300 @@
+"""
+Async LLM gateway.
+
+Sends chat completions to several providers concurrently, e.g. when a
+multiplayer thread asks OpenAI, Groq and Claude at once.
+
+    - One long-lived event loop per worker process runs all provider calls,
+      so the keep-alive connection pool of each provider outlives a request.
+    - Each provider has its own concurrency limit (semaphore) and pool size.
+    - Every call has a deadline. Cancelling the awaiting coroutine (or hitting
+      the deadline) cancels the in-flight HTTP request.
+
+Flask runs `async def` views through `asgiref` (one short-lived loop per
+request). Awaiting the gateway from such a view hands the work over to the
+gateway loop, so connection pools are not tied to the request loop:
+
+    @api.post("/compare")
+    async def compare():
+        results = await gateway.fan_out(requests, timeout=30)
+
+Sync code can call `gateway.fan_out_sync(...)` instead.
+
+For offline load tests point every provider at the fake provider server
+(`python -m modules.ai.utils.fake_provider`) with `STEAGO_LLM_<NAME>_BASE_URL`
+(including its `/v1` path).
+"""
+
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import httpx
+
+from ...core.utils.log import logger
+from ...core.utils.metrics import LLM_REQUEST_SECONDS
+
+
+# =============================================================================
+
+
+@dataclass(frozen=True)
+class ProviderConfig:
+    name: str
+    base_url: str
+    api_key_env: str
+    # "openai" for OpenAI compatible chat completions, "anthropic" for Claude
+    api_format: str = "openai"
+    max_concurrency: int = 16
+    max_keepalive: int = 16
+
+
+def _provider(name: str, base_url: str, api_key_env: str, **kwargs) -> ProviderConfig:
+    env_prefix = f"STEAGO_LLM_{name.upper()}_"
+    return ProviderConfig(
+        name=name,
+        base_url=os.environ.get(env_prefix + "BASE_URL", base_url),
+        api_key_env=api_key_env,
+        max_concurrency=int(os.environ.get(env_prefix + "MAX_CONCURRENCY", 16)),
+        max_keepalive=int(os.environ.get(env_prefix + "MAX_KEEPALIVE", 16)),
+        **kwargs,
+    )
+
+
+PROVIDERS: dict[str, ProviderConfig] = {
+    provider.name: provider
+    for provider in (
+        _provider("openai", "https://api.openai.com/v1", "OPENAI_API_KEY"),
+        _provider("groq", "https://api.groq.com/openai/v1", "GROQ_API_KEY"),
+        _provider(
+            "anthropic",
+            "https://api.anthropic.com/v1",
+            "ANTHROPIC_API_KEY",
+            api_format="anthropic",
+        ),
+    )
+}
+
+
+@dataclass
+class CompletionRequest:
+    provider: str
+    model: str
+    messages: list[dict]
+    params: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class CompletionResult:
+    request: CompletionRequest
+    content: Optional[str] = None
+    # "timeout", "cancelled" or the error message
+    error: Optional[str] = None
+    latency: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+# =============================================================================
+
+
+class LLMGateway:
+    def __init__(self, providers: dict[str, ProviderConfig] = PROVIDERS) -> None:
+        self.providers = providers
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Only touched from the gateway loop
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    # Event loop
+    # -------------------------------------------------------------------------
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        # Started on first use, and again in a forked child, which does not
+        # inherit the thread running the parent's loop.
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._loop = asyncio.new_event_loop()
+                    self._clients = {}
+                    self._semaphores = {}
+                    self._thread = threading.Thread(
+                        target=self._loop.run_forever,
+                        name="llm-gateway",
+                        daemon=True,
+                    )
+                    self._thread.start()
+        return self._loop
+
+    def _submit(self, coro) -> asyncio.Future:
+        # Wrapping the concurrent future means that cancelling the caller also
+        # cancels the task running on the gateway loop.
+        future = asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+        return asyncio.wrap_future(future)
+
+    # Providers
+    # -------------------------------------------------------------------------
+
+    def _get_client(self, provider: ProviderConfig) -> httpx.AsyncClient:
+        client = self._clients.get(provider.name)
+        if client is None:
+            client = self._clients[provider.name] = httpx.AsyncClient(
+                base_url=provider.base_url,
+                limits=httpx.Limits(
+                    max_connections=provider.max_concurrency,
+                    max_keepalive_connections=provider.max_keepalive,
+                ),
+                timeout=None,  # Deadlines are enforced per call instead
+            )
+        return client
+
+    def _get_semaphore(self, provider: ProviderConfig) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(provider.name)
+        if semaphore is None:
+            semaphore = self._semaphores[provider.name] = asyncio.Semaphore(
+                provider.max_concurrency
+            )
+        return semaphore
+
+    async def _post(self, provider: ProviderConfig, request: CompletionRequest) -> str:
+        client = self._get_client(provider)
+        api_key = os.environ.get(provider.api_key_env, "")
+
+        if provider.api_format == "anthropic":
+            system = [m["content"] for m in request.messages if m["role"] == "system"]
+            payload = {
+                "model": request.model,
+                "messages": [m for m in request.messages if m["role"] != "system"],
+                "max_tokens": 1024,
+                **request.params,
+            }
+            if system:
+                payload["system"] = "\n\n".join(system)
+            response = await client.post(
+                "/messages",
+                json=payload,
+                headers={"x-api-key": api_key, "anthropic-version": "2023-06-01"},
+            )
+            response.raise_for_status()
+            return "".join(
+                block.get("text", "") for block in response.json()["content"]
+            )
+
+        response = await client.post(
+            "/chat/completions",
+            json={"model": request.model, "messages": request.messages, **request.params},
+            headers={"Authorization": f"Bearer {api_key}"} if api_key else None,
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    # Calls (run on the gateway loop)
+    # -------------------------------------------------------------------------
+
+    async def _complete(self, request: CompletionRequest, deadline: float) -> CompletionResult:
+        provider = None
+        result = CompletionResult(request=request)
+        started = time.monotonic()
+        try:
+            # Inside, so that an unknown provider fails this request only
+            provider = self.providers.get(request.provider)
+            if provider is None:
+                raise LookupError(f"Unknown provider: {request.provider}")
+            async with asyncio.timeout_at(deadline):
+                async with self._get_semaphore(provider):
+                    result.content = await self._post(provider, request)
+        except TimeoutError:
+            result.error = "timeout"
+        except asyncio.CancelledError:
+            result.error = "cancelled"
+            raise
+        except Exception as e:
+            logger.warning(f"LLM gateway: {request.provider} call failed: {e!r}")
+            result.error = str(e) or e.__class__.__name__
+        finally:
+            result.latency = time.monotonic() - started
+            # Not the error message itself, to bound the label values
+            outcome = result.error if result.error in ("timeout", "cancelled") else "error"
+            LLM_REQUEST_SECONDS.observe(
+                result.latency,
+                provider.name if provider is not None else "unknown",
+                request.model,
+                "gateway",
+                "ok" if result.error is None else outcome,
+            )
+        return result
+
+    async def _fan_out(
+        self, requests: list[CompletionRequest], timeout: float
+    ) -> list[CompletionResult]:
+        deadline = asyncio.get_running_loop().time() + timeout
+        return list(
+            await asyncio.gather(*(self._complete(r, deadline) for r in requests))
+        )
+
+    # Public API
+    # -------------------------------------------------------------------------
+
+    async def complete(self, request: CompletionRequest, timeout: float = 60) -> CompletionResult:
+        """
+        Send a single completion request, awaitable from any event loop.
+        """
+        results = await self.fan_out([request], timeout=timeout)
+        return results[0]
+
+    async def fan_out(
+        self, requests: list[CompletionRequest], timeout: float = 60
+    ) -> list[CompletionResult]:
+        """
+        Send completion requests concurrently, awaitable from any event loop.
+
+        Every request shares the same deadline (`timeout` seconds from now).
+        Failures and timeouts are reported per result instead of raising.
+
+        Returns:
+            list[CompletionResult]: One result per request, in order
+        """
+        return await self._submit(self._fan_out(requests, timeout))
+
+    def fan_out_sync(
+        self, requests: list[CompletionRequest], timeout: float = 60
+    ) -> list[CompletionResult]:
+        """
+        Blocking version of `fan_out` for sync views and scripts.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._fan_out(requests, timeout), self._get_loop()
+        )
+        try:
+            # A small grace period lets the loop report per-request timeouts
+            return future.result(timeout + 1)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def close(self) -> None:
+        """
+        Close the connection pools and stop the gateway loop.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return
+
+        async def _close():
+            for client in self._clients.values():
+                await client.aclose()
+
+        asyncio.run_coroutine_threadsafe(_close(), self._loop).result(10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(10)
+        self._thread = None
+
+
+# Shared, per-process gateway
+gateway = LLMGateway()
@@ -0,0 +1,144 @@
+"""
+Background jobs of the AI module: message embeddings and thread summaries.
+"""
+
+import os
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from ...chat.models.message import ChatMessage
+from ...core.db.primary import primary_db as db
+from ...core.utils.jobs import enqueue_job, job_handler
+from ..models.context import AIContextEntry, AIThreadSummary
+from ..models.embedding import AIMessageEmbedding
+from .completion_cache import cached_completion
+from .context import get_context_budget, save_thread_summary, sync_thread_tokens
+from .embeddings import get_embedding_provider
+from .prompt_registry import prompt_registry, register_prompt
+from .retrieval import backfill_embeddings
+
+# Delay before embedding new messages, so that the messages of a workspace
+# arriving meanwhile are embedded in the same batch
+EMBEDDING_JOB_DELAY = float(os.environ.get("STEAGO_EMBEDDING_JOB_DELAY", 2.0))
+
+SUMMARY_MODEL = os.environ.get("STEAGO_SUMMARY_MODEL", "gpt-4o-mini")
+# Tokens of conversation summarized per completion
+SUMMARY_CHUNK_TOKENS = 8000
+
+SUMMARY_PROMPT = register_prompt(
+    "ai.thread_summary",
+    "Summarize the conversation below for an assistant that will continue it. "
+    "Keep the facts, decisions, names and open questions; drop greetings and "
+    "repetition. Write at most a few short paragraphs.",
+)
+
+
+# =============================================================================
+# Embeddings
+# =============================================================================
+
+
+def enqueue_embeddings(workspace_id: int) -> None:
+    """
+    Embed the new messages of a workspace.
+    """
+    enqueue_job(
+        "ai.embed_messages",
+        {"workspace_id": workspace_id},
+        priority=-1,
+        idempotency_key=f"ai.embed_messages:{workspace_id}",
+        delay=EMBEDDING_JOB_DELAY,
+    )
+
+
+@job_handler("ai.embed_messages")
+def embed_workspace_messages(workspace_id: int) -> None:
+    """
+    Embed the messages newer than the last embedded one of the workspace.
+    Older messages left behind (e.g. after a provider change) are embedded by
+    `flask backfill-embeddings`.
+    """
+    last_id = db.session.scalar(
+        select(func.max(AIMessageEmbedding.message_id)).where(
+            AIMessageEmbedding.workspace_id == workspace_id,
+            AIMessageEmbedding.model == get_embedding_provider().name,
+        )
+    )
+    backfill_embeddings(workspace_id, after_message_id=last_id or 0)
+
+
+# =============================================================================
+# Summaries
+# =============================================================================
+
+
+def enqueue_thread_summary(thread_id: int, workspace_id: int, model: str) -> None:
+    enqueue_job(
+        "ai.summarize_thread",
+        {"thread_id": thread_id, "workspace_id": workspace_id, "model": model},
+        idempotency_key=f"ai.summarize_thread:{thread_id}",
+    )
+
+
+def _summarize(
+    summary: Optional[str], transcript: list[str], workspace_id: int
+) -> str:
+    content = "\n\n".join(transcript)
+    if summary:
+        content = f"Summary of the earlier conversation:\n{summary}\n\n{content}"
+    return cached_completion(
+        SUMMARY_MODEL,
+        [
+            {"role": "system", "content": prompt_registry.render(SUMMARY_PROMPT)},
+            {"role": "user", "content": content},
+        ],
+        workspace_id=workspace_id,
+        temperature=0,
+    )
+
+
+@job_handler("ai.summarize_thread")
+def summarize_thread(thread_id: int, workspace_id: int, model: str) -> None:
+    """
+    Extend the rolling summary of a thread over the turns that no longer fit
+    the context of `model`. Half the budget is left to the newest turns, so
+    the summary stays valid for a while.
+    """
+    total = sync_thread_tokens(thread_id)
+    until_offset = total - get_context_budget(model) // 2
+
+    summary = db.session.get(AIThreadSummary, thread_id)
+    content = summary.content if summary is not None else None
+    covered = start = summary.covers_until_offset if summary is not None else 0
+    db.session.rollback()
+
+    while covered < until_offset:
+        rows = db.session.execute(
+            select(
+                ChatMessage.user_id,
+                ChatMessage.content,
+                AIContextEntry.token_offset,
+                AIContextEntry.token_count,
+            )
+            .join(AIContextEntry, AIContextEntry.message_id == ChatMessage.id)
+            .where(
+                AIContextEntry.thread_id == thread_id,
+                AIContextEntry.token_offset >= covered,
+                AIContextEntry.token_offset < min(until_offset, covered + SUMMARY_CHUNK_TOKENS),
+            )
+            .order_by(AIContextEntry.token_offset)
+        ).all()
+        db.session.rollback()
+        if not rows:
+            break
+
+        transcript = [
+            f"{'Assistant' if user_id is None else 'User'}: {text}"
+            for user_id, text, _, _ in rows
+        ]
+        content = _summarize(content, transcript, workspace_id)
+        covered = rows[-1].token_offset + rows[-1].token_count
+
+    if covered > start:
+        save_thread_summary(thread_id, content, covered)
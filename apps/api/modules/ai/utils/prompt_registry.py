@@ -0,0 +1,273 @@
+"""
+In-memory registry of compiled prompt templates.
+
+Templates are parsed once into literal / field segments and kept in an
+immutable map keyed by `(name, version)`, so rendering a prompt on the hot
+path is a string join with no DB access. Reloading builds a new map and swaps
+it in one assignment; templates whose content hash did not change keep their
+compiled form.
+
+Templates use `str.format` fields, e.g. "Summarize {text} in {words} words".
+
+Prompts defined in code are declared with `register_prompt`; their text is
+the fallback until the DB has a version of them, and `sync_prompts` stores
+them as a new version when the DB has none with the same content:
+
+    TITLE_PROMPT = register_prompt("chat.thread_title", "Write a title...")
+    prompt_registry.render(TITLE_PROMPT)
+"""
+
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from string import Formatter
+from types import MappingProxyType
+from typing import Any, Iterable, Mapping, Optional
+
+from ...core.utils.cache import cache
+from ...core.utils.log import logger
+
+_formatter = Formatter()
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+# =============================================================================
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    name: str
+    version: int
+    content: str
+    content_hash: str
+    # (literal, field_name, format_spec, conversion) tuples, as parsed by
+    # `string.Formatter`
+    segments: tuple
+
+    @classmethod
+    def compile(cls, name: str, version: int, content: str) -> "PromptTemplate":
+        return cls(
+            name=name,
+            version=version,
+            content=content,
+            content_hash=content_hash(content),
+            segments=tuple(_formatter.parse(content)),
+        )
+
+    @property
+    def fields(self) -> set[str]:
+        return {field for _, field, _, _ in self.segments if field}
+
+    def render(self, /, **variables: Any) -> str:
+        parts = []
+        for literal, field, format_spec, conversion in self.segments:
+            parts.append(literal)
+            if field is None:
+                continue
+            value, _ = _formatter.get_field(field, (), variables)
+            if conversion:
+                value = _formatter.convert_field(value, conversion)
+            parts.append(format(value, format_spec) if format_spec else str(value))
+        return "".join(parts)
+
+
+# =============================================================================
+
+
+class PromptRegistry:
+    def __init__(self) -> None:
+        self._templates: Mapping[tuple[str, int], PromptTemplate] = MappingProxyType({})
+        self._latest: Mapping[str, PromptTemplate] = MappingProxyType({})
+        # Prompts defined in code, by name
+        self._defined: dict[str, PromptTemplate] = {}
+        self._lock = threading.Lock()
+
+    def define(self, name: str, content: str) -> None:
+        self._defined[name] = PromptTemplate.compile(name, 0, content)
+
+    @property
+    def defined(self) -> list[PromptTemplate]:
+        return list(self._defined.values())
+
+    def load(self, prompts: Iterable[tuple[str, int, str]]) -> int:
+        """
+        Replace the registry with `(name, version, content)` prompts.
+
+        Returns:
+            int: The number of templates that had to be (re)compiled
+        """
+        with self._lock:
+            current = self._templates
+            templates = {}
+            compiled = 0
+            for name, version, content in prompts:
+                template = current.get((name, version))
+                if template is None or template.content_hash != content_hash(content):
+                    template = PromptTemplate.compile(name, version, content)
+                    compiled += 1
+                templates[(name, version)] = template
+
+            latest = {}
+            for template in templates.values():
+                if template.name not in latest or template.version > latest[template.name].version:
+                    latest[template.name] = template
+
+            # Readers never take the lock, they see either map in full
+            self._latest = MappingProxyType(latest)
+            self._templates = MappingProxyType(templates)
+            return compiled
+
+    def get(self, name: str, version: Optional[int] = None) -> PromptTemplate:
+        """
+        Get a template, the latest version unless `version` is given. A
+        prompt defined in code and not loaded from the DB yet gets its
+        definition.
+
+        Raises:
+            KeyError: If there is no such prompt
+        """
+        if version is None:
+            template = self._latest.get(name) or self._defined.get(name)
+            if template is None:
+                raise KeyError(name)
+            return template
+        return self._templates[(name, version)]
+
+    def render(self, name: str, version: Optional[int] = None, /, **variables: Any) -> str:
+        # Positional only, so that prompts can use `name` / `version` fields
+        return self.get(name, version).render(**variables)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._latest or name in self._defined
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+
+prompt_registry = PromptRegistry()
+
+
+def register_prompt(name: str, content: str) -> str:
+    """
+    Define a prompt in code.
+
+    Returns:
+        string: The name, to render the prompt with
+    """
+    prompt_registry.define(name, content)
+    return name
+
+
+# =============================================================================
+
+
+# Prompt sources and DB rows as of the last reconcile
+PROMPT_SYNC_STATE_KEY = "ai:prompts:sync-state"
+
+
+def get_prompt_sources_digest() -> str:
+    """
+    Hash of the prompt definitions shipped with the code (the prompt module
+    and the files of a `prompts` directory next to it, if any).
+    """
+    from . import prompt as prompt_module
+
+    paths = [prompt_module.__file__]
+    prompts_dir = os.path.join(os.path.dirname(prompt_module.__file__), "prompts")
+    if os.path.isdir(prompts_dir):
+        for root, _, files in os.walk(prompts_dir):
+            paths.extend(os.path.join(root, f) for f in files)
+
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def get_rows_digest(rows: Iterable[tuple[str, int, str]]) -> str:
+    digest = hashlib.sha256()
+    for name, version, content in sorted(rows, key=lambda row: (row[0], row[1])):
+        digest.update(f"{name}\0{version}\0{content_hash(content)}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _select_prompts() -> list[tuple[str, int, str]]:
+    from ..models.prompt import AIPrompt
+    from ...core.db.primary import primary_db as db
+
+    return [
+        tuple(row)
+        for row in db.session.query(AIPrompt.name, AIPrompt.version, AIPrompt.content)
+    ]
+
+
+def _store_defined_prompts(rows: list[tuple[str, int, str]]) -> int:
+    """
+    Store the prompts defined in code that have no version with the same
+    content in `rows`, as a new version.
+
+    Returns:
+        int: The number of prompts stored
+    """
+    from ..models.prompt import AIPrompt
+    from ...core.db.primary import primary_db as db
+
+    stored = {(name, content_hash(content)) for name, _, content in rows}
+    versions: dict[str, int] = {}
+    for name, version, _ in rows:
+        versions[name] = max(version, versions.get(name, 0))
+
+    missing = [
+        template
+        for template in prompt_registry.defined
+        if (template.name, template.content_hash) not in stored
+    ]
+    for template in missing:
+        db.session.add(
+            AIPrompt(
+                name=template.name,
+                version=versions.get(template.name, 0) + 1,
+                content=template.content,
+            )
+        )
+    return len(missing)
+
+
+def sync_prompts(debug: bool = False) -> None:
+    """
+    Reconcile the prompts with the DB, then (re)load the in-memory registry.
+
+    The prompt rows are read once and compared with the prompts defined in
+    code, and with the state recorded by the last reconcile: nothing is
+    written unless a definition changed, or the rows did (e.g. a restored
+    DB).
+
+    Needs an app context.
+    """
+    from ...core.db.primary import primary_db as db
+    from .prompt import load_all_prompts
+
+    rows = _select_prompts()
+    defined = {(t.name, t.content_hash) for t in prompt_registry.defined}
+    stored = {(name, content_hash(content)) for name, _, content in rows}
+    state = [get_prompt_sources_digest(), get_rows_digest(rows)]
+
+    if not defined <= stored or cache.get(PROMPT_SYNC_STATE_KEY) != state:
+        load_all_prompts(debug=debug)
+        rows = _select_prompts()
+        created = _store_defined_prompts(rows)
+        db.session.commit()
+        if created:
+            rows = _select_prompts()
+        cache.set(PROMPT_SYNC_STATE_KEY, [state[0], get_rows_digest(rows)], timeout=0)
+    elif debug:
+        logger.info("Prompts unchanged since the last sync, skipping reconcile.")
+
+    compiled = prompt_registry.load(rows)
+    if debug:
+        logger.info(f"Prompt registry: {len(prompt_registry)} prompts, {compiled} compiled.")
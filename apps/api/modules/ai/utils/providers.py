@@ -0,0 +1,68 @@
+"""
+LLM provider clients.
+
+Provider SDKs are imported and instantiated lazily, on the first call that
+needs them, and then reused for the lifetime of the worker process so that
+their HTTP connection pools are shared across requests.
+"""
+
+import threading
+from typing import Any
+
+# Model name prefix -> provider. The first matching prefix wins.
+MODEL_PROVIDER_PREFIXES = (
+    ("gpt-", "openai"),
+    ("o1", "openai"),
+    ("llama", "groq"),
+    ("mixtral", "groq"),
+    ("gemma", "groq"),
+)
+
+DEFAULT_PROVIDER = "openai"
+
+_clients: dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def get_provider_name(model: str) -> str:
+    """
+    Get the provider serving a model.
+
+    Returns:
+        string: The provider name, e.g. "openai" or "groq"
+    """
+    for prefix, provider in MODEL_PROVIDER_PREFIXES:
+        if model.startswith(prefix):
+            return provider
+    return DEFAULT_PROVIDER
+
+
+def _create_client(provider: str) -> Any:
+    # API keys are read from the environment by the SDKs themselves
+    # (`OPENAI_API_KEY`, `GROQ_API_KEY`).
+    if provider == "openai":
+        from openai import OpenAI
+
+        return OpenAI()
+    if provider == "groq":
+        from groq import Groq
+
+        return Groq()
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+def get_provider_client(provider: str) -> Any:
+    """
+    Get the shared (per-process) client of a provider.
+    """
+    client = _clients.get(provider)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(provider)
+            if client is None:
+                client = _clients[provider] = _create_client(provider)
+    return client
+
+
+def get_client_for_model(model: str) -> Any:
+    return get_provider_client(get_provider_name(model))
@@ -0,0 +1,284 @@
+"""
+Semantic retrieval over the messages of a workspace.
+
+New messages are embedded by background jobs (`ai.embed_messages`, batched
+per workspace) and stored in `ai_message_embedding`. Each worker keeps an
+in-memory IVF index per recently used workspace, loaded from that table in one
+scan and topped up with the rows stored since, by `created_ts`.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from ...chat.models.message import ChatMessage
+from ...chat.models.thread import ChatThread
+from ...core.db.primary import primary_db as db
+from ...core.utils.db import commit
+from ...core.utils.lru import LRUCache
+from ..models.embedding import AIMessageEmbedding
+from .embeddings import get_embedding_provider
+
+# Workspace indexes kept in memory, and how long before one is fully reloaded
+EMBEDDING_INDEX_CACHE_SIZE = int(os.environ.get("STEAGO_EMBEDDING_INDEX_CACHE_SIZE", 32))
+EMBEDDING_INDEX_TTL = float(os.environ.get("STEAGO_EMBEDDING_INDEX_TTL", 600))
+# Minimum time between two checks for newly embedded messages (seconds)
+EMBEDDING_INDEX_REFRESH_INTERVAL = 5.0
+# `created_ts` is the start of the inserting transaction, so rows can commit
+# out of order: rows that recent are read again (and skipped if loaded)
+EMBEDDING_INDEX_REFRESH_OVERLAP = timedelta(seconds=30)
+
+EMBEDDING_BACKFILL_BATCH_SIZE = 256
+
+# Messages scored per related thread, to find the best one of each thread
+RELATED_THREAD_FANOUT = 8
+
+
+# =============================================================================
+# Embedding
+# =============================================================================
+
+
+def embed_messages(message_ids: list[int]) -> int:
+    """
+    Embed and store messages (already embedded ones are skipped).
+
+    Returns:
+        int: The number of messages embedded
+    """
+    provider = get_embedding_provider()
+    rows = db.session.execute(
+        select(
+            ChatMessage.id,
+            ChatMessage.thread_id,
+            ChatThread.workspace_id,
+            ChatMessage.content,
+        )
+        .join(ChatThread, ChatThread.id == ChatMessage.thread_id)
+        .outerjoin(AIMessageEmbedding, AIMessageEmbedding.message_id == ChatMessage.id)
+        .where(
+            ChatMessage.id.in_(message_ids),
+            ChatMessage.content.is_not(None),
+            AIMessageEmbedding.message_id.is_(None),
+        )
+        .order_by(ChatMessage.id)
+    ).all()
+    if not rows:
+        return 0
+
+    vectors = provider.embed([row.content for row in rows])
+    db.session.execute(
+        insert(AIMessageEmbedding)
+        .values(
+            [
+                {
+                    "message_id": row.id,
+                    "thread_id": row.thread_id,
+                    "workspace_id": row.workspace_id,
+                    "model": provider.name,
+                    "vector": vector.astype("<f4").tobytes(),
+                    "created_ts": func.now(),
+                }
+                for row, vector in zip(rows, vectors)
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=[AIMessageEmbedding.message_id])
+    )
+    commit()
+    return len(rows)
+
+
+def backfill_embeddings(
+    workspace_id: Optional[int] = None,
+    batch_size: int = EMBEDDING_BACKFILL_BATCH_SIZE,
+    after_message_id: int = 0,
+) -> int:
+    """
+    Embed every message (after `after_message_id`) that has no embedding yet,
+    oldest first.
+
+    Returns:
+        int: The number of messages embedded
+    """
+    count = 0
+    last_id = after_message_id
+    while True:
+        query = (
+            select(ChatMessage.id)
+            .outerjoin(AIMessageEmbedding, AIMessageEmbedding.message_id == ChatMessage.id)
+            .where(AIMessageEmbedding.message_id.is_(None), ChatMessage.id > last_id)
+            .order_by(ChatMessage.id)
+            .limit(batch_size)
+        )
+        if workspace_id is not None:
+            query = query.join(ChatThread, ChatThread.id == ChatMessage.thread_id).where(
+                ChatThread.workspace_id == workspace_id
+            )
+        message_ids = db.session.scalars(query).all()
+        if not message_ids:
+            return count
+        count += embed_messages(message_ids)
+        last_id = message_ids[-1]
+
+
+# =============================================================================
+# Workspace indexes
+# =============================================================================
+
+
+class WorkspaceIndex:
+    def __init__(self, workspace_id: int, model: str, dim: int) -> None:
+        from .vector_index import IVFIndex, VectorStore
+
+        self.workspace_id = workspace_id
+        self.model = model
+        self.index = IVFIndex(VectorStore(dim))
+        # Highest `created_ts` loaded, and the messages loaded within the
+        # overlap before it
+        self.last_created_ts: Optional[datetime] = None
+        self._recent: dict[int, datetime] = {}
+        self.refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """
+        Load the embeddings stored since the last refresh, including those of
+        older messages (e.g. backfilled).
+        """
+        import numpy as np
+
+        with self._lock:
+            query = (
+                select(
+                    AIMessageEmbedding.message_id,
+                    AIMessageEmbedding.thread_id,
+                    AIMessageEmbedding.vector,
+                    AIMessageEmbedding.created_ts,
+                )
+                .where(
+                    AIMessageEmbedding.workspace_id == self.workspace_id,
+                    AIMessageEmbedding.model == self.model,
+                )
+                .order_by(AIMessageEmbedding.created_ts)
+            )
+            if self.last_created_ts is not None:
+                query = query.where(
+                    AIMessageEmbedding.created_ts
+                    > self.last_created_ts - EMBEDDING_INDEX_REFRESH_OVERLAP
+                )
+            rows = [row for row in db.session.execute(query) if row[0] not in self._recent]
+            self.refreshed_at = time.monotonic()
+            if not rows:
+                return
+
+            message_ids, thread_ids, vectors, created_ts = zip(*rows)
+            self.index.add(
+                np.array(message_ids, dtype=np.int64),
+                np.frombuffer(b"".join(vectors), dtype="<f4").reshape(len(rows), -1),
+                np.array(thread_ids, dtype=np.int64),
+            )
+
+            if self.last_created_ts is None or created_ts[-1] > self.last_created_ts:
+                self.last_created_ts = created_ts[-1]
+            since = self.last_created_ts - EMBEDDING_INDEX_REFRESH_OVERLAP
+            self._recent.update(zip(message_ids, created_ts))
+            self._recent = {
+                message_id: ts for message_id, ts in self._recent.items() if ts > since
+            }
+
+
+_workspace_indexes = LRUCache(maxsize=EMBEDDING_INDEX_CACHE_SIZE, ttl=EMBEDDING_INDEX_TTL)
+
+
+def get_workspace_index(workspace_id: int) -> WorkspaceIndex:
+    provider = get_embedding_provider()
+    index = _workspace_indexes.get(workspace_id)
+    if index is None or index.model != provider.name:
+        index = WorkspaceIndex(workspace_id, provider.name, provider.dim)
+        _workspace_indexes.set(workspace_id, index)
+    if time.monotonic() - index.refreshed_at >= EMBEDDING_INDEX_REFRESH_INTERVAL:
+        index.refresh()
+    return index
+
+
+# =============================================================================
+# Retrieval
+# =============================================================================
+
+
+def search_workspace(
+    workspace_id: int, text: str, k: int = 10, exclude_thread_id: Optional[int] = None
+) -> list[tuple[int, int, float]]:
+    """
+    Find the messages of a workspace closest in meaning to a text.
+
+    Returns:
+        list[tuple[int, int, float]]: `(message_id, thread_id, score)`, best
+        first
+    """
+    query = get_embedding_provider().embed([text])[0]
+    result = get_workspace_index(workspace_id).index.search(
+        query, k, exclude_group=exclude_thread_id
+    )
+    return list(zip(result.ids.tolist(), result.groups.tolist(), result.scores.tolist()))
+
+
+def _best_per_thread(result, k: int) -> list[tuple[int, float]]:
+    threads: dict[int, float] = {}
+    for thread_id, score in zip(result.groups.tolist(), result.scores.tolist()):
+        if thread_id not in threads:
+            threads[thread_id] = score
+            if len(threads) == k:
+                break
+    return list(threads.items())
+
+
+def find_related_threads(
+    workspace_id: int, thread_id: Optional[int] = None, text: Optional[str] = None, k: int = 5
+) -> list[tuple[int, float]]:
+    """
+    Find the threads of a workspace related to a thread (the mean of its
+    message vectors) or to a text.
+
+    Returns:
+        list[tuple[int, float]]: `(thread_id, score)`, best first
+    """
+    from .vector_index import normalize
+
+    index = get_workspace_index(workspace_id).index
+    if text is not None:
+        query = get_embedding_provider().embed([text])[0]
+    else:
+        vectors = index.store.vectors
+        members = vectors[index.store.groups[: len(vectors)] == thread_id]
+        if not len(members):
+            return []
+        query = normalize(members.mean(axis=0))
+
+    result = index.search(query, k * RELATED_THREAD_FANOUT, exclude_group=thread_id)
+    return _best_per_thread(result, k)
+
+
+def retrieve_context(
+    workspace_id: int, text: str, k: int = 5, exclude_thread_id: Optional[int] = None
+) -> list[str]:
+    """
+    Get the contents of the messages most relevant to a text, e.g. to add
+    them to the prompt of a reply (retrieval-augmented generation).
+    """
+    matches = search_workspace(workspace_id, text, k, exclude_thread_id)
+    if not matches:
+        return []
+    contents = dict(
+        db.session.execute(
+            select(ChatMessage.id, ChatMessage.content).where(
+                ChatMessage.id.in_([message_id for message_id, _, _ in matches])
+            )
+        ).all()
+    )
+    return [contents[message_id] for message_id, _, _ in matches if contents.get(message_id)]
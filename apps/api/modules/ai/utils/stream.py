@@ -0,0 +1,231 @@
+"""
+Streaming chat completions.
+
+Provider token deltas are relayed to the client as Server-Sent Events while the
+model produces them. The full reply is only assembled once, at the end of the
+stream, and handed to an `on_complete` callback to be persisted.
+"""
+
+import contextvars
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional
+
+from ...core.utils.log import logger
+from ...core.utils.metrics import LLM_FIRST_TOKEN_SECONDS, LLM_TOKENS, observe_llm_call
+from ...core.utils.sse import format_sse, format_sse_comment
+from .providers import get_client_for_model, get_provider_name
+
+# Deltas arriving within this window (seconds) are coalesced into one SSE
+# frame. The first delta is always sent right away, and none waits longer.
+STREAM_FLUSH_INTERVAL = 0.03
+
+# Deltas read ahead of the client. Once that many are waiting, the reader
+# stops reading from the provider until the client catches up.
+STREAM_READ_AHEAD = 256
+# A client that reads nothing for this long (seconds) while the read-ahead is
+# full is given up on: the provider stream is closed and the thread exits.
+STREAM_STALL_TIMEOUT = 30.0
+# How often (seconds) a blocked reader, or a waiting relay, checks on the other
+_POLL_INTERVAL = 0.5
+
+# Ends the queue of a reader thread
+_END = object()
+
+
+def iter_completion_deltas(
+    model: str, messages: list[dict], **params: Any
+) -> Iterator[str]:
+    """
+    Stream a chat completion from the provider serving `model`.
+
+    The request is only sent once the generator is first iterated. Closing the
+    generator closes the underlying HTTP response, which cancels the
+    completion on the provider side.
+
+    Returns:
+        Iterator[str]: The text deltas, in order
+    """
+    provider = get_provider_name(model)
+    started_at = time.perf_counter()
+    outcome = "error"
+    chunks = 0
+
+    client = get_client_for_model(model)
+    stream = client.chat.completions.create(
+        model=model, messages=messages, stream=True, **params
+    )
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not chunks:
+                    LLM_FIRST_TOKEN_SECONDS.observe(
+                        time.perf_counter() - started_at, provider, model
+                    )
+                chunks += 1
+                yield delta
+        outcome = "ok"
+    except GeneratorExit:
+        outcome = "cancelled"
+        raise
+    finally:
+        stream.close()
+        observe_llm_call(provider, model, "stream", started_at, outcome)
+        # Providers send about one token per chunk
+        LLM_TOKENS.inc(provider, model, "completion", amount=chunks)
+
+
+def _read_ahead(
+    deltas: Iterator[str], stop: threading.Event
+) -> tuple[queue.Queue, threading.Thread]:
+    """
+    Read `deltas` on a thread, so that waiting for the next one can time out.
+
+    The queue gets the deltas, then `_END` (or the exception raised). It holds
+    at most `STREAM_READ_AHEAD` deltas, so a slow client slows down the
+    provider rather than buffering the reply. The thread gives up, closing
+    `deltas` without ending the queue, once `stop` is set or after
+    `STREAM_STALL_TIMEOUT` without room in the queue. A generator cannot be
+    closed while another thread runs it, so a set `stop` is only noticed when
+    the next delta arrives.
+
+    Returns:
+        tuple: The queue of deltas, in order, and the reader thread
+    """
+    items: queue.Queue = queue.Queue(maxsize=STREAM_READ_AHEAD)
+
+    def put(item) -> bool:
+        deadline = time.monotonic() + STREAM_STALL_TIMEOUT
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                if time.monotonic() >= deadline:
+                    logger.warning("Client stopped reading, closing completion stream.")
+                    return False
+        return False
+
+    def run() -> None:
+        try:
+            for delta in deltas:
+                if not put(delta):
+                    return
+            put(_END)
+        except Exception as e:
+            put(e)
+        finally:
+            deltas.close()
+
+    # The app context (and the request's) of the caller
+    context = contextvars.copy_context()
+    reader = threading.Thread(
+        target=context.run, args=(run,), name="completion-stream", daemon=True
+    )
+    reader.start()
+    return items, reader
+
+
+def relay_completion(
+    deltas: Iterator[str],
+    on_complete: Callable[[str], Optional[dict]],
+    flush_interval: float = STREAM_FLUSH_INTERVAL,
+    on_flush: Optional[Callable[[str], dict]] = None,
+    on_abort: Optional[Callable[[str], Any]] = None,
+) -> Iterator[str]:
+    """
+    Relay text deltas as SSE frames.
+
+    Emits `delta` events with `{"delta": "..."}` (plus the fields returned by
+    `on_flush(delta)`, if given), at most `flush_interval` after the deltas
+    they carry arrived, then a single `done` event carrying whatever
+    `on_complete(full_text)` returns. On provider errors a single `error`
+    event is sent instead. If the client disconnects, the upstream stream is
+    closed and `on_complete` is never called.
+
+    In both cases, unless `on_complete` was already called,
+    `on_abort(partial_text)` is called with the text received so far, e.g.
+    to charge the tokens the provider already produced.
+
+    Returns:
+        Iterator[str]: Formatted SSE frames
+    """
+    parts: list[str] = []
+    pending: list[str] = []
+    last_flush = 0.0
+    completed = False
+    stop = threading.Event()
+
+    def delta_frame() -> str:
+        data = {"delta": "".join(pending)}
+        if on_flush is not None:
+            data.update(on_flush(data["delta"]))
+        pending.clear()
+        return format_sse(data, event="delta")
+
+    try:
+        # The provider is called on the reader thread, while this first frame
+        # gets the headers to the client
+        items, reader = _read_ahead(deltas, stop)
+        yield format_sse_comment("stream-open")
+
+        while True:
+            timeout = _POLL_INTERVAL
+            if pending:
+                timeout = max(0.0, last_flush + flush_interval - time.monotonic())
+            try:
+                item = items.get(timeout=timeout)
+            except queue.Empty:
+                if pending:
+                    # No delta for a while, send the ones held back
+                    yield delta_frame()
+                    last_flush = time.monotonic()
+                elif not reader.is_alive() and items.empty():
+                    raise TimeoutError("The reader gave up on a stalled client")
+                continue
+
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            parts.append(item)
+            pending.append(item)
+
+            now = time.monotonic()
+            if now - last_flush >= flush_interval:
+                yield delta_frame()
+                last_flush = now
+
+        if pending:
+            yield delta_frame()
+
+        completed = True
+        result = on_complete("".join(parts))
+        yield format_sse(result or {}, event="done")
+
+    except GeneratorExit:
+        logger.info("Client disconnected, cancelling completion stream.")
+        stop.set()
+        if not completed:
+            _abort(on_abort, parts)
+        raise
+
+    except Exception:
+        logger.exception("Completion stream failed.")
+        stop.set()
+        if not completed:
+            _abort(on_abort, parts)
+        yield format_sse({"error": "completion-failed"}, event="error")
+
+
+def _abort(on_abort: Optional[Callable[[str], Any]], parts: list[str]) -> None:
+    if on_abort is None:
+        return
+    try:
+        on_abort("".join(parts))
+    except Exception:
+        logger.exception("Completion stream abort callback failed.")
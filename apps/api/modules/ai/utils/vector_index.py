@@ -0,0 +1,251 @@
+"""
+In-memory vector store and approximate nearest neighbour (IVF) index.
+
+Vectors are unit length float32, so the inner product is the cosine
+similarity. All the scoring is vectorized NumPy over contiguous arrays.
+
+Searches take no lock: writers publish the arrays they read (the rows of the
+store, the trained lists) as immutable tuples, swapped in one assignment.
+"""
+
+import threading
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+# Below this size searches are exact (brute force is faster than probing)
+IVF_MIN_SIZE = 4096
+# Lists probed per query
+IVF_NPROBE = 8
+# K-means iterations when (re)training the coarse quantizer
+IVF_TRAIN_ITERATIONS = 10
+# Training sample size, per list
+IVF_TRAIN_SAMPLES_PER_LIST = 64
+
+
+class SearchResult(NamedTuple):
+    ids: np.ndarray
+    groups: np.ndarray
+    scores: np.ndarray
+
+
+class StoreRows(NamedTuple):
+    vectors: np.ndarray
+    ids: np.ndarray
+    groups: np.ndarray
+
+
+class TrainedLists(NamedTuple):
+    centroids: np.ndarray
+    # Row numbers sorted by list, and the start of each list in it
+    rows: np.ndarray
+    offsets: np.ndarray
+    # Rows of the store when trained, the later ones are in no list
+    size: int
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the `k` highest scores, best first.
+    """
+    if k >= len(scores):
+        return np.argsort(-scores)
+    best = np.argpartition(-scores, k)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+# =============================================================================
+
+
+class VectorStore:
+    """
+    Append-only matrix of vectors, with the id and group (e.g. the message and
+    its thread) of each row. Grows by doubling, so appends are amortized O(1).
+
+    Appends are written past the published rows, then published: `rows` is
+    consistent without a lock. Only one thread may append at a time.
+    """
+
+    def __init__(self, dim: int, capacity: int = 1024) -> None:
+        self.dim = dim
+        self._vectors = np.empty((capacity, dim), dtype=np.float32)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._groups = np.empty(capacity, dtype=np.int64)
+        self._rows = StoreRows(self._vectors[:0], self._ids[:0], self._groups[:0])
+
+    def __len__(self) -> int:
+        return len(self._rows.ids)
+
+    @property
+    def size(self) -> int:
+        return len(self._rows.ids)
+
+    @property
+    def rows(self) -> StoreRows:
+        return self._rows
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._rows.vectors
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._rows.ids
+
+    @property
+    def groups(self) -> np.ndarray:
+        return self._rows.groups
+
+    @property
+    def nbytes(self) -> int:
+        return self._vectors.nbytes + self._ids.nbytes + self._groups.nbytes
+
+    def add(self, ids, vectors: np.ndarray, groups) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        size = self.size
+        end = size + len(vectors)
+        if end > len(self._ids):
+            # New arrays, the published rows keep the old ones
+            capacity = max(end, 2 * len(self._ids))
+            self._vectors = np.resize(self._vectors, (capacity, self.dim))
+            self._ids = np.resize(self._ids, capacity)
+            self._groups = np.resize(self._groups, capacity)
+        self._vectors[size:end] = vectors
+        self._ids[size:end] = ids
+        self._groups[size:end] = groups
+        self._rows = StoreRows(self._vectors[:end], self._ids[:end], self._groups[:end])
+
+
+# =============================================================================
+
+
+class IVFIndex:
+    """
+    Inverted file index over a `VectorStore`.
+
+    Rows are clustered around `nlist` centroids (spherical k-means), and a
+    query only scores the rows of its `nprobe` closest clusters. Rows added
+    after training are scanned exhaustively until the index is retrained,
+    which happens once the store has doubled in size.
+    """
+
+    def __init__(
+        self,
+        store: VectorStore,
+        nprobe: int = IVF_NPROBE,
+        min_size: int = IVF_MIN_SIZE,
+    ) -> None:
+        self.store = store
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self._trained: Optional[TrainedLists] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_trained(self) -> bool:
+        return self._trained is not None
+
+    def add(self, ids, vectors: np.ndarray, groups) -> None:
+        with self._lock:
+            self.store.add(ids, vectors, groups)
+
+    # Training
+    # -------------------------------------------------------------------------
+
+    def train(self) -> None:
+        vectors = self.store.vectors
+        size = len(vectors)
+        nlist = max(1, int(np.sqrt(size)))
+        rng = np.random.default_rng(0)
+
+        sample_size = min(size, nlist * IVF_TRAIN_SAMPLES_PER_LIST)
+        sample = vectors[rng.choice(size, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(IVF_TRAIN_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~sums.any(axis=1)
+            # Empty clusters keep their previous centroid
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums)
+
+        assignment = self._assign(vectors, centroids)
+        rows = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(assignment[rows], np.arange(nlist + 1))
+
+        self._trained = TrainedLists(centroids, rows, offsets, size)
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, batch: int = 65536) -> np.ndarray:
+        # In batches, to bound the size of the score matrix
+        return np.concatenate(
+            [
+                np.argmax(vectors[start : start + batch] @ centroids.T, axis=1)
+                for start in range(0, len(vectors), batch)
+            ]
+        )
+
+    def _needs_training(self) -> bool:
+        size = len(self.store)
+        trained = self._trained
+        return size >= self.min_size and (trained is None or size >= 2 * trained.size)
+
+    def _maybe_train(self) -> None:
+        if self._needs_training():
+            with self._lock:
+                if self._needs_training():
+                    self.train()
+
+    # Search
+    # -------------------------------------------------------------------------
+
+    def _candidates(
+        self, trained: Optional[TrainedLists], query: np.ndarray, size: int
+    ) -> Optional[np.ndarray]:
+        if trained is None:
+            return None
+        nprobe = min(self.nprobe, len(trained.centroids))
+        lists = top_k(trained.centroids @ query, nprobe)
+        parts = [trained.rows[trained.offsets[i] : trained.offsets[i + 1]] for i in lists]
+        # Rows added since training are not in any list yet
+        parts.append(np.arange(trained.size, size))
+        return np.concatenate(parts)
+
+    def search(
+        self, query: np.ndarray, k: int = 10, exclude_group: Optional[int] = None
+    ) -> SearchResult:
+        """
+        Find the (approximately) `k` most similar rows to a unit vector.
+
+        Returns:
+            SearchResult: Ids, groups and cosine similarities, best first
+        """
+        self._maybe_train()
+        query = np.asarray(query, dtype=np.float32)
+
+        # Lists first: the rows read after them include every row they list
+        trained = self._trained
+        vectors, ids, groups = self.store.rows
+        candidates = self._candidates(trained, query, len(ids))
+        if candidates is None:
+            scores = vectors @ query
+            rows = np.arange(len(scores))
+        else:
+            scores = vectors[candidates] @ query
+            rows = candidates
+
+        if exclude_group is not None:
+            keep = groups[rows] != exclude_group
+            scores, rows = scores[keep], rows[keep]
+
+        best = top_k(scores, k)
+        rows = rows[best]
+        return SearchResult(ids[rows], groups[rows], scores[best])
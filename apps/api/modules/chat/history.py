@@ -0,0 +1,149 @@
+"""
+Message history of a thread, served with keyset pagination.
+"""
+
+from flask import Blueprint, abort, jsonify, request
+from flask_jwt_extended import current_user
+from sqlalchemy import Index
+
+from ..chat.models.message import ChatMessage
+from ..chat.models.thread import ChatThread
+from ..chat.utils.render import get_messages_html
+from ..chat.utils.watermarks import conditional
+from ..core.db.primary import primary_db as db
+from ..core.db.replica import read_only
+from ..core.utils.auth import auth_required
+from ..core.utils.db import Projection, prefetch_users
+from ..core.utils.pagination import InvalidCursor, keyset_paginate
+from ..core.utils.serialization import PARAMETER, RowSerializer
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+# Key used to order (and page through) the messages of a thread
+HISTORY_KEY = (ChatMessage.created_ts, ChatMessage.id)
+
+# Backs the keyset queries below. Declared here so that Alembic autogenerate
+# keeps the index created by the `chat_message_keyset_indexes` migration.
+Index(
+    "chat_message_thread_id_created_ts_id_idx",
+    ChatMessage.thread_id,
+    ChatMessage.created_ts,
+    ChatMessage.id,
+)
+
+api_chat_history = Blueprint("api_chat_history", __name__, url_prefix="/chat")
+
+
+# =============================================================================
+
+
+def get_role(user_id) -> str:
+    return "assistant" if user_id is None else "user"
+
+
+# Messages are read as rows of these columns (and their id), not ORM objects
+MESSAGE_SERIALIZER = RowSerializer(
+    uuid=ChatMessage.uuid,
+    role=(ChatMessage.user_id, get_role),
+    user_id=ChatMessage.user_id,
+    author=PARAMETER,
+    content=ChatMessage.content,
+    html=PARAMETER,
+    created_ts=ChatMessage.created_ts,
+)
+
+
+THREAD_REF = Projection("ThreadRef", ChatThread.id, ChatThread.uuid)
+
+
+def get_thread_or_404(thread_uuid):
+    """
+    Get the id and uuid of a thread of the workspace of the user.
+    """
+    thread = THREAD_REF.one_or_none(
+        THREAD_REF.select().where(
+            ChatThread.uuid == thread_uuid,
+            ChatThread.workspace_id == current_user.workspace_id,
+        )
+    )
+    if thread is None:
+        abort(404)
+    return thread
+
+
+def get_authors(messages) -> dict[int, dict]:
+    """
+    Get the authors of messages, by user id, in a single query.
+    """
+    return {
+        user.id: {"uuid": user.uuid, "name": user.name}
+        for user in prefetch_users(m.user_id for m in messages).values()
+    }
+
+
+# =============================================================================
+
+
+@api_chat_history.get("/threads/<uuid:thread_uuid>/messages")
+@auth_required()
+@read_only
+@conditional("messages")
+def get_thread_messages(thread_uuid):
+    """
+    Get the messages of a thread, one page at a time.
+
+    Query params:
+        limit: Page size (default 50, max 200)
+        cursor: Returns the page of messages *older* than the cursor, newest
+            first. Omit it for the latest page.
+        since: Returns the messages *newer* than the cursor, oldest first. Used
+            by reconnecting clients to catch up from the last message they
+            have; keep following the returned cursor while `has_more` is true.
+            The returned cursor is `null` when there is nothing new.
+
+    Responses carry an ETag: polling with `If-None-Match` gets a 304, without
+    any row loaded, until the thread has new or edited messages.
+    """
+    thread = get_thread_or_404(thread_uuid)
+    limit = request.args.get("limit", HISTORY_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+    since = request.args.get("since")
+    cursor = since if since is not None else request.args.get("cursor")
+
+    try:
+        page = keyset_paginate(
+            db.session.query(*MESSAGE_SERIALIZER.columns, ChatMessage.id).filter(
+                ChatMessage.thread_id == thread.id
+            ),
+            HISTORY_KEY,
+            cursor=cursor,
+            limit=limit,
+            descending=since is None,
+        )
+    except InvalidCursor:
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "error": "invalid-cursor",
+                    "message": "Invalid pagination cursor",
+                }
+            ),
+            400,
+        )
+
+    html = get_messages_html(page.items)
+    authors = get_authors(page.items)
+    return jsonify(
+        {
+            "status": "success",
+            "messages": [
+                MESSAGE_SERIALIZER(m, author=authors.get(m.user_id), html=html.get(m.id))
+                for m in page.items
+            ],
+            "cursor": page.cursor,
+            "has_more": page.has_more,
+        }
+    )
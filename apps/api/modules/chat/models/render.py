@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from pytz import utc
+
+from ...core.db.primary import primary_db as db
+from ...core.utils.db import PrimaryDBUtils
+
+# =============================================================================
+
+
+class ChatMessageRender(db.Model, PrimaryDBUtils):
+    """
+    Rendered, sanitized HTML of a chat message.
+
+    Valid while `content_hash` matches the message content and
+    `renderer_version` the current renderer, re-rendered otherwise.
+    """
+
+    # Identity
+    # -------------------------------------------------------------------------
+    message_id: int = db.Column(
+        db.Integer,
+        db.ForeignKey("chat_message.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    # Render
+    # -------------------------------------------------------------------------
+    # SHA-256 (hex) of the rendered content
+    content_hash: str = db.Column(db.String(64), nullable=False)
+    renderer_version: int = db.Column(db.SmallInteger, nullable=False)
+    html: str = db.Column(db.Text, nullable=False)
+
+    # Metadata
+    # -------------------------------------------------------------------------
+    rendered_ts: datetime = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    # Class meta and hierarchy mapping
+    # -------------------------------------------------------------------------
+    __tablename__ = "chat_message_render"
+    __table_args__ = (
+        db.Index("chat_message_render_renderer_version_idx", "renderer_version"),
+    )
+
+    # -------------------------------------------------------------------------
+
+    def __init__(
+        self, message_id: int, content_hash: str, renderer_version: int, html: str
+    ) -> None:
+        self.message_id = message_id
+        self.content_hash = content_hash
+        self.renderer_version = renderer_version
+        self.html = html
+        self.rendered_ts = datetime.now(tz=utc)
+
+    # -------------------------------------------------------------------------
@@ -0,0 +1,81 @@
+"""
+Related discussions, found by semantic similarity of their messages.
+"""
+
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import current_user
+
+from ..chat.history import THREAD_REF, get_thread_or_404
+from ..chat.models.thread import ChatThread
+from ..core.db.replica import read_only
+from ..core.utils.auth import auth_required
+from ..core.utils.db import prefetch
+
+RELATED_THREADS_LIMIT = 5
+RELATED_THREADS_MAX_LIMIT = 20
+
+api_chat_related = Blueprint("api_chat_related", __name__, url_prefix="/chat")
+
+
+# =============================================================================
+
+
+def serialize_related_threads(related: list[tuple[int, float]]) -> list[dict]:
+    if not related:
+        return []
+    threads = prefetch(THREAD_REF, ChatThread.id, (thread_id for thread_id, _ in related))
+    return [
+        {"uuid": threads[thread_id].uuid, "score": round(score, 4)}
+        for thread_id, score in related
+        if thread_id in threads
+    ]
+
+
+def get_limit() -> int:
+    limit = request.args.get("limit", RELATED_THREADS_LIMIT, type=int)
+    return max(1, min(limit, RELATED_THREADS_MAX_LIMIT))
+
+
+# =============================================================================
+
+
+@api_chat_related.get("/threads/<uuid:thread_uuid>/related")
+@auth_required()
+@read_only
+def get_related_threads(thread_uuid):
+    """
+    Get the threads of the workspace discussing the same things as a thread.
+    """
+    from ..ai.utils.retrieval import find_related_threads
+
+    thread = get_thread_or_404(thread_uuid)
+    related = find_related_threads(
+        current_user.workspace_id, thread_id=thread.id, k=get_limit()
+    )
+    return jsonify({"status": "success", "threads": serialize_related_threads(related)})
+
+
+@api_chat_related.get("/related")
+@auth_required()
+@read_only
+def search_related_threads():
+    """
+    Get the threads of the workspace related to a text (`q`).
+    """
+    from ..ai.utils.retrieval import find_related_threads
+
+    text = (request.args.get("q") or "").strip()
+    if not text:
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "error": "invalid-query",
+                    "message": "Missing search query",
+                }
+            ),
+            400,
+        )
+
+    related = find_related_threads(current_user.workspace_id, text=text, k=get_limit())
+    return jsonify({"status": "success", "threads": serialize_related_threads(related)})
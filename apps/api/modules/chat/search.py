@@ -0,0 +1,245 @@
+"""
+Full-text search over the messages of a workspace.
+
+Backed by the generated `chat_message.search_vector` column and a GIN index
+on `(workspace_id, search_vector)` (`btree_gin`), so that a common term only
+scans the matches of the workspace searched. Matching, ranking and
+highlighting all happen in Postgres.
+"""
+
+import html
+import os
+from typing import Optional
+
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import current_user
+from sqlalchemy import Column, Computed, Index, Integer, func, literal_column, select
+from sqlalchemy.dialects.postgresql import REGCONFIG, TSVECTOR
+
+from ..chat.models.message import ChatMessage
+from ..chat.models.thread import ChatThread
+from ..core.db.primary import primary_db as db
+from ..core.db.replica import read_only
+from ..core.utils.auth import auth_required
+from ..core.utils.pagination import InvalidCursor, KeysetPage, decode_cursor, keyset_paginate
+
+# Must match the expression of the generated column, or the index is not used
+SEARCH_CONFIG = "english"
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# Relevance ranking only considers the most recent matches, which bounds the
+# cost of very common terms in large workspaces.
+SEARCH_MAX_CANDIDATES = int(os.environ.get("STEAGO_SEARCH_MAX_CANDIDATES", 5000))
+SEARCH_STATEMENT_TIMEOUT_MS = int(os.environ.get("STEAGO_SEARCH_STATEMENT_TIMEOUT_MS", 2000))
+
+# Highlight markers, swapped for <mark> once the snippet is HTML escaped
+_START_SEL = "\x02"
+_STOP_SEL = "\x03"
+HEADLINE_OPTIONS = (
+    f"StartSel={_START_SEL}, StopSel={_STOP_SEL}, "
+    "MaxWords=30, MinWords=10, MaxFragments=2, FragmentDelimiter=\" … \""
+)
+
+# Maintained by Postgres and only used by the queries below, so not mapped on
+# the model. Declared here so that Alembic autogenerate keeps the columns and
+# index created by the `chat_message_search_vector` and
+# `chat_message_search_workspace` migrations.
+search_vector = Column(
+    "search_vector",
+    TSVECTOR,
+    Computed(f"to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(content, ''))"),
+    nullable=True,
+)
+# The workspace of the thread, set by a trigger on insert
+message_workspace_id = Column("workspace_id", Integer, nullable=True)
+ChatMessage.__table__.append_column(search_vector)
+ChatMessage.__table__.append_column(message_workspace_id)
+Index(
+    "chat_message_workspace_id_search_vector_idx",
+    message_workspace_id,
+    search_vector,
+    postgresql_using="gin",
+)
+
+search_config = literal_column(f"'{SEARCH_CONFIG}'", type_=REGCONFIG)
+
+api_chat_search = Blueprint("api_chat_search", __name__, url_prefix="/chat")
+
+
+# =============================================================================
+
+
+def parse_search_query(query: str):
+    """
+    Parse a user query (quotes, `or`, `-word`, never a syntax error).
+    """
+    return func.websearch_to_tsquery(search_config, query)
+
+
+def format_snippet(snippet: str) -> str:
+    return (
+        html.escape(snippet)
+        .replace(_START_SEL, "<mark>")
+        .replace(_STOP_SEL, "</mark>")
+    )
+
+
+def get_snippets(message_ids: list[int], tsquery) -> dict[int, str]:
+    """
+    Highlighted excerpts of the matched messages, for the current page only.
+    """
+    if not message_ids:
+        return {}
+    rows = db.session.execute(
+        select(
+            ChatMessage.id,
+            func.ts_headline(search_config, ChatMessage.content, tsquery, HEADLINE_OPTIONS),
+        ).where(ChatMessage.id.in_(message_ids))
+    )
+    return {message_id: format_snippet(snippet) for message_id, snippet in rows}
+
+
+def search_messages(
+    workspace_id: int,
+    query: str,
+    cursor: Optional[str] = None,
+    limit: int = SEARCH_PAGE_SIZE,
+    sort: str = "relevance",
+) -> tuple[KeysetPage, dict[int, str]]:
+    """
+    Search the messages of a workspace.
+
+    Results are ordered by relevance (`ts_rank_cd`, among the most recent
+    `SEARCH_MAX_CANDIDATES` matches) or by recency, and paginated on
+    `(rank, id)` or `(created_ts, id)`.
+
+    Returns:
+        tuple[KeysetPage, dict[int, str]]: The page and the snippets by
+        message id
+
+    Raises:
+        InvalidCursor: If the cursor is malformed
+    """
+    if cursor is not None:
+        # Before any query
+        decode_cursor(cursor, 2)
+    tsquery = parse_search_query(query)
+
+    # Bounds runaway queries, for this transaction only (`SET LOCAL`). As a
+    # `SELECT`, so that it runs on the same replica as the search itself.
+    db.session.execute(
+        select(func.set_config("statement_timeout", str(SEARCH_STATEMENT_TIMEOUT_MS), True))
+    )
+
+    # Both conditions are answered by the same index scan
+    workspace_matches = (
+        message_workspace_id == workspace_id,
+        search_vector.op("@@")(tsquery),
+    )
+    columns = [
+        ChatMessage.id,
+        ChatMessage.uuid,
+        ChatMessage.user_id,
+        ChatMessage.created_ts,
+        ChatThread.uuid.label("thread_uuid"),
+    ]
+
+    if sort == "recent":
+        results = (
+            db.session.query(*columns)
+            .join(ChatThread, ChatThread.id == ChatMessage.thread_id)
+            .filter(*workspace_matches)
+        )
+        key = (ChatMessage.created_ts, ChatMessage.id)
+    else:
+        candidates = (
+            select(ChatMessage.id)
+            .where(*workspace_matches)
+            .order_by(ChatMessage.id.desc())
+            .limit(SEARCH_MAX_CANDIDATES)
+            .subquery()
+        )
+        rank = func.ts_rank_cd(search_vector, tsquery, 32).label("rank")
+        results = (
+            db.session.query(*columns, rank)
+            .join(candidates, candidates.c.id == ChatMessage.id)
+            .join(ChatThread, ChatThread.id == ChatMessage.thread_id)
+        )
+        key = (rank, ChatMessage.id)
+
+    page = keyset_paginate(results, key, cursor=cursor, limit=limit, descending=True)
+    return page, get_snippets([row.id for row in page.items], tsquery)
+
+
+# =============================================================================
+
+
+@api_chat_search.get("/search")
+@auth_required()
+@read_only
+def search_workspace_messages():
+    """
+    Search the messages of the current workspace.
+
+    Query params:
+        q: Search terms, web search syntax ("exact phrase", or, -excluded)
+        sort: "relevance" (default) or "recent"
+        limit: Page size (default 20, max 100)
+        cursor: Cursor of the previous page
+    """
+    query = (request.args.get("q") or "").strip()
+    if not query:
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "error": "invalid-query",
+                    "message": "Missing search query",
+                }
+            ),
+            400,
+        )
+
+    sort = request.args.get("sort", "relevance")
+    limit = request.args.get("limit", SEARCH_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+
+    try:
+        page, snippets = search_messages(
+            current_user.workspace_id,
+            query,
+            cursor=request.args.get("cursor"),
+            limit=limit,
+            sort=sort,
+        )
+    except InvalidCursor:
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "error": "invalid-cursor",
+                    "message": "Invalid pagination cursor",
+                }
+            ),
+            400,
+        )
+
+    return jsonify(
+        {
+            "status": "success",
+            "results": [
+                {
+                    "uuid": row.uuid,
+                    "thread_uuid": row.thread_uuid,
+                    "role": "assistant" if row.user_id is None else "user",
+                    "created_ts": row.created_ts,
+                    "snippet": snippets.get(row.id, ""),
+                }
+                for row in page.items
+            ],
+            "cursor": page.cursor,
+            "has_more": page.has_more,
+        }
+    )
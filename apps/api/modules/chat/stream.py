@@ -0,0 +1,149 @@
+"""
+Streaming chat replies over Server-Sent Events.
+"""
+
+import os
+import uuid
+from typing import Iterator
+
+from flask import Blueprint, abort, request
+from flask_jwt_extended import current_user
+
+from ..ai.utils.completion_cache import cached_completion_deltas
+from ..ai.utils.context import build_thread_context, count_tokens
+from ..ai.utils.jobs import enqueue_embeddings, enqueue_thread_summary
+from ..ai.utils.stream import iter_completion_deltas, relay_completion
+from ..chat.history import get_thread_or_404
+from ..chat.models.message import ChatMessage
+from ..chat.models.thread import ChatThread
+from ..chat.utils.jobs import enqueue_thread_title
+from ..chat.utils.markdown import IncrementalMarkdownRenderer
+from ..chat.utils.render import store_message_html
+from ..core.db.primary import primary_db as db
+from ..core.utils.auth import auth_required
+from ..core.utils.db import unit_of_work, write_behind
+from ..core.utils.rate_limiter import check_llm_request, deduct_llm_tokens
+from ..core.utils.realtime import realtime_hub, thread_channel
+from ..core.utils.sse import sse_response
+
+DEFAULT_CHAT_MODEL = os.environ.get("STEAGO_DEFAULT_CHAT_MODEL", "gpt-4o-mini")
+
+api_chat_stream = Blueprint("api_chat_stream", __name__, url_prefix="/chat")
+
+
+# =============================================================================
+
+
+def broadcast_deltas(deltas: Iterator[str], channel: str, key: str) -> Iterator[str]:
+    """
+    Pass deltas through, publishing them to the other clients of the thread.
+    """
+    try:
+        for delta in deltas:
+            realtime_hub.publish_delta(channel, key, delta)
+            yield delta
+    finally:
+        # Closing this generator cancels the upstream completion too
+        deltas.close()
+
+
+@api_chat_stream.post("/threads/<uuid:thread_uuid>/reply/stream")
+@auth_required()
+def stream_thread_reply(thread_uuid):
+    """
+    Generate the assistant reply of a thread and stream it as it is produced.
+
+    The reply is persisted as a single `ChatMessage` once the stream finishes.
+    Other participants of the thread follow it through realtime
+    `message-delta` events (keyed by `reply_key`), then `message-created`.
+    Deterministic requests (`"temperature": 0`) go through the completion
+    cache and may be replayed from an earlier identical request.
+
+    With `"html": true`, delta events also carry the rendered reply as
+    `{"offset": n, "blocks": [...], "tail": "..."}`: keep the first `n`
+    blocks received so far, append `blocks`, and show `tail` after them.
+    """
+    body = request.get_json(silent=True) or {}
+    model = body.get("model") or DEFAULT_CHAT_MODEL
+    temperature = body.get("temperature")
+    renderer = IncrementalMarkdownRenderer() if body.get("html") else None
+
+    thread = get_thread_or_404(thread_uuid)
+
+    thread_id = thread.id
+    channel = thread_channel(thread.uuid)
+    reply_key = uuid.uuid4().hex
+    workspace_id = current_user.workspace_id
+
+    if not check_llm_request(current_user.uuid, workspace_id, model).allowed:
+        abort(429)
+
+    context = build_thread_context(thread_id, model)
+    messages = context.messages
+    # Only the user's message so far (no system prompt is given above)
+    is_first_exchange = len(messages) == 1
+
+    # Hand the DB connection back to the pool while the reply streams, a new
+    # one is checked out only to persist the final message.
+    db.session.close()
+
+    charged = False
+
+    def charge_tokens(content: str) -> None:
+        # Once, whether the reply completes or the client drops the stream:
+        # the provider produced the tokens either way
+        nonlocal charged
+        if not charged:
+            charged = True
+            deduct_llm_tokens(workspace_id, context.token_count + count_tokens(content))
+
+    def persist_reply(content: str) -> dict:
+        charge_tokens(content)
+        # The message, its HTML and its follow-up jobs in one transaction
+        with unit_of_work():
+            message = ChatMessage.create(thread_id=thread_id, user_id=None, content=content)
+            db.session.flush()
+            store_message_html(message.id, content, renderer.html if renderer else None)
+            enqueue_embeddings(workspace_id)
+            if is_first_exchange:
+                enqueue_thread_title(thread_id, workspace_id)
+            if context.summary_needed:
+                enqueue_thread_summary(thread_id, workspace_id, model)
+        write_behind.touch(ChatThread, thread_id)
+        data = {"uuid": str(message.uuid), "reply_key": reply_key}
+        realtime_hub.publish(channel, "message-created", data)
+        return data
+
+    if temperature == 0:
+        deltas = cached_completion_deltas(
+            model, messages, workspace_id=workspace_id, temperature=0
+        )
+    elif temperature is not None:
+        deltas = iter_completion_deltas(model, messages, temperature=temperature)
+    else:
+        deltas = iter_completion_deltas(model, messages)
+
+    sent_blocks = 0
+
+    def render_update(delta: str) -> dict:
+        nonlocal sent_blocks
+        renderer.feed(delta)
+        offset = min(sent_blocks, len(renderer.blocks))
+        sent_blocks = len(renderer.blocks)
+        return {
+            "html": {
+                "offset": offset,
+                "blocks": renderer.blocks[offset:],
+                "tail": renderer.tail_html,
+            }
+        }
+
+    deltas = broadcast_deltas(deltas, channel, reply_key)
+    return sse_response(
+        relay_completion(
+            deltas,
+            persist_reply,
+            on_flush=render_update if renderer else None,
+            on_abort=charge_tokens,
+        )
+    )
@@ -0,0 +1,88 @@
+"""
+Changes to the channels and threads of a workspace since a version, so that
+polling clients fetch what changed instead of the full listings.
+
+A client first gets the current version (`GET /chat/changes`), then loads the
+listings, then polls with `since`. Rows may be sent twice (e.g. around the
+version they were read at): apply them as upserts, by `uuid`.
+"""
+
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import current_user
+
+from ..chat.models.channel import ChatChannel
+from ..chat.models.thread import ChatThread
+from ..chat.utils.watermarks import (
+    conditional,
+    get_changed_rows,
+    get_request_watermarks,
+    parse_version,
+)
+from ..core.db.replica import read_only
+from ..core.utils.auth import auth_required
+from ..core.utils.serialization import get_model_serializer
+
+SYNCED_SCOPES = {"channels": ChatChannel, "threads": ChatThread}
+
+api_chat_sync = Blueprint("api_chat_sync", __name__, url_prefix="/chat")
+
+
+# =============================================================================
+
+
+@api_chat_sync.get("/changes")
+@auth_required()
+@read_only
+@conditional(*SYNCED_SCOPES)
+def get_changes():
+    """
+    Get the channels and threads changed since a version.
+
+    Query params:
+        since: Version returned by an earlier call. Omit it to get the
+            current version only.
+
+    Returns the current `version`, and the changed `channels` and `threads`.
+    When `reset` is true the changes are not listed (rows were deleted, or
+    there are too many): reload the listings.
+    """
+    watermarks = get_request_watermarks()
+    version = ".".join(watermarks[scope] for scope in SYNCED_SCOPES)
+    changes = {"status": "success", "version": version, "reset": False}
+    changes.update({scope: [] for scope in SYNCED_SCOPES})
+
+    since = request.args.get("since")
+    if since is None:
+        changes["reset"] = True
+        return jsonify(changes)
+
+    parts = since.split(".")
+    parsed = [parse_version(part) for part in parts]
+    if len(parts) != len(SYNCED_SCOPES) or None in parsed:
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "error": "invalid-version",
+                    "message": "Invalid version",
+                }
+            ),
+            400,
+        )
+
+    for (scope, model), part, since_version in zip(SYNCED_SCOPES.items(), parts, parsed):
+        if part == watermarks[scope]:
+            continue
+        serializer = get_model_serializer(model)
+        rows, reset = get_changed_rows(
+            model,
+            current_user.workspace_id,
+            since_version,
+            parse_version(watermarks[scope]),
+            columns=serializer.columns,
+        )
+        if reset:
+            changes.update({"reset": True, **{scope: [] for scope in SYNCED_SCOPES}})
+            return jsonify(changes)
+        changes[scope] = serializer.many(rows)
+    return jsonify(changes)
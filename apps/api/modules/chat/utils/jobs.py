@@ -0,0 +1,80 @@
+"""
+Background jobs of the chat module: thread titles.
+"""
+
+import os
+
+from sqlalchemy import select
+
+from ...ai.utils.completion_cache import cached_completion
+from ...ai.utils.prompt_registry import prompt_registry, register_prompt
+from ...core.db.primary import primary_db as db
+from ...core.utils.jobs import enqueue_job, job_handler
+from ...core.utils.realtime import realtime_hub, thread_channel
+from ..models.message import ChatMessage
+from ..models.thread import ChatThread
+
+TITLE_MODEL = os.environ.get("STEAGO_TITLE_MODEL", "gpt-4o-mini")
+TITLE_MAX_LENGTH = 80
+# Characters of each message given to the model
+TITLE_MESSAGE_CHARS = 2000
+
+TITLE_PROMPT = register_prompt(
+    "chat.thread_title",
+    "Write a short title (at most 6 words) for the conversation below. "
+    "Reply with the title only, without quotes or final punctuation.",
+)
+
+
+# =============================================================================
+
+
+def enqueue_thread_title(thread_id: int, workspace_id: int) -> None:
+    enqueue_job(
+        "chat.generate_title",
+        {"thread_id": thread_id, "workspace_id": workspace_id},
+        priority=1,
+        idempotency_key=f"chat.generate_title:{thread_id}",
+    )
+
+
+@job_handler("chat.generate_title")
+def generate_thread_title(thread_id: int, workspace_id: int) -> None:
+    """
+    Title a thread after its first exchange.
+    """
+    messages = db.session.execute(
+        select(ChatMessage.user_id, ChatMessage.content)
+        .where(ChatMessage.thread_id == thread_id)
+        .order_by(ChatMessage.created_ts, ChatMessage.id)
+        .limit(2)
+    ).all()
+    if not messages:
+        return
+    db.session.rollback()
+
+    transcript = "\n\n".join(
+        f"{'Assistant' if user_id is None else 'User'}: {(content or '')[:TITLE_MESSAGE_CHARS]}"
+        for user_id, content in messages
+    )
+    title = cached_completion(
+        TITLE_MODEL,
+        [
+            {"role": "system", "content": prompt_registry.render(TITLE_PROMPT)},
+            {"role": "user", "content": transcript},
+        ],
+        workspace_id=workspace_id,
+        temperature=0,
+    )
+    title = title.strip().strip("\"'").rstrip(".")[:TITLE_MAX_LENGTH]
+    if not title:
+        return
+
+    thread = db.session.get(ChatThread, thread_id)
+    if thread is None:
+        return
+    thread.title = title
+    thread.persist()
+    realtime_hub.publish(
+        thread_channel(thread.uuid), "thread-updated", {"uuid": str(thread.uuid), "title": title}
+    )
@@ -0,0 +1,228 @@
+"""
+Markdown to sanitized HTML rendering of chat messages.
+
+Bump `RENDERER_VERSION` whenever the output changes (markdown2 extras, the
+sanitizer allowlists), stored renders of older versions are then re-rendered
+lazily or by the `flask rerender-messages` job.
+"""
+
+import hashlib
+import re
+from typing import Optional
+
+RENDERER_VERSION = 1
+
+MARKDOWN_EXTRAS = [
+    "code-friendly",
+    "cuddled-lists",
+    "fenced-code-blocks",
+    "strike",
+    "tables",
+]
+
+ALLOWED_TAGS = {
+    "a", "blockquote", "br", "code", "del", "div", "em", "h1", "h2", "h3", "h4",
+    "h5", "h6", "hr", "li", "ol", "p", "pre", "s", "span", "strong", "table",
+    "tbody", "td", "th", "thead", "tr", "ul",
+}  # fmt: skip
+
+ALLOWED_ATTRIBUTES = {
+    "a": {"href", "title"},
+    "code": {"class"},
+    "div": {"class"},
+    "span": {"class"},
+    "td": {"align"},
+    "th": {"align"},
+}
+
+ALLOWED_URL_SCHEMES = ("http://", "https://", "mailto:", "#")
+
+# Removed with their content, other disallowed tags are unwrapped
+DROPPED_TAGS = ("script", "style", "iframe", "object", "embed")
+
+
+def get_content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def sanitize_html(html: str) -> str:
+    """
+    Keep only allowlisted tags and attributes, and safe link targets.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup.find_all(DROPPED_TAGS):
+        tag.decompose()
+
+    for tag in soup.find_all(True):
+        if tag.name not in ALLOWED_TAGS:
+            tag.unwrap()
+            continue
+
+        allowed = ALLOWED_ATTRIBUTES.get(tag.name, ())
+        tag.attrs = {name: value for name, value in tag.attrs.items() if name in allowed}
+
+        if tag.name == "a":
+            href = tag.get("href", "").strip()
+            if not href.lower().startswith(ALLOWED_URL_SCHEMES):
+                del tag["href"]
+            elif not href.startswith("#"):
+                tag["rel"] = "noopener noreferrer nofollow"
+                tag["target"] = "_blank"
+
+    return str(soup)
+
+
+def render_markdown(content: str) -> str:
+    """
+    Render the markdown of a message to sanitized HTML.
+
+    Returns:
+        str: The HTML, safe to insert in the page
+    """
+    if not content.strip():
+        # markdown2 makes an empty paragraph of it
+        return ""
+
+    import markdown2
+
+    html = markdown2.markdown(content, extras=MARKDOWN_EXTRAS, safe_mode="escape")
+    return sanitize_html(html)
+
+
+# =============================================================================
+# Incremental rendering
+# =============================================================================
+
+_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+_LIST_ITEM_RE = re.compile(r"^ {0,3}([*+-]|\d+\.)[ \t]")
+_QUOTE_RE = re.compile(r"^ {0,3}>")
+# Link definitions apply to the whole text, blocks can't be rendered alone
+_LINK_DEFINITION_RE = re.compile(r"^ {0,3}\[[^\]]+\]:", re.MULTILINE)
+
+
+class IncrementalMarkdownRenderer:
+    """
+    Render a growing Markdown text (a streamed reply) without re-rendering it
+    all on every update.
+
+    Blocks are finalized (rendered once) when the next block starts after a
+    blank line and can't be a continuation of it (outside code fences, not
+    indented, not another item of the same list or blockquote). Only the
+    trailing open block is rendered again. Blocks are rendered independently,
+    so `html` is the same as `render_markdown()` of the full text.
+    """
+
+    def __init__(self) -> None:
+        # Rendered blocks, and the text of the open block after them
+        self.blocks: list[str] = []
+        self._block_texts: list[str] = []
+        self._open = ""
+        # Scan state, over the complete lines of the open block
+        self._scan = 0
+        self._fence: Optional[str] = None
+        self._blank_at: Optional[int] = None
+        self._has_list = False
+        self._has_quote = False
+        self._tail_html: Optional[str] = None
+        self._incremental = True
+
+    @property
+    def text(self) -> str:
+        return "".join(self._block_texts) + self._open
+
+    def feed(self, delta: str) -> None:
+        """
+        Add text, rendering the blocks it completes.
+
+        `blocks` only grows, except when the text turns out to need a render
+        as a whole (link definitions, raw HTML, some blockquotes): it is then emptied
+        and everything is rendered as the tail from then on.
+        """
+        self._open += delta
+        self._tail_html = None
+        if not self._incremental:
+            return
+        if _LINK_DEFINITION_RE.search(self._open):
+            self._render_whole()
+            return
+
+        while True:
+            end = self._open.find("\n", self._scan)
+            if end < 0:
+                break
+            line = self._open[self._scan : end]
+            start, self._scan = self._scan, end + 1
+
+            if self._fence is not None:
+                stripped = line.strip()
+                if stripped.startswith(self._fence) and not stripped.strip(self._fence[0]):
+                    self._fence = None
+                continue
+
+            if not line.strip():
+                if self._blank_at is None:
+                    self._blank_at = start
+                continue
+
+            if self._blank_at is not None and (
+                line[0] == "<" or (self._has_quote and line[0] in " \t")
+            ):
+                # Raw HTML blocks, and blockquotes followed by an indented
+                # block, are rendered by markdown2 depending on what comes
+                # before and after them
+                self._render_whole()
+                return
+            if (
+                self._blank_at is not None
+                # Leading blank lines are not a block
+                and self._open[: self._blank_at].strip()
+                and self._starts_block(line)
+            ):
+                self._block_texts.append(self._open[:start])
+                self.blocks.append(render_markdown(self._open[: self._blank_at]))
+                self._open = self._open[start:]
+                self._scan -= start
+                self._has_list = self._has_quote = False
+            self._blank_at = None
+
+            fence = _FENCE_RE.match(line)
+            if fence:
+                self._fence = fence.group(1)
+            self._has_list = self._has_list or bool(_LIST_ITEM_RE.match(line))
+            self._has_quote = self._has_quote or bool(_QUOTE_RE.match(line))
+
+    def _render_whole(self) -> None:
+        # Render everything as one block from now on
+        self._incremental = False
+        self._open = self.text
+        self._block_texts = []
+        self.blocks = []
+
+    def _starts_block(self, line: str) -> bool:
+        if line[0] in " \t":
+            return False
+        if self._has_list and _LIST_ITEM_RE.match(line):
+            return False
+        if self._has_quote and _QUOTE_RE.match(line):
+            return False
+        return True
+
+    @property
+    def tail_html(self) -> str:
+        """
+        HTML of the open (last) block, rendered at most once per update.
+        """
+        if self._tail_html is None:
+            tail = self._open
+            self._tail_html = render_markdown(tail) if tail.strip() else ""
+        return self._tail_html
+
+    @property
+    def html(self) -> str:
+        """
+        HTML of the full text.
+        """
+        tail = self.tail_html
+        return "".join(self.blocks) + tail
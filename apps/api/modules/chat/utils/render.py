@@ -0,0 +1,146 @@
+"""
+Rendered HTML of chat messages, stored in `chat_message_render`.
+
+Messages are rendered once, at write time (`store_message_html`) or on first
+read (`get_messages_html`), and served from the stored render afterwards.
+"""
+
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from ...core.db.primary import primary_db as db
+from ...core.utils.db import commit
+from ...core.utils.log import logger
+from ..models.message import ChatMessage
+from ..models.render import ChatMessageRender
+from .markdown import RENDERER_VERSION, get_content_hash, render_markdown
+
+RERENDER_BATCH_SIZE = 500
+
+
+def _render_row(message_id: int, content: str, html: Optional[str] = None) -> dict:
+    return {
+        "message_id": message_id,
+        "content_hash": get_content_hash(content),
+        "renderer_version": RENDERER_VERSION,
+        "html": render_markdown(content) if html is None else html,
+        "rendered_ts": func.now(),
+    }
+
+
+def _upsert_renders(rows: list[dict]) -> None:
+    stmt = insert(ChatMessageRender).values(rows)
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ChatMessageRender.message_id],
+            set_={
+                "content_hash": stmt.excluded.content_hash,
+                "renderer_version": stmt.excluded.renderer_version,
+                "html": stmt.excluded.html,
+                "rendered_ts": stmt.excluded.rendered_ts,
+            },
+        )
+    )
+
+
+# =============================================================================
+
+
+def store_message_html(message_id: int, content: str, html: Optional[str] = None) -> str:
+    """
+    Render a message and store the result. Pass `html` when it was already
+    rendered (e.g. incrementally, while streaming).
+
+    Returns:
+        str: The HTML
+    """
+    row = _render_row(message_id, content, html)
+    _upsert_renders([row])
+    commit()
+    return row["html"]
+
+
+def get_messages_html(messages: Iterable[ChatMessage]) -> dict[int, str]:
+    """
+    Get the HTML of messages, rendering (and storing) the missing or stale
+    ones in a single write.
+
+    Returns:
+        dict[int, str]: The HTML by message id
+    """
+    messages = [m for m in messages if m.content is not None]
+    if not messages:
+        return {}
+
+    renders = {
+        render.message_id: render
+        for render in db.session.execute(
+            select(
+                ChatMessageRender.message_id,
+                ChatMessageRender.content_hash,
+                ChatMessageRender.renderer_version,
+                ChatMessageRender.html,
+            ).where(ChatMessageRender.message_id.in_([m.id for m in messages]))
+        )
+    }
+
+    html: dict[int, str] = {}
+    stale: list[dict] = []
+    for message in messages:
+        render: Optional[tuple] = renders.get(message.id)
+        if (
+            render is not None
+            and render.renderer_version == RENDERER_VERSION
+            and render.content_hash == get_content_hash(message.content)
+        ):
+            html[message.id] = render.html
+        else:
+            row = _render_row(message.id, message.content)
+            html[message.id] = row["html"]
+            stale.append(row)
+
+    if stale:
+        # Best effort, the HTML is served either way
+        try:
+            _upsert_renders(stale)
+            commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception("Unable to store message renders.")
+    return html
+
+
+def rerender_stale_messages(batch_size: int = RERENDER_BATCH_SIZE) -> int:
+    """
+    Re-render the stored renders of older renderer versions, in batches of
+    `batch_size` messages (one transaction each). Messages never rendered
+    are left to be rendered on first read.
+
+    Returns:
+        int: The number of messages re-rendered
+    """
+    count = 0
+    last_id = 0
+    while True:
+        batch = db.session.execute(
+            select(ChatMessage.id, ChatMessage.content)
+            .join(ChatMessageRender, ChatMessageRender.message_id == ChatMessage.id)
+            .where(
+                ChatMessageRender.renderer_version != RENDERER_VERSION,
+                ChatMessage.id > last_id,
+            )
+            .order_by(ChatMessage.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            return count
+
+        _upsert_renders(
+            [_render_row(message_id, content or "") for message_id, content in batch]
+        )
+        commit()
+        count += len(batch)
+        last_id = batch[-1].id
+        logger.info(f"Re-rendered {count} messages.")
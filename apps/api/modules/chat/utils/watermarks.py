@@ -0,0 +1,346 @@
+"""
+Watermarks: cheap validators for the listings clients poll.
+
+The watermark of a set of rows is the high-water mark of their `modified_ts`,
+their count (so deletions change it) and a checksum of their `modified_ts`
+(so an update committed out of order changes it too):
+
+    channels    The channels of a workspace
+    threads     The threads of a workspace
+    messages    The messages of a thread
+
+All three come from a single aggregate over a `(key, modified_ts)` index.
+Watermarks are kept in the shared cache, and dropped when a commit writes one
+of their rows (or when the write-behind queue touches a thread), so they are
+computed once per change rather than once per poll. Bulk statements bypassing
+the session are only picked up when the entry expires (`WATERMARK_TTL`), as
+is a value computed while the write that changes it commits.
+
+Listings also show the names of their authors and rendered HTML, so ETags
+include the renderer version and a version of the users of the workspace: a
+random token replaced whenever one of them is written.
+
+`conditional` turns them into ETags, and answers `If-None-Match` with a 304
+before the view loads any row:
+
+    @api.get("/channels")
+    @auth_required()
+    @read_only
+    @conditional("channels")
+    def get_channels(): ...
+"""
+
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from typing import Optional, Sequence
+
+from flask import current_app, g, make_response, request
+from flask_jwt_extended import current_user
+from sqlalchemy import Index, event, func, select
+
+from ...core.db.primary import primary_db as db
+from ...core.db.replica import REPLICA_URIS, RoutingSession, use_primary
+from ...core.utils.cache import cache
+from ...core.utils.db import write_behind
+from ...core.utils.identity import get_users_version
+from ..models.channel import ChatChannel
+from ..models.message import ChatMessage
+from ..models.thread import ChatThread
+from .markdown import RENDERER_VERSION
+
+WATERMARK_TTL = int(os.environ.get("STEAGO_WATERMARK_TTL", 30))
+# More changes than this, and the change feed asks for a reload
+CHANGES_MAX_ROWS = int(os.environ.get("STEAGO_CHANGES_MAX_ROWS", 500))
+# `modified_ts` is the start of the writing transaction, so a row can commit
+# with a timestamp older than a version already sent. Rows that recent are
+# sent again.
+CHANGES_OVERLAP = timedelta(seconds=int(os.environ.get("STEAGO_CHANGES_OVERLAP_SECONDS", 10)))
+# Threads never change workspace, only the deleted ones go stale
+THREAD_REF_TTL = 3600
+
+# Model and key column of each scope
+SCOPES = {
+    "channels": (ChatChannel, ChatChannel.workspace_id),
+    "threads": (ChatThread, ChatThread.workspace_id),
+    "messages": (ChatMessage, ChatMessage.thread_id),
+}
+
+# Back the aggregates below. Declared here so that Alembic autogenerate keeps
+# the indexes created by the `watermark_indexes` migration.
+for _model, _key in SCOPES.values():
+    Index(f"{_model.__tablename__}_{_key.key}_modified_ts_idx", _key, _model.modified_ts)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US = timedelta(microseconds=1)
+
+
+# =============================================================================
+# Versions
+# =============================================================================
+
+
+def _to_us(ts: Optional[datetime]) -> int:
+    if ts is None:
+        return 0
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return (ts - _EPOCH) // _US
+
+
+def format_version(max_ts: Optional[datetime], count: int, checksum) -> str:
+    checksum = int((checksum or 0) * 1_000_000) & 0xFFFFFFFF
+    return f"{_to_us(max_ts):x}-{count:x}-{checksum:x}"
+
+
+def parse_version(version: str) -> Optional[tuple[Optional[datetime], int]]:
+    """
+    Parse a version made by `format_version`.
+
+    Returns:
+        tuple: The `modified_ts` high-water mark (`None` when there were no
+        rows) and the count of rows, or `None` if the version is invalid
+    """
+    try:
+        max_us, count, _ = (int(part, 16) for part in version.split("-"))
+    except ValueError:
+        return None
+    if max_us < 0 or count < 0:
+        return None
+    max_ts = _EPOCH + max_us * _US if max_us else None
+    return max_ts, count
+
+
+def _cache_key(scope: str, key) -> str:
+    return f"wm:{scope}:{key}"
+
+
+def read_watermark(scope: str, key: int) -> str:
+    """
+    Compute the watermark of `scope`, with the bind the session picks (a
+    replica inside a read-only block).
+    """
+    model, key_column = SCOPES[scope]
+    max_ts, count, checksum = db.session.execute(
+        select(
+            func.max(model.modified_ts),
+            func.count(),
+            func.sum(func.extract("epoch", model.modified_ts)),
+        ).where(key_column == key)
+    ).one()
+    return format_version(max_ts, count, checksum)
+
+
+def get_watermark(scope: str, key: int) -> str:
+    """
+    The current watermark of `scope`, from the cache or the primary.
+    """
+    cache_key = _cache_key(scope, key)
+    version = cache.get(cache_key)
+    if version is None:
+        with use_primary():
+            version = read_watermark(scope, key)
+        cache.set(cache_key, version, timeout=WATERMARK_TTL)
+    return version
+
+
+def get_thread_id(workspace_id: int, thread_uuid) -> Optional[int]:
+    """
+    Id of a thread of the workspace, `None` if there is no such thread.
+    """
+    cache_key = f"wm:thread:{thread_uuid}"
+    ref = cache.get(cache_key)
+    if ref is None:
+        with use_primary():
+            ref = db.session.execute(
+                select(ChatThread.id, ChatThread.workspace_id).where(
+                    ChatThread.uuid == thread_uuid
+                )
+            ).one_or_none()
+        if ref is None:
+            return None
+        ref = tuple(ref)
+        cache.set(cache_key, ref, timeout=THREAD_REF_TTL)
+    thread_id, thread_workspace_id = ref
+    return thread_id if thread_workspace_id == workspace_id else None
+
+
+# =============================================================================
+# Changes
+# =============================================================================
+
+
+def get_changed_rows(
+    model, workspace_id: int, since: tuple, now: tuple, columns: Sequence = ()
+) -> tuple[list, bool]:
+    """
+    Rows of the workspace changed between the `since` and `now` versions
+    (parsed), as rows of `columns` and of the `id` and `created_ts` columns.
+
+    Returns:
+        tuple: The rows, oldest change first, and whether the client must
+        reload the listing instead (too many changes, or deletions)
+    """
+    since_ts, since_count = since
+    now_ts, now_count = now
+    if now_ts is None:
+        return [], since_count > 0
+
+    # Compared by identity, `==` makes a SQL expression
+    selected = {id(column) for column in columns}
+    columns = [*columns, *(c for c in (model.id, model.created_ts) if id(c) not in selected)]
+    query = select(*columns).where(model.workspace_id == workspace_id, model.modified_ts <= now_ts)
+    if since_ts is not None:
+        query = query.where(model.modified_ts > since_ts - CHANGES_OVERLAP)
+    query = query.order_by(model.modified_ts, model.id).limit(CHANGES_MAX_ROWS + 1)
+    rows = db.session.execute(query).all()
+    if len(rows) > CHANGES_MAX_ROWS:
+        return [], True
+
+    # Fewer rows than the ones we knew of, plus the new ones: some were deleted
+    created = sum(1 for row in rows if _to_us(row.created_ts) > _to_us(since_ts))
+    return rows, since_count + created > now_count
+
+
+# =============================================================================
+# Invalidation
+# =============================================================================
+
+
+def invalidate(*scope_keys: tuple) -> None:
+    """
+    Drop the cached watermarks of `(scope, key)` pairs.
+    """
+    if scope_keys:
+        cache.delete_many(*[_cache_key(scope, key) for scope, key in set(scope_keys)])
+
+
+def _get_scope_keys(instance) -> list[tuple]:
+    if isinstance(instance, ChatMessage):
+        return [("messages", instance.thread_id)]
+    if isinstance(instance, ChatThread):
+        return [("threads", instance.workspace_id), ("messages", instance.id)]
+    if isinstance(instance, ChatChannel):
+        return [("channels", instance.workspace_id)]
+    return []
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _collect_written(session, _flush_context) -> None:
+    written = session.info.setdefault("watermarks", set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        written.update(_get_scope_keys(instance))
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _invalidate_written(session) -> None:
+    written = session.info.pop("watermarks", None)
+    if written:
+        invalidate(*written)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _forget_written(session) -> None:
+    session.info.pop("watermarks", None)
+
+
+def _invalidate_touched(model, row_ids: set) -> None:
+    if model is not ChatThread:
+        return
+    workspace_ids = db.session.scalars(
+        select(ChatThread.workspace_id).where(ChatThread.id.in_(row_ids)).distinct()
+    )
+    invalidate(*[("threads", workspace_id) for workspace_id in workspace_ids])
+
+
+write_behind.add_flush_listener(_invalidate_touched)
+
+
+# =============================================================================
+# Conditional requests
+# =============================================================================
+
+
+def make_etag(versions: list[str]) -> str:
+    """
+    ETag of the current URL for the current user, at `versions`.
+    """
+    parts = [
+        *versions,
+        get_users_version(current_user.workspace_id),
+        str(RENDERER_VERSION),
+        str(current_user.id),
+        request.full_path,
+    ]
+    return hashlib.blake2b("|".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def _get_scope_keys_of_request(scopes: tuple, kwargs: dict) -> Optional[list[tuple]]:
+    workspace_id = current_user.workspace_id
+    scope_keys = []
+    for scope in scopes:
+        if scope == "messages":
+            thread_id = get_thread_id(workspace_id, kwargs["thread_uuid"])
+            if thread_id is None:
+                return None
+            scope_keys.append((scope, thread_id))
+        else:
+            scope_keys.append((scope, workspace_id))
+    return scope_keys
+
+
+def get_request_watermarks() -> dict[str, str]:
+    """
+    Watermarks of the ETag of the current response, by scope. Read before the
+    view loads its rows: the rows are at least as recent.
+    """
+    return getattr(g, "watermarks", {})
+
+
+def conditional(*scopes: str):
+    """
+    Route decorator: validate the response with the watermarks of `scopes`
+    (of the workspace of the user, or of the `thread_uuid` of the route for
+    `messages`). Place it under `read_only`.
+
+    `If-None-Match` is checked against the cached watermarks, so a 304 costs
+    no query at all once they are computed. A 200 gets an ETag from
+    watermarks read before the view, from the same replica: a lagging replica
+    never labels older rows with a newer ETag.
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            scope_keys = _get_scope_keys_of_request(scopes, kwargs)
+            if scope_keys is None:
+                # E.g. an unknown thread, left to the view
+                return function(*args, **kwargs)
+
+            versions = [get_watermark(scope, key) for scope, key in scope_keys]
+            etag = make_etag(versions)
+            if request.if_none_match.contains_weak(etag):
+                return _not_modified(etag)
+
+            if REPLICA_URIS:
+                versions = [read_watermark(scope, key) for scope, key in scope_keys]
+                etag = make_etag(versions)
+            g.watermarks = {scope: version for scope, version in zip(scopes, versions)}
+
+            response = make_response(function(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag, weak=True)
+                response.headers["Cache-Control"] = "private, no-cache"
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _not_modified(etag: str):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
@@ -0,0 +1,163 @@
+"""
+Connection pool settings of the primary DB (and its replicas).
+
+Settings come from the environment:
+
+    STEAGO_DB_POOL_SIZE           Connections kept open per process
+    STEAGO_DB_MAX_OVERFLOW        Extra connections opened under load
+    STEAGO_DB_POOL_TIMEOUT        Seconds to wait for a connection
+    STEAGO_DB_POOL_RECYCLE        Seconds before a connection is replaced
+    STEAGO_DB_POOL_PRE_PING       Ping connections on checkout (a round trip)
+    STEAGO_DB_PGBOUNCER           Behind PgBouncer in transaction mode: no
+                                  app-side pool, PgBouncer does the pooling
+    STEAGO_DB_DIRECT_URI          Direct connection (bypassing PgBouncer), for
+                                  session level features such as LISTEN
+
+Recycling only replaces connections past their age: one dropped earlier (a
+failover, a restarted proxy, an idle timeout) would fail the request that
+checks it out. Pre-ping is on by default; turn it off only where connections
+are known to outlive `STEAGO_DB_POOL_RECYCLE`.
+"""
+
+import os
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+DB_POOL_SIZE = int(os.environ.get("STEAGO_DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("STEAGO_DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("STEAGO_DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("STEAGO_DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("STEAGO_DB_POOL_PRE_PING", "true").lower() == "true"
+DB_PGBOUNCER = os.environ.get("STEAGO_DB_PGBOUNCER", "false").lower() == "true"
+DB_DIRECT_URI = os.environ.get("STEAGO_DB_DIRECT_URI")
+
+DB_CONNECT_TIMEOUT = 10
+DB_APPLICATION_NAME = "steago-api"
+
+
+# =============================================================================
+
+
+class PoolStats:
+    """
+    Per-process pool counters: checkouts, new connections, and the time spent
+    waiting for a connection.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.checkouts = 0
+            self.connects = 0
+            self.timeouts = 0
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+
+    def record_checkout(self, wait: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+    def record_connect(self) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "timeouts": self.timeouts,
+                "wait_seconds": self.wait_seconds,
+                "max_wait_seconds": self.max_wait_seconds,
+            }
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    `QueuePool` recording how long each checkout waited for a connection
+    (including opening a new one).
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except Exception:
+            pool_stats.record_checkout(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_stats.record_checkout(time.perf_counter() - start)
+        return record
+
+    def _create_connection(self):
+        pool_stats.record_connect()
+        return super()._create_connection()
+
+
+# =============================================================================
+
+
+def get_engine_options() -> dict:
+    """
+    Engine options (`SQLALCHEMY_ENGINE_OPTIONS`) from the environment.
+    """
+    options = {
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": {
+            "connect_timeout": DB_CONNECT_TIMEOUT,
+            "application_name": DB_APPLICATION_NAME,
+        },
+    }
+    if DB_PGBOUNCER:
+        # A connection is only held for a transaction, PgBouncer hands it to
+        # other clients in between: pooling it here too would only pin
+        # server connections.
+        options["poolclass"] = NullPool
+        return options
+
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_use_lifo=True,
+    )
+    return options
+
+
+def get_direct_url(engine):
+    """
+    URL for session level features (LISTEN, session advisory locks), which do
+    not work through PgBouncer in transaction mode.
+    """
+    return make_url(DB_DIRECT_URI) if DB_DIRECT_URI else engine.url
+
+
+def get_pool_status(engine) -> Optional[dict]:
+    """
+    Current state of the pool of an engine, `None` without an app-side pool.
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return None
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "idle": pool.checkedin(),
+    }
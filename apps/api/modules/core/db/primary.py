@@ -1,6 +1,8 @@
 from sqlalchemy import MetaData
 from flask_sqlalchemy import SQLAlchemy
 
+from .replica import RoutingSession
+
 # https://docs.sqlalchemy.org/en/20/core/constraints.html#configuring-a-naming-convention-for-a-metadata-collection
 # https://gist.github.com/popravich/d6816ef1653329fb1745
 # https://stackoverflow.com/questions/4107915/postgresql-default-constraint-names/4108266#4108266
@@ -21,7 +23,11 @@ convention = {
     "pk": "%(table_name)s_%(column_0_name)s_pkey",
 }
 
-primary_db = SQLAlchemy(metadata=MetaData(naming_convention=convention))
+# Reads of `use_replica()` blocks go to the replicas, see `.replica`
+primary_db = SQLAlchemy(
+    metadata=MetaData(naming_convention=convention),
+    session_options={"class_": RoutingSession},
+)
 
 
 def override_primary_db(db_instance: SQLAlchemy) -> None:
@@ -0,0 +1,190 @@
+"""
+Read-replica routing for `primary_db`.
+
+With `STEAGO_DB_REPLICA_URIS` set (comma separated), the read-only code paths
+(chat history, search, user lookups) send their `SELECT`s to a replica:
+
+    @api.get("/threads/<uuid:thread_uuid>/messages")
+    @auth_required()
+    @read_only
+    def get_thread_messages(thread_uuid): ...
+
+    with use_replica(f"user:{uuid}"):
+        user = User.query.filter_by(uuid=uuid).one_or_none()
+
+Everything else, and any statement after a write in the same session, goes to
+the primary. Replicas lag behind, so a commit that wrote something also pins
+its user and workspace to the primary for `REPLICA_PIN_SECONDS` (in the shared
+cache, for every worker): a client never reads older data than it wrote.
+"""
+
+import os
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Iterable, Iterator, Optional
+
+from flask import g as flask_g
+from flask import has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+REPLICA_URIS = [
+    uri.strip() for uri in os.environ.get("STEAGO_DB_REPLICA_URIS", "").split(",") if uri.strip()
+]
+# Longer than the replication lag, usually well under a second
+REPLICA_PIN_SECONDS = int(os.environ.get("STEAGO_DB_REPLICA_PIN_SECONDS", 5))
+
+REPLICA_BIND_NAMES = [f"replica_{i}" for i in range(len(REPLICA_URIS))]
+
+# Pin keys of the current read-only block, `None` outside of one
+_replica_scope: ContextVar[Optional[tuple]] = ContextVar("replica_scope", default=None)
+
+
+# =============================================================================
+
+
+def get_replica_binds() -> dict[str, dict]:
+    """
+    Replica binds, to add to `SQLALCHEMY_BINDS`, with the pool settings of the
+    primary.
+    """
+    from .pool import get_engine_options
+
+    return {
+        name: {"url": uri, **get_engine_options()}
+        for name, uri in zip(REPLICA_BIND_NAMES, REPLICA_URIS)
+    }
+
+
+def _pin_cache_key(key: str) -> str:
+    return f"db:pin:{key}"
+
+
+def get_principal_pin_keys() -> tuple:
+    """
+    Pin keys of the user of the current request, if there is one.
+    """
+    snapshot = getattr(flask_g, "identity_snapshot", None) if has_app_context() else None
+    if snapshot is None:
+        return ()
+    return (f"user:{snapshot.uuid}", f"workspace:{snapshot.workspace_id}")
+
+
+def pin_to_primary(*keys: str) -> None:
+    """
+    Send the reads of `keys` to the primary for `REPLICA_PIN_SECONDS`.
+    """
+    if not REPLICA_URIS or not keys:
+        return
+    from ..utils.cache import cache
+
+    cache.set_many(
+        {_pin_cache_key(key): 1 for key in keys}, timeout=REPLICA_PIN_SECONDS
+    )
+
+
+def is_pinned(keys: Iterable[str]) -> bool:
+    keys = list(keys)
+    if not keys:
+        return False
+    from ..utils.cache import cache
+
+    return any(cache.get_many(*[_pin_cache_key(key) for key in keys]))
+
+
+# =============================================================================
+
+
+@contextmanager
+def use_replica(*pin_keys: str) -> Iterator[None]:
+    """
+    Send the reads of the block to a replica, unless one of `pin_keys` (or
+    the user of the current request) wrote recently.
+    """
+    token = _replica_scope.set(tuple(pin_keys) + get_principal_pin_keys())
+    try:
+        yield
+    finally:
+        _replica_scope.reset(token)
+
+
+@contextmanager
+def use_primary() -> Iterator[None]:
+    """
+    Send the reads of the block to the primary, even inside a read-only one.
+    """
+    token = _replica_scope.set(None)
+    try:
+        yield
+    finally:
+        _replica_scope.reset(token)
+
+
+def read_only(function):
+    """
+    Route decorator: the reads of the route go to a replica. Place it under
+    the auth decorator, so the user of the request is known.
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+class RoutingSession(Session):
+    """
+    Session sending the plain `SELECT`s of a `use_replica()` block to a
+    replica, and everything else to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica(clause):
+            replica = self._get_replica()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self, clause) -> bool:
+        pin_keys = _replica_scope.get()
+        if pin_keys is None or not REPLICA_URIS:
+            return False
+        if not isinstance(clause, Select) or clause._for_update_arg is not None:
+            return False
+        if self.info.get("wrote") or self._flushing or self.new or self.dirty or self.deleted:
+            return False
+
+        # Checked once per session (i.e. per request)
+        checked = self.info.setdefault("pinned", {})
+        if pin_keys not in checked:
+            checked[pin_keys] = is_pinned(pin_keys)
+        return not checked[pin_keys]
+
+    def _get_replica(self):
+        # One replica per session, so its reads are consistent with each other
+        name = self.info.get("replica")
+        if name is None:
+            name = self.info["replica"] = random.choice(REPLICA_BIND_NAMES)
+        return self._db.engines.get(name)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _track_dml(state) -> None:
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _track_flush(session, _flush_context) -> None:
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _pin_after_write(session) -> None:
+    if session.info.get("wrote"):
+        pin_to_primary(*get_principal_pin_keys())
@@ -46,3 +46,18 @@ class USER_TYPE(int, Enum):
 
     HUB_USER = 0
     SUPER_ADMIN = 1
+
+
+class JOB_STATUS(int, Enum):
+    """
+    Status of a background job.
+    """
+
+    # Waiting to run (at or after `run_at`)
+    QUEUED = 0
+    # Claimed by a worker
+    RUNNING = 1
+    # Done
+    SUCCEEDED = 2
+    # Failed on its last attempt, kept for inspection
+    FAILED = 3
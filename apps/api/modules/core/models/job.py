@@ -0,0 +1,74 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.dialects.postgresql import JSONB
+
+from ...core.db.primary import primary_db as db
+from ...core.models.enums import JOB_STATUS
+from ...core.utils.db import PrimaryDBUtils
+
+# Jobs holding their idempotency key
+ACTIVE_JOB_PREDICATE = f"status IN ({JOB_STATUS.QUEUED.value}, {JOB_STATUS.RUNNING.value})"
+
+# =============================================================================
+
+
+class CoreJob(db.Model, PrimaryDBUtils):
+    """
+    Background job, claimed by workers with `FOR UPDATE SKIP LOCKED`.
+
+    See `modules.core.utils.jobs`.
+    """
+
+    # Identity
+    # -------------------------------------------------------------------------
+    id: int = db.Column(db.BigInteger, primary_key=True)
+    # Name of the handler, e.g. "core.delete_workspace"
+    kind: str = db.Column(db.String(64), nullable=False)
+    payload: dict = db.Column(JSONB, nullable=False, server_default="{}")
+    # At most one queued or running job per key
+    idempotency_key: Optional[str] = db.Column(db.String(255))
+
+    # Scheduling
+    # -------------------------------------------------------------------------
+    status: JOB_STATUS = db.Column(db.SmallInteger, nullable=False)
+    # Higher runs first
+    priority: int = db.Column(db.SmallInteger, nullable=False, server_default="0")
+    run_at: datetime = db.Column(db.DateTime(timezone=True), nullable=False)
+    attempts: int = db.Column(db.SmallInteger, nullable=False, server_default="0")
+    max_attempts: int = db.Column(db.SmallInteger, nullable=False, server_default="5")
+    # When the running attempt was claimed
+    locked_at: Optional[datetime] = db.Column(db.DateTime(timezone=True))
+    last_error: Optional[str] = db.Column(db.Text)
+
+    # Metadata
+    # -------------------------------------------------------------------------
+    created_ts: datetime = db.Column(db.DateTime(timezone=True), nullable=False)
+    modified_ts: datetime = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    # Class meta and hierarchy mapping
+    # -------------------------------------------------------------------------
+    __tablename__ = "core_job"
+    __table_args__ = (
+        # Claim order of the queued jobs
+        db.Index(
+            "core_job_priority_run_at_id_idx",
+            db.desc("priority"),
+            "run_at",
+            "id",
+            postgresql_where=db.text(f"status = {JOB_STATUS.QUEUED.value}"),
+        ),
+        db.Index(
+            "core_job_idempotency_key_idx",
+            "idempotency_key",
+            unique=True,
+            postgresql_where=db.text(ACTIVE_JOB_PREDICATE),
+        ),
+        db.Index(
+            "core_job_locked_at_idx",
+            "locked_at",
+            postgresql_where=db.text(f"status = {JOB_STATUS.RUNNING.value}"),
+        ),
+    )
+
+    # -------------------------------------------------------------------------
@@ -8,7 +8,8 @@ from sqlalchemy.dialects.postgresql import UUID
 
 from ...core.db.primary import primary_db as db
 from ...core.models.enums import USER_STATUS, USER_TYPE
-from ...core.utils.db import PrimaryDBUtils
+from ...core.utils.db import PrimaryDBUtils, commit, on_commit
+from ...core.utils.identity import invalidate_identity
 
 # =============================================================================
 
@@ -72,12 +73,23 @@ class CoreUser(db.Model, PrimaryDBUtils):
     @staticmethod
     def create(name: str, email: str, type: USER_TYPE, workspace_id: int) -> "CoreUser":
         user = CoreUser(name, email, type, workspace_id)
+        uuid = user.uuid
         db.session.add(user)
-        db.session.commit()
+        commit()
+        # Drop any "unknown identity" entry cached for this uuid
+        on_commit(lambda: invalidate_identity(uuid, workspace_id))
         return user
 
     # -------------------------------------------------------------------------
 
+    def persist(self) -> None:
+        # Read these before commit, they expire along with the other columns
+        uuid, workspace_id = self.uuid, self.workspace_id
+        super().persist()
+        on_commit(lambda: invalidate_identity(uuid, workspace_id))
+
+    # -------------------------------------------------------------------------
+
     def get_display_picture(self):
         """
         Get user display picture
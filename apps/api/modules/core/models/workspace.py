@@ -7,7 +7,8 @@ from sqlalchemy.dialects.postgresql import UUID
 
 from ...core.db.primary import primary_db as db
 from ...core.models.enums import WORKSPACE_STATUS
-from ...core.utils.db import PrimaryDBUtils
+from ...core.utils.db import PrimaryDBUtils, commit, on_commit
+from ...core.utils.identity import invalidate_workspace_identities
 
 
 # =============================================================================
@@ -29,6 +30,13 @@ class CoreWorkspace(db.Model, PrimaryDBUtils):
     # -------------------------------------------------------------------------
     status: WORKSPACE_STATUS = db.Column(db.SmallInteger, nullable=False)
 
+    # Settings
+    # -------------------------------------------------------------------------
+    # Whether deterministic LLM completions of the workspace may be cached
+    is_completion_cache_enabled: bool = db.Column(
+        db.Boolean, nullable=False, server_default=db.true()
+    )
+
     # Metadata
     # -------------------------------------------------------------------------
     created_ts: datetime = db.Column(
@@ -48,6 +56,7 @@ class CoreWorkspace(db.Model, PrimaryDBUtils):
         self.uuid = uuid4()
         self.name = name
         self.status = WORKSPACE_STATUS.ACTIVE
+        self.is_completion_cache_enabled = True
         self.created_ts = datetime.now(tz=utc)
         self.modified_ts = self.created_ts
 
@@ -57,7 +66,26 @@ class CoreWorkspace(db.Model, PrimaryDBUtils):
     def create(name: str) -> "CoreWorkspace":
         workspace = CoreWorkspace(name)
         db.session.add(workspace)
-        db.session.commit()
+        commit()
         return workspace
 
     # -------------------------------------------------------------------------
+
+    def persist(self) -> None:
+        # The identity snapshots of the users carry the workspace status, and
+        # the completion cache its opt-out flag
+        workspace_id = self.id
+        super().persist()
+        on_commit(lambda: _invalidate_workspace_caches(workspace_id))
+
+    # -------------------------------------------------------------------------
+
+
+# =============================================================================
+
+
+def _invalidate_workspace_caches(workspace_id: int) -> None:
+    from ...ai.utils.completion_cache import invalidate_completion_cache_flag
+
+    invalidate_workspace_identities(workspace_id)
+    invalidate_completion_cache_flag(workspace_id)
@@ -0,0 +1,84 @@
+"""
+Analytics events, handed off to a background thread.
+
+`track_event()` only puts the event on a bounded queue and returns; a daemon
+thread delivers events to the sink. When the queue is full (the sink is slow
+or down) events are dropped and counted instead of slowing requests down.
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from flask import g as flask_g
+from flask import has_app_context
+
+from .log import logger
+
+ANALYTICS_QUEUE_SIZE = int(os.environ.get("STEAGO_ANALYTICS_QUEUE_SIZE", 10000))
+
+
+def log_sink(event: dict) -> None:
+    logger.debug(f"Analytics event: {event}")
+
+
+class AnalyticsQueue:
+    def __init__(self, maxsize: int = ANALYTICS_QUEUE_SIZE) -> None:
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._sink: Callable[[dict], Any] = log_sink
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def set_sink(self, sink: Callable[[dict], Any]) -> None:
+        """
+        Set the function that delivers events (e.g. to an analytics service).
+        """
+        self._sink = sink
+
+    # -------------------------------------------------------------------------
+
+    def put(self, event: dict) -> None:
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_worker(self) -> None:
+        # Started on first use, and again in a forked child
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run, name="analytics", daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            event = self._queue.get()
+            try:
+                self._sink(event)
+            except Exception:
+                logger.exception("Analytics sink failed.")
+
+
+analytics_queue = AnalyticsQueue()
+
+
+def track_event(name: str, properties: Optional[dict] = None) -> None:
+    """
+    Queue an analytics event, with the browser context of the current request
+    (if any).
+    """
+    event = {
+        "event": name,
+        "properties": properties or {},
+        "timestamp": time.time(),
+    }
+    if has_app_context():
+        event["context"] = flask_g.browser_context
+    analytics_queue.put(event)
@@ -0,0 +1,80 @@
+"""
+Lazy browser context (for analytics) of a request.
+
+The `C-Browser-Context` header is only parsed when a handler first reads
+`flask_g.browser_context`, then memoized for the rest of the request. Requests
+that never read it (health checks, CORS preflights, most API calls) pay
+nothing.
+"""
+
+import json
+from typing import Any, Optional
+
+from flask import current_app, has_request_context, request
+from flask.ctx import _AppCtxGlobals
+
+from .log import logger
+
+BROWSER_CONTEXT_HEADER = "C-Browser-Context"
+
+# Larger headers are ignored rather than parsed
+BROWSER_CONTEXT_MAX_SIZE = 4096
+
+# Routes that never have a browser context
+BROWSER_CONTEXT_SKIPPED_PATHS = ("/ping",)
+
+
+def parse_browser_context() -> Optional[dict]:
+    """
+    Parse the browser context of the current request.
+
+    Returns:
+        dict: The context, with the client `ip` added, or `None` if it was not
+        sent, is too large or is malformed
+    """
+    if (
+        not has_request_context()
+        or request.method == "OPTIONS"
+        or request.path.startswith(BROWSER_CONTEXT_SKIPPED_PATHS)
+    ):
+        return None
+
+    raw = request.headers.get(BROWSER_CONTEXT_HEADER)
+    if not raw or raw == "null":
+        if current_app.debug:
+            logger.warning("Unable to get browser context as it was not sent!")
+        return None
+
+    if len(raw) > BROWSER_CONTEXT_MAX_SIZE:
+        logger.warning(f"Ignoring browser context larger than {BROWSER_CONTEXT_MAX_SIZE} bytes.")
+        return None
+
+    try:
+        context = json.loads(raw)
+    except ValueError:
+        logger.warning("Ignoring malformed browser context.")
+        return None
+
+    if not isinstance(context, dict):
+        return None
+
+    if "ip" not in context:
+        context["ip"] = request.environ.get("HTTP_X_FORWARDED_FOR", request.remote_addr)
+    return context
+
+
+class SteagoAppGlobals(_AppCtxGlobals):
+    """
+    `flask_g` with lazily computed attributes.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "browser_context":
+            value = self.__dict__[name] = parse_browser_context()
+            return value
+        return super().__getattr__(name)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        if name == "browser_context" and name not in self.__dict__:
+            return self.__getattr__(name)
+        return super().get(name, default)
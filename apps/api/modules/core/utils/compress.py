@@ -1,4 +1,272 @@
+"""
+Response compression policy.
+
+Flask-Compress compresses every response the same way, on every request.
+Here the encoding is picked per response:
+
+    - Bodies under `COMPRESS_MIN_SIZE` are sent as is, the saving does not
+      pay for the CPU time.
+    - Dynamic bodies get the cheapest good encoding the client accepts: zstd,
+      then brotli at a low quality, then gzip.
+    - Cacheable bodies (a `GET` answered with 200 and an ETag set by the
+      view) are compressed once, for the best ratio (brotli at a high quality
+      first), and kept per process, keyed by URL, ETag and encoding.
+    - JSON bodies of a `GET` without an ETag get a weak one from a hash of the
+      body, so conditional requests are answered with a 304. Hashing is much
+      cheaper than compressing. They are still compressed as dynamic bodies,
+      since most of them (history pages, search results) are never repeated.
+    - Server-Sent Events are compressed incrementally and flushed after
+      every frame, so each event still reaches the client right away.
+
+A view setting its own ETag must make it identify the body at that URL,
+since the compressed body is served from the cache by ETag alone.
+"""
+
+import gzip
+import os
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from flask import request
 from flask_compress import Compress
 
+from .lru import CacheStats, LRUCache
+from .metrics import Counter
+
+COMPRESS_MIN_SIZE = int(os.environ.get("STEAGO_COMPRESS_MIN_SIZE", 1024))
+COMPRESS_CACHE_SIZE = int(os.environ.get("STEAGO_COMPRESS_CACHE_SIZE", 512))
+COMPRESS_CACHE_TTL = float(os.environ.get("STEAGO_COMPRESS_CACHE_TTL", 300))
+# Larger bodies are compressed every time rather than cached
+COMPRESS_CACHE_MAX_SIZE = 512 * 1024
+
+# Encodings by preference, and their levels
+DYNAMIC_ENCODINGS = ("zstd", "br", "gzip")
+CACHED_ENCODINGS = ("br", "zstd", "gzip")
+CACHED_LEVELS = {"br": 9, "zstd": 12, "gzip": 9}
+STREAM_ENCODINGS = ("zstd", "br", "gzip")
+STREAM_LEVELS = {"br": 3, "zstd": 1, "gzip": 4}
+
+SSE_MIMETYPE = "text/event-stream"
+
+compression_cache_stats = CacheStats(("hits", "misses", "not_modified"))
+
+COMPRESSED_RESPONSES = Counter(
+    "steago_http_compressed_responses_total",
+    "Compressed responses, by encoding and kind (dynamic, cached, stream).",
+    ("encoding", "kind"),
+)
+
+_compressed_bodies = LRUCache(maxsize=COMPRESS_CACHE_SIZE, ttl=COMPRESS_CACHE_TTL)
+
+
+# =============================================================================
+# Encoders
+# =============================================================================
+
+
+def compress_body(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if encoding == "br":
+        import brotli
+
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+class StreamCompressor:
+    """
+    Incremental compressor, every `compress` call returns a block the client
+    can decode on its own (a sync flush).
+    """
+
+    def __init__(self, encoding: str, level: int) -> None:
+        self.encoding = encoding
+        if encoding == "zstd":
+            import zstandard
+
+            self._flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        elif encoding == "br":
+            import brotli
+
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "zstd":
+            return self._compressor.compress(data) + self._compressor.flush(self._flush_mode)
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "zstd":
+            return self._compressor.flush()
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def _compress_stream(chunks: Iterable, compressor: StreamCompressor) -> Iterator[bytes]:
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk:
+                yield compressor.compress(chunk)
+        yield compressor.finish()
+    finally:
+        # Closing the response closes the producer (e.g. cancels a completion)
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+# =============================================================================
+# Policy
+# =============================================================================
+
+
+def _is_available(encoding: str) -> bool:
+    if encoding == "gzip":
+        return True
+    try:
+        __import__("zstandard" if encoding == "zstd" else "brotli")
+    except ImportError:
+        return False
+    return True
+
+
+class CompressionPolicy(Compress):
+    """
+    `Compress`, with the per-response policy above in place of its own hook.
+    The Flask-Compress settings (`COMPRESS_MIMETYPES`, `COMPRESS_LEVEL`,
+    `COMPRESS_BR_LEVEL`, `COMPRESS_ZSTD_LEVEL`) still apply.
+    """
+
+    def init_app(self, app) -> None:
+        app.config.setdefault("COMPRESS_MIN_SIZE", COMPRESS_MIN_SIZE)
+        app.config["COMPRESS_REGISTER"] = False
+        super().init_app(app)
+        self.min_size = app.config["COMPRESS_MIN_SIZE"]
+        self.mimetypes = set(app.config["COMPRESS_MIMETYPES"])
+        self.encodings = {
+            encoding for encoding in ("zstd", "br", "gzip") if _is_available(encoding)
+        }
+        self.dynamic_levels = {
+            "zstd": app.config.get("COMPRESS_ZSTD_LEVEL", 3),
+            "br": app.config.get("COMPRESS_BR_LEVEL", 4),
+            "gzip": app.config.get("COMPRESS_LEVEL", 6),
+        }
+        app.after_request(self.compress_response)
+
+    def choose_encoding(self, preference: tuple) -> Optional[str]:
+        accepted = request.accept_encodings
+        for encoding in preference:
+            if encoding in self.encodings and accepted.quality(encoding) > 0:
+                return encoding
+        return None
+
+    # -------------------------------------------------------------------------
+
+    def compress_response(self, response):
+        if (
+            request.method == "HEAD"
+            or not 200 <= response.status_code < 300
+            or response.status_code == 204
+            or "Content-Encoding" in response.headers
+            or response.direct_passthrough
+        ):
+            return response
+
+        if response.is_streamed:
+            if response.mimetype == SSE_MIMETYPE:
+                return self._compress_stream(response)
+            return response
+        if response.mimetype not in self.mimetypes:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        etag, cacheable = self._get_etag(response)
+        if etag is not None:
+            response.make_conditional(request)
+            if response.status_code == 304:
+                compression_cache_stats.incr("not_modified")
+                return response
+            if cacheable:
+                return self._compress_cached(response, data, etag)
+
+        encoding = self.choose_encoding(DYNAMIC_ENCODINGS)
+        if encoding is None:
+            return response
+        response.set_data(compress_body(data, encoding, self.dynamic_levels[encoding]))
+        COMPRESSED_RESPONSES.inc(encoding, "dynamic")
+        return self._set_encoding(response, encoding)
+
+    def _get_etag(self, response) -> tuple[Optional[str], bool]:
+        """
+        Returns:
+            tuple: The ETag of the response, if it can be validated, and
+            whether its compressed body is worth caching (the view set the
+            ETag, so the body is likely to be served again)
+        """
+        if (
+            request.method != "GET"
+            or response.status_code != 200
+            or "no-store" in response.headers.get("Cache-Control", "")
+        ):
+            return None, False
+        etag, _ = response.get_etag()
+        if etag is not None:
+            return etag, True
+        if response.mimetype == "application/json":
+            # Weak: the same for every encoding of the body
+            response.add_etag(weak=True)
+            etag, _ = response.get_etag()
+        return etag, False
+
+    def _set_encoding(self, response, encoding: str):
+        response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        return response
+
+    def _compress_cached(self, response, data: bytes, etag: str):
+        encoding = self.choose_encoding(CACHED_ENCODINGS)
+        if encoding is None:
+            response.vary.add("Accept-Encoding")
+            return response
+
+        key = (request.full_path, etag, encoding)
+        body = _compressed_bodies.get(key)
+        if body is None:
+            compression_cache_stats.incr("misses")
+            body = compress_body(data, encoding, CACHED_LEVELS[encoding])
+            if len(data) <= COMPRESS_CACHE_MAX_SIZE:
+                _compressed_bodies.set(key, body)
+        else:
+            compression_cache_stats.incr("hits")
+
+        response.set_data(body)
+        COMPRESSED_RESPONSES.inc(encoding, "cached")
+        return self._set_encoding(response, encoding)
+
+    def _compress_stream(self, response):
+        encoding = self.choose_encoding(STREAM_ENCODINGS)
+        if encoding is None:
+            return response
+        compressor = StreamCompressor(encoding, STREAM_LEVELS[encoding])
+        response.response = _compress_stream(response.response, compressor)
+        response.headers.pop("Content-Length", None)
+        COMPRESSED_RESPONSES.inc(encoding, "stream")
+        return self._set_encoding(response, encoding)
+
+
 global compress
-compress = Compress()
+compress = CompressionPolicy()
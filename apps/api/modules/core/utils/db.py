@@ -1,5 +1,22 @@
-from sqlalchemy import func
+import atexit
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Iterator, Optional, Sequence
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.sql import Select
+
 from ..db.primary import primary_db as db
+from .log import logger
+
+# Callbacks to run after the current unit of work commits, `None` when there
+# is no unit of work in progress
+_unit_of_work: ContextVar[Optional[list]] = ContextVar("unit_of_work", default=None)
 
 
 class PrimaryDBUtils:
@@ -11,6 +28,8 @@ class PrimaryDBUtils:
     def persist(self) -> None:
         """
         Save the object to DB. This can be overwritten where neeeded.
+
+        Inside a `unit_of_work()` the commit is deferred to the end of it.
         """
         # Check if there is a `modified_ts` column and update that
         if getattr(self, "modified_ts", None) is not None:
@@ -18,4 +37,266 @@ class PrimaryDBUtils:
 
         # Save
         db.session.add(self)
+        commit()
+
+
+# =============================================================================
+# Unit of work
+# =============================================================================
+
+
+@contextmanager
+def unit_of_work() -> Iterator:
+    """
+    Group writes into a single transaction.
+
+    `persist()`, `create()` and `commit()` calls made inside the block only add
+    to the session; everything is committed once when the block exits, or
+    rolled back if it raises. Nested blocks join the outermost one. Call
+    `db.session.flush()` when a generated id is needed before the end.
+
+        with unit_of_work():
+            user_message.persist()
+            assistant_message.persist()
+            thread.persist()
+    """
+    if _unit_of_work.get() is not None:
+        yield db.session
+        return
+
+    callbacks: list[Callable[[], Any]] = []
+    token = _unit_of_work.set(callbacks)
+    try:
+        yield db.session
         db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    finally:
+        _unit_of_work.reset(token)
+
+    for callback in callbacks:
+        callback()
+
+
+def in_unit_of_work() -> bool:
+    return _unit_of_work.get() is not None
+
+
+def commit() -> None:
+    """
+    Commit the session, or leave it to the current unit of work.
+    """
+    if _unit_of_work.get() is None:
+        db.session.commit()
+
+
+def on_commit(callback: Callable[[], Any]) -> None:
+    """
+    Run `callback` once the pending writes are committed: right away outside
+    of a unit of work, at the end of it otherwise.
+    """
+    callbacks = _unit_of_work.get()
+    if callbacks is None:
+        callback()
+    else:
+        callbacks.append(callback)
+
+
+# =============================================================================
+# Bulk writes
+# =============================================================================
+
+
+def bulk_insert_returning(
+    model, rows: Sequence[dict], returning: Optional[Sequence] = None
+) -> list:
+    """
+    Insert many rows with a single `INSERT ... RETURNING` round trip.
+
+    Rows are plain dicts of column values (model `__init__` is not called).
+    Commits unless called inside a `unit_of_work()`.
+
+    Returns:
+        list: The `returning` columns (the primary key by default) of each
+        inserted row, in the order of `rows`
+    """
+    if not rows:
+        return []
+
+    if returning is None:
+        returning = model.__mapper__.primary_key
+
+    result = db.session.execute(
+        insert(model).returning(*returning, sort_by_parameter_order=True), list(rows)
+    )
+    inserted = result.all()
+    commit()
+    return inserted
+
+
+# =============================================================================
+# Reads
+# =============================================================================
+
+
+class Projection:
+    """
+    The columns a read path needs, and the record type of its rows: a named
+    tuple of the column keys (no `__dict__`, no identity map, no ORM state).
+    Listings that only show a few columns should read them this way rather
+    than load model instances.
+
+        AUTHOR = Projection("Author", User.id, User.uuid, User.name)
+        authors = AUTHOR.all(AUTHOR.select().where(User.workspace_id == 1))
+    """
+
+    def __init__(self, name: str, *columns) -> None:
+        self.columns = columns
+        self.record = namedtuple(name, [column.key for column in columns])
+
+    def select(self) -> Select:
+        return select(*self.columns)
+
+    def all(self, statement) -> list:
+        return list(map(self.record._make, db.session.execute(statement).tuples()))
+
+    def one_or_none(self, statement) -> Optional[tuple]:
+        row = db.session.execute(statement).one_or_none()
+        return None if row is None else self.record._make(row)
+
+    def index_of(self, column) -> int:
+        # Compared by identity, `==` makes a SQL expression
+        for i, selected in enumerate(self.columns):
+            if selected is column:
+                return i
+        raise ValueError(f"{column} is not a column of the projection")
+
+
+def prefetch(projection: Projection, key_column, keys: Iterable) -> dict:
+    """
+    Records of the rows whose `key_column` (a column of `projection`) is one
+    of `keys`, in a single query, e.g. the authors of a page of messages
+    rather than a query per message.
+
+    Returns:
+        dict: The records by key, missing rows are left out
+    """
+    keys = {key for key in keys if key is not None}
+    if not keys:
+        return {}
+    index = projection.index_of(key_column)
+    records = projection.all(projection.select().where(key_column.in_(keys)))
+    return {record[index]: record for record in records}
+
+
+@lru_cache(maxsize=None)
+def get_user_projection() -> Projection:
+    """
+    Columns of a user shown next to their messages.
+    """
+    # Imported here to avoid a circular import with the model modules
+    from ..models.unified import get_unified_user
+
+    User = get_unified_user()
+    return Projection("UserRecord", User.id, User.uuid, User.name)
+
+
+def prefetch_users(user_ids: Iterable[Optional[int]]) -> dict[int, tuple]:
+    """
+    `get_user_projection()` records of users, by id, in a single query.
+    """
+    projection = get_user_projection()
+    return prefetch(projection, projection.columns[0], user_ids)
+
+
+# =============================================================================
+# Write-behind
+# =============================================================================
+
+
+class WriteBehindQueue:
+    """
+    Background writer for non-critical metadata, e.g. bumping the
+    `modified_ts` of a thread on every message.
+
+    Writes are coalesced per model and flushed every `interval` seconds in a
+    single transaction, off the request thread. Pending writes are lost if the
+    process is killed, so never use it for data that matters.
+    """
+
+    def __init__(self, interval: float = 1.0) -> None:
+        self.interval = interval
+        self._app = None
+        self._touched: dict[Any, set] = {}
+        self._flush_listeners: list[Callable[[Any, set], Any]] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def init_app(self, app) -> None:
+        self._app = app
+        atexit.register(self.flush)
+
+    # -------------------------------------------------------------------------
+
+    def touch(self, model, row_id: int) -> None:
+        """
+        Set `modified_ts` of a row to the time of the next flush.
+        """
+        with self._lock:
+            self._touched.setdefault(model, set()).add(row_id)
+        self._ensure_worker()
+
+    def add_flush_listener(self, listener: Callable[[Any, set], Any]) -> None:
+        """
+        Call `listener(model, row_ids)` after every flush has been committed,
+        in the app context of the flush.
+        """
+        self._flush_listeners.append(listener)
+
+    # -------------------------------------------------------------------------
+
+    def _ensure_worker(self) -> None:
+        # Started on first use, and again in a forked child
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run, name="db-write-behind", daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed.")
+
+    def flush(self) -> None:
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if not touched or self._app is None:
+            return
+
+        with self._app.app_context():
+            for model, row_ids in touched.items():
+                db.session.execute(
+                    update(model)
+                    .where(model.id.in_(row_ids))
+                    .values(modified_ts=func.now())
+                )
+            db.session.commit()
+
+            for model, row_ids in touched.items():
+                for listener in self._flush_listeners:
+                    try:
+                        listener(model, row_ids)
+                    except Exception:
+                        logger.exception("Write-behind flush listener failed.")
+
+
+write_behind = WriteBehindQueue(
+    interval=float(os.environ.get("STEAGO_WRITE_BEHIND_INTERVAL", 1.0))
+)
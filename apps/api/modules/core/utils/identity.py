@@ -0,0 +1,228 @@
+"""
+Identity cache for JWT user lookups.
+
+`user_lookup_callback` runs on every authenticated request, so instead of
+querying Postgres each time we keep a compact snapshot of the user (and the
+status of their workspace) in two tiers:
+
+    1. A small in-process LRU with a short TTL (per worker)
+    2. The shared Flask-Caching backend with a longer TTL
+
+Snapshots are invalidated explicitly whenever a user is written through
+`PrimaryDBUtils.persist` or `CoreUser.create`, and those of all the users of a
+workspace when the workspace is written (they carry its status) or deleted.
+Other workers may keep serving their local copy for at most
+`IDENTITY_CACHE_LOCAL_TTL` seconds.
+
+The same writes replace the version of the users of the workspace
+(`get_users_version`), which responses showing user names are validated with.
+"""
+
+import os
+import uuid
+from typing import Any, NamedTuple, Optional
+from uuid import UUID
+
+from flask import g as flask_g
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy import select
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from ..db.primary import primary_db as db
+from ..db.replica import pin_to_primary, use_replica
+from .cache import cache
+from .lru import CacheStats, LRUCache
+
+IDENTITY_CACHE_TIMEOUT = int(os.environ.get("STEAGO_IDENTITY_CACHE_TIMEOUT", 300))
+IDENTITY_CACHE_NEGATIVE_TIMEOUT = int(
+    os.environ.get("STEAGO_IDENTITY_CACHE_NEGATIVE_TIMEOUT", 30)
+)
+IDENTITY_CACHE_LOCAL_TTL = float(os.environ.get("STEAGO_IDENTITY_CACHE_LOCAL_TTL", 10))
+IDENTITY_CACHE_LOCAL_SIZE = int(os.environ.get("STEAGO_IDENTITY_CACHE_LOCAL_SIZE", 4096))
+
+# Stored in place of a snapshot when the identity does not exist. Flask-Caching
+# returns `None` for a miss, so we need something falsy that is not `None`.
+_UNKNOWN_IDENTITY = False
+
+_local_cache = LRUCache(maxsize=IDENTITY_CACHE_LOCAL_SIZE, ttl=IDENTITY_CACHE_LOCAL_TTL)
+
+
+# =============================================================================
+
+
+class IdentitySnapshot(NamedTuple):
+    """
+    Compact, picklable copy of a user row plus the status of its workspace.
+    """
+
+    # Column attribute values of the user model, keyed by attribute name
+    columns: dict[str, Any]
+    workspace_status: int
+
+    @property
+    def id(self) -> int:
+        return self.columns["id"]
+
+    @property
+    def uuid(self) -> UUID:
+        return self.columns["uuid"]
+
+    @property
+    def status(self) -> int:
+        return self.columns["status"]
+
+    @property
+    def workspace_id(self) -> int:
+        return self.columns["workspace_id"]
+
+
+# Per-process hit / miss counters
+identity_cache_stats = CacheStats(("local_hits", "shared_hits", "misses", "invalidations"))
+
+
+# =============================================================================
+
+
+def _cache_key(identity: Any) -> str:
+    return f"identity:{identity}"
+
+
+def _snapshot_from_db(identity: Any) -> Optional[IdentitySnapshot]:
+    # Imported here to avoid a circular import with the model modules
+    from ..models.unified import get_unified_user, get_unified_workspace
+
+    User = get_unified_user()
+    Workspace = get_unified_workspace()
+
+    with use_replica(f"user:{identity}"):
+        row = (
+            db.session.query(User, Workspace.status)
+            .join(Workspace, Workspace.id == User.workspace_id)
+            .filter(User.uuid == identity)
+            .one_or_none()
+        )
+    if row is None:
+        return None
+
+    user, workspace_status = row
+    columns = {
+        attr.key: getattr(user, attr.key) for attr in sa_inspect(User).column_attrs
+    }
+    return IdentitySnapshot(columns=columns, workspace_status=workspace_status)
+
+
+def get_identity_snapshot(identity: Any) -> Optional[IdentitySnapshot]:
+    """
+    Get the cached snapshot for a JWT identity (user uuid), loading it from the
+    DB on a miss.
+
+    Returns:
+        IdentitySnapshot: The snapshot, or `None` if the user does not exist
+    """
+    key = _cache_key(identity)
+
+    snapshot = _local_cache.get(key)
+    if snapshot is not None:
+        identity_cache_stats.incr("local_hits")
+        return snapshot or None
+
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        identity_cache_stats.incr("shared_hits")
+        _local_cache.set(key, snapshot)
+        return snapshot or None
+
+    identity_cache_stats.incr("misses")
+    snapshot = _snapshot_from_db(identity)
+    if snapshot is None:
+        cache.set(key, _UNKNOWN_IDENTITY, timeout=IDENTITY_CACHE_NEGATIVE_TIMEOUT)
+        _local_cache.set(key, _UNKNOWN_IDENTITY)
+        return None
+
+    cache.set(key, snapshot, timeout=IDENTITY_CACHE_TIMEOUT)
+    _local_cache.set(key, snapshot)
+    return snapshot
+
+
+def load_identity(identity: Any):
+    """
+    Resolve a JWT identity to a user model instance attached to the current
+    session, without querying the DB when the snapshot is cached.
+
+    The snapshot itself is kept on `flask_g.identity_snapshot` so that request
+    handlers can read the workspace status without another lookup.
+
+    Returns:
+        UnifiedUserProtocol: The user, or `None` if the user does not exist
+    """
+    snapshot = get_identity_snapshot(identity)
+    flask_g.identity_snapshot = snapshot
+    if snapshot is None:
+        return None
+
+    from ..models.unified import get_unified_user
+
+    # Rebuild a "clean" instance from the snapshot and merge it into the
+    # session without loading, so it behaves exactly like a queried row.
+    User = get_unified_user()
+    user = sa_inspect(User).class_manager.new_instance()
+    for key, value in snapshot.columns.items():
+        set_committed_value(user, key, value)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def invalidate_identity(identity: Any, workspace_id: Optional[int] = None) -> None:
+    """
+    Drop the cached snapshot of a user, and the users version of its
+    workspace (if given). Call this after the user is written.
+    """
+    key = _cache_key(identity)
+    _local_cache.delete(key)
+    cache.delete(key)
+    if workspace_id is not None:
+        cache.delete(_users_version_key(workspace_id))
+    # The next lookup must not read a replica that has not caught up yet
+    pin_to_primary(f"user:{identity}")
+    identity_cache_stats.incr("invalidations")
+
+
+def invalidate_workspace_identities(workspace_id: int) -> None:
+    """
+    Drop the cached snapshots of the users of a workspace. Call this after
+    the workspace is written, and before its users are deleted.
+    """
+    from ..models.unified import get_unified_user
+
+    User = get_unified_user()
+    uuids = db.session.scalars(select(User.uuid).where(User.workspace_id == workspace_id)).all()
+    if not uuids:
+        return
+    keys = [_cache_key(user_uuid) for user_uuid in uuids]
+    for key in keys:
+        _local_cache.delete(key)
+    cache.delete_many(*keys)
+    pin_to_primary(*[f"user:{user_uuid}" for user_uuid in uuids])
+    identity_cache_stats.incr("invalidations")
+
+
+# =============================================================================
+
+
+def _users_version_key(workspace_id: int) -> str:
+    return f"identity:users-version:{workspace_id}"
+
+
+def get_users_version(workspace_id: int) -> str:
+    """
+    Version of the users of a workspace, replaced whenever one is written.
+    """
+    key = _users_version_key(workspace_id)
+    version = cache.get(key)
+    if version is None:
+        # Random, so that a dropped entry never brings back an older version
+        version = uuid.uuid4().hex[:16]
+        if not cache.add(key, version, timeout=0):
+            version = cache.get(key) or version
+    return version
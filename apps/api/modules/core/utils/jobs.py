@@ -0,0 +1,418 @@
+"""
+Durable background jobs, queued in Postgres.
+
+Jobs are rows of `core_job`. Workers claim them one at a time with
+`FOR UPDATE SKIP LOCKED`, so any number of worker processes can share the
+queue without blocking each other. Failed jobs are retried with exponential
+backoff, up to their `max_attempts`.
+
+A job not finished within `JOB_TIMEOUT` is considered lost and queued again.
+Each claim increments `attempts`, which fences the outcome: a worker that
+outlived its claim records nothing. Handlers running for longer call
+`refresh_job_lock()` now and then to keep their claim.
+
+    @job_handler("core.delete_workspace")
+    def delete_workspace(workspace_id: int) -> None:
+        ...
+
+    enqueue_job("core.delete_workspace", {"workspace_id": 1},
+                idempotency_key="core.delete_workspace:1")
+
+Run the workers with `flask jobs-worker --processes 4`.
+"""
+
+import importlib
+import multiprocessing
+import os
+import random
+import signal
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional, Sequence
+
+from pytz import utc
+from sqlalchemy import Row, delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+
+from ..db.primary import primary_db as db
+from ..models.enums import JOB_STATUS
+from ..models.job import ACTIVE_JOB_PREDICATE, CoreJob
+from .db import commit
+from .log import logger
+
+# Seconds between polls of an idle worker
+JOB_POLL_INTERVAL = float(os.environ.get("STEAGO_JOB_POLL_INTERVAL", 1.0))
+# Running jobs not finished after this many seconds are considered lost (the
+# worker died) and queued again
+JOB_TIMEOUT = float(os.environ.get("STEAGO_JOB_TIMEOUT", 900))
+
+JOB_RETRY_BASE_DELAY = 5.0
+JOB_RETRY_MAX_DELAY = 3600.0
+JOB_DEFAULT_MAX_ATTEMPTS = 5
+
+# Seconds between two runs of the periodic tasks (schedulers) of a worker
+JOB_SCHEDULE_INTERVAL = 60.0
+# Finished jobs are kept this many days for inspection
+JOB_RETENTION_DAYS = int(os.environ.get("STEAGO_JOB_RETENTION_DAYS", 7))
+JOB_PURGE_CHUNK_SIZE = 1000
+
+JOB_LOST_ERROR = "Lost (worker timeout)"
+
+# Modules registering job handlers and schedulers, imported by the workers
+JOB_MODULES = (
+    "modules.core.utils.workspace_cleanup",
+    "modules.ai.utils.jobs",
+    "modules.chat.utils.jobs",
+)
+
+_handlers: dict[str, Callable[..., Any]] = {}
+_schedulers: list[Callable[[], Any]] = []
+
+
+def job_handler(kind: str) -> Callable:
+    """
+    Register the function running the jobs of `kind`. It is called with the
+    job payload as keyword arguments, and must be safe to run again (after a
+    failure or a lost worker).
+    """
+
+    def decorator(function: Callable) -> Callable:
+        _handlers[kind] = function
+        return function
+
+    return decorator
+
+
+def job_scheduler(function: Callable[[], Any]) -> Callable[[], Any]:
+    """
+    Register a function run periodically by the workers, e.g. to enqueue the
+    jobs of rows in a given state. Use idempotency keys, every worker runs it.
+    """
+    _schedulers.append(function)
+    return function
+
+
+def load_job_modules() -> None:
+    for module in JOB_MODULES:
+        importlib.import_module(module)
+
+
+# =============================================================================
+# Enqueueing
+# =============================================================================
+
+
+def enqueue_job(
+    kind: str,
+    payload: Optional[dict] = None,
+    priority: int = 0,
+    idempotency_key: Optional[str] = None,
+    delay: float = 0,
+    max_attempts: int = JOB_DEFAULT_MAX_ATTEMPTS,
+) -> Optional[int]:
+    """
+    Queue a job. Inside a `unit_of_work()`, the job is committed (and visible
+    to the workers) with the rest of it.
+
+    With an `idempotency_key`, nothing is queued while a job with the same key
+    is queued or running.
+
+    Returns:
+        int: The id of the job, or `None` if an identical one is pending
+    """
+    now = datetime.now(tz=utc)
+    stmt = insert(CoreJob).values(
+        kind=kind,
+        payload=payload or {},
+        idempotency_key=idempotency_key,
+        status=JOB_STATUS.QUEUED,
+        priority=priority,
+        run_at=now + timedelta(seconds=delay),
+        max_attempts=max_attempts,
+        created_ts=now,
+        modified_ts=now,
+    )
+    if idempotency_key is not None:
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=[CoreJob.idempotency_key],
+            index_where=text(ACTIVE_JOB_PREDICATE),
+        )
+    job_id = db.session.execute(stmt.returning(CoreJob.id)).scalar()
+    commit()
+    return job_id
+
+
+# =============================================================================
+# Running
+# =============================================================================
+
+
+def claim_job(kinds: Optional[Sequence[str]] = None) -> Optional[Row]:
+    """
+    Claim the next due job (highest priority, then oldest), skipping the rows
+    locked by other workers.
+
+    Returns:
+        Row: `id`, `kind`, `payload`, `attempts` and `max_attempts` of the
+        job, or `None` if no job is due
+    """
+    candidate = (
+        select(CoreJob.id)
+        .where(CoreJob.status == JOB_STATUS.QUEUED, CoreJob.run_at <= func.now())
+        .order_by(CoreJob.priority.desc(), CoreJob.run_at, CoreJob.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    if kinds:
+        candidate = candidate.where(CoreJob.kind.in_(kinds))
+
+    job = db.session.execute(
+        update(CoreJob)
+        .where(CoreJob.id == candidate.scalar_subquery())
+        .values(
+            status=JOB_STATUS.RUNNING,
+            attempts=CoreJob.attempts + 1,
+            locked_at=func.now(),
+            modified_ts=func.now(),
+        )
+        .returning(
+            CoreJob.id, CoreJob.kind, CoreJob.payload, CoreJob.attempts, CoreJob.max_attempts
+        )
+    ).one_or_none()
+    db.session.commit()
+    return job
+
+
+def get_retry_delay(attempts: int) -> float:
+    """
+    Exponential backoff with jitter, in seconds.
+    """
+    delay = min(JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1), JOB_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _is_claimed(job_id: int, attempts: int) -> tuple:
+    # Still running under this claim, not queued again (and claimed since)
+    return (
+        CoreJob.id == job_id,
+        CoreJob.status == JOB_STATUS.RUNNING,
+        CoreJob.attempts == attempts,
+    )
+
+
+def _finish_job(job_id: int, attempts: int, **values: Any) -> None:
+    result = db.session.execute(
+        update(CoreJob)
+        .where(*_is_claimed(job_id, attempts))
+        .values(locked_at=None, modified_ts=func.now(), **values)
+    )
+    db.session.commit()
+    if not result.rowcount:
+        logger.warning(f"Job {job_id} was queued again while it ran, outcome dropped.")
+
+
+# The job the worker is running: (id, attempts)
+_running_job: Optional[tuple[int, int]] = None
+
+
+def refresh_job_lock() -> bool:
+    """
+    Keep the claim of the running job for another `JOB_TIMEOUT`. Call it
+    from handlers that may run longer than that. Runs on its own connection,
+    the handler's transaction is left alone.
+
+    Returns:
+        bool: Whether the job is still claimed (stop if not, another worker
+        may be running it)
+    """
+    if _running_job is None:
+        return False
+    with db.engine.begin() as connection:
+        result = connection.execute(
+            update(CoreJob).where(*_is_claimed(*_running_job)).values(locked_at=func.now())
+        )
+    return bool(result.rowcount)
+
+
+def run_job(job: Row) -> bool:
+    """
+    Run a claimed job and record the outcome.
+
+    Returns:
+        bool: Whether the job succeeded
+    """
+    global _running_job
+    job_id, kind, payload, attempts, max_attempts = job
+
+    handler = _handlers.get(kind)
+    _running_job = (job_id, attempts)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler for job kind: {kind}")
+        handler(**payload)
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc(limit=20)
+        if attempts >= max_attempts:
+            logger.exception(f"Job {job_id} ({kind}) failed, giving up.")
+            _finish_job(job_id, attempts, status=JOB_STATUS.FAILED, last_error=error)
+        else:
+            delay = get_retry_delay(attempts)
+            logger.warning(f"Job {job_id} ({kind}) failed, retrying in {delay:.0f}s.")
+            _finish_job(
+                job_id,
+                attempts,
+                status=JOB_STATUS.QUEUED,
+                run_at=func.now() + timedelta(seconds=delay),
+                last_error=error,
+            )
+        return False
+    finally:
+        _running_job = None
+
+    _finish_job(job_id, attempts, status=JOB_STATUS.SUCCEEDED, last_error=None)
+    return True
+
+
+def requeue_lost_jobs() -> int:
+    """
+    Queue again the running jobs whose worker died (not finished, nor their
+    lock refreshed, within `JOB_TIMEOUT`). This counts as a failed attempt.
+
+    Returns:
+        int: The number of jobs queued again
+    """
+    lost = (
+        CoreJob.status == JOB_STATUS.RUNNING,
+        CoreJob.locked_at < func.now() - timedelta(seconds=JOB_TIMEOUT),
+    )
+    values = {"locked_at": None, "last_error": JOB_LOST_ERROR, "modified_ts": func.now()}
+
+    db.session.execute(
+        update(CoreJob)
+        .where(*lost, CoreJob.attempts >= CoreJob.max_attempts)
+        .values(status=JOB_STATUS.FAILED, **values)
+    )
+    result = db.session.execute(
+        update(CoreJob)
+        .where(*lost)
+        .values(status=JOB_STATUS.QUEUED, run_at=func.now(), **values)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def purge_finished_jobs() -> int:
+    """
+    Delete the jobs finished more than `JOB_RETENTION_DAYS` ago, in chunks.
+
+    Returns:
+        int: The number of jobs deleted
+    """
+    count = 0
+    while True:
+        chunk = (
+            select(CoreJob.id)
+            .where(
+                CoreJob.status.in_([JOB_STATUS.SUCCEEDED, JOB_STATUS.FAILED]),
+                CoreJob.modified_ts < func.now() - timedelta(days=JOB_RETENTION_DAYS),
+            )
+            .limit(JOB_PURGE_CHUNK_SIZE)
+        )
+        result = db.session.execute(delete(CoreJob).where(CoreJob.id.in_(chunk)))
+        db.session.commit()
+        count += result.rowcount
+        if result.rowcount < JOB_PURGE_CHUNK_SIZE:
+            return count
+
+
+def run_schedulers() -> None:
+    for scheduler in (requeue_lost_jobs, purge_finished_jobs, *_schedulers):
+        try:
+            scheduler()
+        except Exception:
+            db.session.rollback()
+            logger.exception(f"Job scheduler {scheduler.__name__} failed.")
+
+
+# =============================================================================
+# Workers
+# =============================================================================
+
+
+class _Stop:
+    requested = False
+
+
+def run_worker(app, kinds: Optional[Sequence[str]] = None, max_jobs: Optional[int] = None) -> int:
+    """
+    Claim and run jobs until stopped (SIGTERM / SIGINT) or `max_jobs` ran.
+
+    Returns:
+        int: The number of jobs run
+    """
+    load_job_modules()
+    count = 0
+    next_schedule = 0.0
+
+    with app.app_context():
+        while not _Stop.requested and (max_jobs is None or count < max_jobs):
+            if time.monotonic() >= next_schedule:
+                run_schedulers()
+                next_schedule = time.monotonic() + JOB_SCHEDULE_INTERVAL
+
+            job = claim_job(kinds)
+            if job is None:
+                db.session.remove()
+                time.sleep(JOB_POLL_INTERVAL)
+                continue
+
+            run_job(job)
+            db.session.remove()
+            count += 1
+    return count
+
+
+def _worker_process(app_factory: str, kinds: Optional[Sequence[str]]) -> None:
+    # Finish the running job, then exit
+    signal.signal(signal.SIGTERM, lambda *_: setattr(_Stop, "requested", True))
+    signal.signal(signal.SIGINT, lambda *_: setattr(_Stop, "requested", True))
+
+    module, _, name = app_factory.partition(":")
+    app = getattr(importlib.import_module(module), name)()
+    run_worker(app, kinds)
+
+
+def run_worker_pool(
+    processes: int, kinds: Optional[Sequence[str]] = None, app_factory: str = "steago:create_app"
+) -> None:
+    """
+    Run `processes` worker processes, restarting the ones that die, until
+    stopped (SIGTERM / SIGINT).
+    """
+    context = multiprocessing.get_context("spawn")
+    workers: list = []
+
+    def stop(*_):
+        _Stop.requested = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info(f"Starting {processes} job workers.")
+    while not _Stop.requested:
+        workers = [worker for worker in workers if worker.is_alive()]
+        for _ in range(processes - len(workers)):
+            worker = context.Process(
+                target=_worker_process, args=(app_factory, kinds), daemon=False
+            )
+            worker.start()
+            workers.append(worker)
+        time.sleep(1)
+
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.join()
+    logger.info("Job workers stopped.")
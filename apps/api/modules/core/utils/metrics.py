@@ -0,0 +1,402 @@
+"""
+Prometheus metrics, served on `/metrics` in the text exposition format.
+
+    REQUESTS = Counter("steago_x_total", "Things done.", ("kind",))
+    REQUESTS.inc("a")
+
+    LATENCY = Histogram("steago_x_seconds", "Time doing things.", ("kind",))
+    LATENCY.observe(0.12, "a")
+
+Updates never take a lock: every thread writes to its own shard (a dict) and
+a scrape sums the shards. The shards of finished threads are folded into a
+retired shard, so short-lived threads do not accumulate. Values such as pool
+sizes or cache counters, which already exist elsewhere, are read at scrape
+time by collectors instead.
+
+Metrics are per process. With several workers, each worker only reports its
+own requests, which is what Prometheus expects from one target per process.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Iterable, Optional
+
+from flask import Response, abort, request
+from flask import g as flask_g
+
+from .log import logger
+
+# Bearer token required to scrape. Without one `/metrics` is only served in
+# debug mode.
+METRICS_TOKEN = os.environ.get("STEAGO_METRICS_TOKEN")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# =============================================================================
+# Storage
+# =============================================================================
+
+
+class _Shards:
+    """
+    Per-thread metric values, keyed by `(name, labels)`.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        # (thread, values) of every thread that recorded something
+        self._shards: list[tuple[threading.Thread, dict]] = []
+        self._retired: dict = {}
+        # Only taken when a thread records its first value, and by scrapes
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), values))
+            return values
+
+    def collect(self) -> list[dict]:
+        with self._lock:
+            alive = []
+            for thread, values in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, values))
+                else:
+                    _merge(self._retired, values)
+            self._shards = alive
+            return [self._retired.copy()] + [values.copy() for _, values in alive]
+
+
+def _merge(into: dict, values: dict) -> None:
+    for key, value in values.items():
+        current = into.get(key)
+        if current is None:
+            into[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            into[key] = [a + b for a, b in zip(current, value)]
+        else:
+            into[key] = current + value
+
+
+_shards = _Shards()
+_metrics: dict[str, "Metric"] = {}
+_collectors: list[Callable[[], Iterable[tuple]]] = []
+
+
+# =============================================================================
+# Metrics
+# =============================================================================
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _metrics[name] = self
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        values = _shards.get()
+        key = (self.name, labels)
+        values[key] = values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels) -> None:
+        values = _shards.get()
+        key = (self.name, labels)
+        # Per bucket counts (not cumulative), then the sum
+        entry = values.get(key)
+        if entry is None:
+            entry = values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+
+def register_collector(collector: Callable[[], Iterable[tuple]]) -> None:
+    """
+    Register a function read at scrape time, yielding
+    `(name, type, documentation, [(labels_dict, value), ...])`.
+    """
+    _collectors.append(collector)
+
+
+# =============================================================================
+# Exposition
+# =============================================================================
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metrics() -> str:
+    """
+    All the metrics of the process, in the Prometheus text format.
+    """
+    totals: dict = {}
+    for values in _shards.collect():
+        _merge(totals, values)
+
+    samples: dict[str, list] = {name: [] for name in _metrics}
+    for (name, labels), value in totals.items():
+        samples[name].append((labels, value))
+
+    lines = []
+    for name, metric in _metrics.items():
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.type}")
+        for labels, value in sorted(samples[name], key=lambda sample: sample[0]):
+            labels = dict(zip(metric.labelnames, labels))
+            if metric.type != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float("inf"),), value[:-1]):
+                cumulative += count
+                bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    for collector in _collectors:
+        try:
+            collected = list(collector())
+        except Exception:
+            # A broken collector must not take the other metrics down
+            logger.exception(f"Metrics collector {collector.__name__} failed.")
+            continue
+        for name, type_, documentation, samples in collected:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {type_}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    lines.append("")
+    return "\n".join(lines)
+
+
+# =============================================================================
+# Instrumentation
+# =============================================================================
+
+
+HTTP_REQUESTS = Counter(
+    "steago_http_requests_total", "HTTP requests.", ("endpoint", "method", "status")
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "steago_http_request_duration_seconds",
+    "Time to handle an HTTP request (to the first byte of streamed responses).",
+    ("endpoint", "method"),
+)
+HTTP_REQUEST_DB_QUERIES = Histogram(
+    "steago_http_request_db_queries",
+    "DB queries per HTTP request.",
+    ("endpoint",),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+HTTP_REQUEST_DB_SECONDS = Histogram(
+    "steago_http_request_db_seconds", "DB time per HTTP request.", ("endpoint",)
+)
+DB_QUERY_SECONDS = Histogram("steago_db_query_duration_seconds", "DB query time.")
+
+LLM_REQUEST_SECONDS = Histogram(
+    "steago_llm_request_duration_seconds",
+    "LLM provider call time (to the end of the stream for streamed calls).",
+    ("provider", "model", "kind", "outcome"),
+)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "steago_llm_time_to_first_token_seconds",
+    "Time to the first streamed token.",
+    ("provider", "model"),
+)
+LLM_TOKENS = Counter(
+    "steago_llm_tokens_total",
+    "LLM tokens, prompt or completion (streamed chunks count as one token each).",
+    ("provider", "model", "type"),
+)
+
+# [query count, query seconds] of the current request, `None` outside of one
+_request_db: ContextVar[Optional[list]] = ContextVar("request_db", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the execution context, which goes away with the statement even when
+    # it fails (the connection outlives it in the pool)
+    if context is not None:
+        context._metrics_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, "_metrics_started_at", None)
+    if started_at is None:
+        return
+    elapsed = time.perf_counter() - started_at
+    DB_QUERY_SECONDS.observe(elapsed)
+    stats = _request_db.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def _start_request_timer() -> None:
+    flask_g.metrics_started_at = time.perf_counter()
+    _request_db.set([0, 0.0])
+
+
+def _record_request(response):
+    started_at = getattr(flask_g, "metrics_started_at", None)
+    if started_at is None:
+        return response
+    elapsed = time.perf_counter() - started_at
+    endpoint = request.endpoint or "unmatched"
+
+    HTTP_REQUESTS.inc(endpoint, request.method, response.status_code)
+    HTTP_REQUEST_SECONDS.observe(elapsed, endpoint, request.method)
+    stats = _request_db.get()
+    if stats is not None:
+        HTTP_REQUEST_DB_QUERIES.observe(stats[0], endpoint)
+        HTTP_REQUEST_DB_SECONDS.observe(stats[1], endpoint)
+        _request_db.set(None)
+    return response
+
+
+def observe_llm_call(provider: str, model: str, kind: str, started_at: float, outcome: str = "ok"):
+    """
+    Record a provider call that started at `time.perf_counter()` `started_at`.
+    """
+    LLM_REQUEST_SECONDS.observe(time.perf_counter() - started_at, provider, model, kind, outcome)
+
+
+# =============================================================================
+# Collectors
+# =============================================================================
+
+
+def _collect_caches():
+    from ...ai.utils.completion_cache import completion_cache_stats
+    from .compress import compression_cache_stats
+    from .identity import identity_cache_stats
+
+    samples = []
+    for cache_name, stats in (
+        ("identity", identity_cache_stats),
+        ("completion", completion_cache_stats),
+        ("compression", compression_cache_stats),
+    ):
+        for event, count in stats.as_dict().items():
+            samples.append(({"cache": cache_name, "event": event}, count))
+    yield "steago_cache_events_total", "counter", "Cache hits, misses and other events.", samples
+
+
+def _collect_db_pool():
+    from ..db.pool import get_pool_status, pool_stats
+    from ..db.primary import primary_db
+
+    stats = pool_stats.as_dict()
+    yield "steago_db_pool_checkouts_total", "counter", "Pool checkouts.", [({}, stats["checkouts"])]
+    yield "steago_db_pool_connects_total", "counter", "New DB connections.", [({}, stats["connects"])]
+    yield "steago_db_pool_timeouts_total", "counter", "Pool checkouts that timed out.", [
+        ({}, stats["timeouts"])
+    ]
+    yield "steago_db_pool_wait_seconds_total", "counter", "Time waiting for a connection.", [
+        ({}, stats["wait_seconds"])
+    ]
+
+    samples = []
+    for bind, engine in primary_db.engines.items():
+        status = get_pool_status(engine)
+        for state, count in (status or {}).items():
+            samples.append(({"bind": bind or "primary", "state": state}, count))
+    yield "steago_db_pool_connections", "gauge", "Connections of the pool, by state.", samples
+
+
+def _collect_background():
+    from .analytics import analytics_queue
+    from .realtime import realtime_hub
+    from .status import status_snapshot
+
+    yield "steago_realtime_dropped_events_total", "counter", "Realtime events dropped.", [
+        ({}, realtime_hub.dropped)
+    ]
+    yield "steago_analytics_dropped_events_total", "counter", "Analytics events dropped.", [
+        ({}, analytics_queue.dropped)
+    ]
+    yield "steago_status_snapshot_age_seconds", "gauge", "Age of the status snapshot.", [
+        ({}, time.monotonic() - status_snapshot.confirmed_at)
+    ]
+
+
+# =============================================================================
+
+
+def metrics_endpoint():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        abort(401)
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+
+def init_metrics(app) -> None:
+    """
+    Time the requests and DB queries of `app`, and serve `/metrics` (with
+    `STEAGO_METRICS_TOKEN` set, or in debug mode).
+    """
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    app.before_request(_start_request_timer)
+    app.after_request(_record_request)
+    if METRICS_TOKEN or app.debug:
+        app.get("/metrics")(metrics_endpoint)
+    else:
+        logger.warning("STEAGO_METRICS_TOKEN is not set, not serving /metrics.")
+
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    if not _collectors:
+        register_collector(_collect_caches)
+        register_collector(_collect_db_pool)
+        register_collector(_collect_background)
@@ -0,0 +1,105 @@
+"""
+Keyset (cursor based) pagination.
+
+Pages are selected with a row comparison on an ordered, unique key such as
+`(created_ts, id)`, e.g. `WHERE (created_ts, id) < (:ts, :id)`. Backed by a
+matching composite index, fetching a page costs the same whether it is the
+first or the ten-thousandth one, unlike `OFFSET`.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, NamedTuple, Optional, Sequence
+
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage(NamedTuple):
+    items: list
+    # Cursor of the last item of the page, `None` when the page is empty
+    cursor: Optional[str]
+    has_more: bool
+
+
+# =============================================================================
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """
+    Encode key values into an opaque, URL safe cursor.
+    """
+    payload = [
+        {"dt": value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list[Any]:
+    """
+    Decode a cursor produced by `encode_cursor`.
+
+    Raises:
+        InvalidCursor: If the cursor is malformed or has the wrong key size
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = [
+            datetime.fromisoformat(value["dt"]) if isinstance(value, dict) else value
+            for value in payload
+        ]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Invalid pagination cursor")
+
+    if len(values) != size:
+        raise InvalidCursor("Invalid pagination cursor")
+    return values
+
+
+# =============================================================================
+
+
+def keyset_paginate(
+    query,
+    key_columns: Sequence,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    descending: bool = True,
+) -> KeysetPage:
+    """
+    Fetch one page of `query`, ordered by `key_columns`.
+
+    With `descending=True` (newest first) the page holds the rows *before* the
+    cursor, otherwise the rows *after* it. The key must be unique, so always
+    end it with the primary key.
+
+    Returns:
+        KeysetPage: The rows, the cursor of the last row and whether there are
+        more rows past it
+    """
+    key = tuple_(*key_columns)
+
+    if cursor is not None:
+        values = decode_cursor(cursor, len(key_columns))
+        query = query.filter(key < tuple_(*values) if descending else key > tuple_(*values))
+
+    order_by = [c.desc() if descending else c.asc() for c in key_columns]
+
+    # One extra row tells us whether there is a next page
+    rows = query.order_by(*order_by).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if rows:
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, c.key) for c in key_columns])
+
+    return KeysetPage(items=rows, cursor=next_cursor, has_more=has_more)
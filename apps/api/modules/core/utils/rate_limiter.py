@@ -1,12 +1,36 @@
+import math
+import os
+import threading
+from dataclasses import dataclass
+from typing import NamedTuple, Optional
+
 from .config import CONFIG
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
+
+def get_request_identity():
+    """
+    Rate limit key of a request: the user (from the JWT) when there is one,
+    so that users behind the same NAT are limited separately, else the IP.
+    """
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    if identity:
+        return f"user:{identity}"
+    return get_remote_address()
+
+
 limiter = Limiter(
-    get_remote_address,
+    get_request_identity,
     storage_uri=CONFIG.DATABASE_FLASK_LIMITER_REDIS_URI,
     storage_options={"socket_connect_timeout": 30},
-    strategy="fixed-window",  # or "moving-window"
+    # Sliding window, no bursts through at the window edges
+    strategy="moving-window",  # or "fixed-window"
 )
 
 
@@ -15,3 +39,221 @@ def flush_limiter_cache():
     # storage_uri = CONFIG.DATABASE_FLASK_LIMITER_REDIS_URI
     # r = redis.StrictRedis.from_url(storage_uri)
     # r.flushall()
+
+
+# =============================================================================
+# GCRA limiter
+# =============================================================================
+
+# Checks and updates every key of a request atomically (GCRA, one "theoretical
+# arrival time" per key, in ms). Nothing is updated unless all keys allow it.
+#
+#   KEYS: the limit keys
+#   ARGV: mode ("hit", "peek" or "deduct"), cost, then the emission interval
+#         and burst tolerance (ms) of each key
+#
+# Returns {allowed, index of the (first) limiting key, retry after in ms}.
+_GCRA_SCRIPT = """
+local mode = ARGV[1]
+local cost = tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + tonumber(time[2]) / 1000
+
+local new_tats = {}
+for i, key in ipairs(KEYS) do
+    local interval = tonumber(ARGV[1 + i * 2])
+    local burst = tonumber(ARGV[2 + i * 2])
+    local tat = tonumber(redis.call("GET", key) or now)
+    if tat < now then
+        tat = now
+    end
+
+    local increment = interval * cost
+    local new_tat = tat + increment
+    if mode ~= "deduct" then
+        local allow_at = new_tat - burst
+        if mode == "peek" then
+            allow_at = tat - burst
+        end
+        if allow_at > now then
+            return {0, i, math.ceil(allow_at - now)}
+        end
+    end
+    new_tats[i] = {new_tat, burst}
+end
+
+if mode ~= "peek" then
+    for i, key in ipairs(KEYS) do
+        local new_tat = new_tats[i][1]
+        local ttl = math.ceil(new_tat - now)
+        if ttl > 0 then
+            redis.call("SET", key, tostring(new_tat), "PX", ttl)
+        end
+    end
+end
+return {1, 0, 0}
+"""
+
+_RATE_PERIODS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """
+    `limit` units (requests, tokens) per `period` seconds. Up to `limit`
+    units can be used in a burst, after which they refill at a steady rate.
+    """
+
+    limit: int
+    period: float
+
+    @classmethod
+    def parse(cls, value: str) -> "RateLimit":
+        """
+        Parse a Flask-Limiter style limit, e.g. "60/minute" or "1000000/day".
+        """
+        limit, _, period = value.partition("/")
+        return cls(int(limit), _RATE_PERIODS[period.strip().rstrip("s")])
+
+    @property
+    def emission_interval_ms(self) -> float:
+        return self.period * 1000 / self.limit
+
+    @property
+    def burst_ms(self) -> float:
+        return self.period * 1000
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    # Key that denied the request, if any
+    key: Optional[str]
+    retry_after: float
+
+
+class GCRALimiter:
+    """
+    Redis backed GCRA limiter, checking several keys (e.g. user, workspace and
+    model) in a single atomic script call.
+    """
+
+    def __init__(self, redis_client, prefix: str = "steago:gcra") -> None:
+        self.redis = redis_client
+        self.prefix = prefix
+        self._script = redis_client.register_script(_GCRA_SCRIPT)
+
+    def _call(self, mode: str, limits: dict[str, RateLimit], cost: float) -> RateLimitResult:
+        if not limits:
+            return RateLimitResult(True, None, 0.0)
+
+        keys = list(limits)
+        args = [mode, cost]
+        for key in keys:
+            args.extend((limits[key].emission_interval_ms, limits[key].burst_ms))
+
+        allowed, index, retry_after_ms = self._script(
+            keys=[f"{self.prefix}:{key}" for key in keys], args=args
+        )
+        return RateLimitResult(
+            bool(allowed),
+            keys[index - 1] if index else None,
+            retry_after_ms / 1000,
+        )
+
+    def hit(self, limits: dict[str, RateLimit], cost: float = 1) -> RateLimitResult:
+        """
+        Use `cost` units of every limit, only if all of them allow it.
+        """
+        return self._call("hit", limits, cost)
+
+    def peek(self, limits: dict[str, RateLimit]) -> RateLimitResult:
+        """
+        Check that no limit is exhausted, without using anything.
+        """
+        return self._call("peek", limits, 0)
+
+    def deduct(self, limits: dict[str, RateLimit], cost: float) -> None:
+        """
+        Use `cost` units of every limit unconditionally, e.g. the actual tokens
+        of a reply once it is known. A limit may go into debt, which later
+        requests have to wait out.
+        """
+        self._call("deduct", limits, cost)
+
+
+# =============================================================================
+# LLM request and token quotas
+# =============================================================================
+
+LLM_USER_RATE_LIMIT = RateLimit.parse(os.environ.get("STEAGO_LLM_USER_RATE_LIMIT", "30/minute"))
+LLM_WORKSPACE_RATE_LIMIT = RateLimit.parse(
+    os.environ.get("STEAGO_LLM_WORKSPACE_RATE_LIMIT", "300/minute")
+)
+LLM_WORKSPACE_MODEL_RATE_LIMIT = RateLimit.parse(
+    os.environ.get("STEAGO_LLM_WORKSPACE_MODEL_RATE_LIMIT", "120/minute")
+)
+LLM_WORKSPACE_TOKEN_QUOTA = RateLimit.parse(
+    os.environ.get("STEAGO_LLM_WORKSPACE_TOKEN_QUOTA", "2000000/day")
+)
+
+_gcra_limiter: Optional[GCRALimiter] = None
+_gcra_limiter_lock = threading.Lock()
+
+
+def get_gcra_limiter() -> GCRALimiter:
+    global _gcra_limiter
+    if _gcra_limiter is None:
+        with _gcra_limiter_lock:
+            if _gcra_limiter is None:
+                import redis
+
+                _gcra_limiter = GCRALimiter(
+                    redis.Redis.from_url(CONFIG.DATABASE_FLASK_LIMITER_REDIS_URI)
+                )
+    return _gcra_limiter
+
+
+def set_gcra_limiter(gcra_limiter: Optional[GCRALimiter]) -> None:
+    global _gcra_limiter
+    _gcra_limiter = gcra_limiter
+
+
+def get_llm_request_limits(user_uuid, workspace_id: int, model: str) -> dict[str, RateLimit]:
+    return {
+        f"llm:user:{user_uuid}": LLM_USER_RATE_LIMIT,
+        f"llm:workspace:{workspace_id}": LLM_WORKSPACE_RATE_LIMIT,
+        f"llm:workspace:{workspace_id}:model:{model}": LLM_WORKSPACE_MODEL_RATE_LIMIT,
+    }
+
+
+def get_llm_token_quota(workspace_id: int) -> dict[str, RateLimit]:
+    return {f"llm-tokens:workspace:{workspace_id}": LLM_WORKSPACE_TOKEN_QUOTA}
+
+
+def check_llm_request(user_uuid, workspace_id: int, model: str) -> RateLimitResult:
+    """
+    Count an LLM request against the user, workspace and model limits, and
+    check that the workspace still has tokens left in its quota.
+    """
+    if not CONFIG.FLASK_LIMITER_IS_ENABLED:
+        return RateLimitResult(True, None, 0.0)
+
+    gcra_limiter = get_gcra_limiter()
+    result = gcra_limiter.peek(get_llm_token_quota(workspace_id))
+    if result.allowed:
+        result = gcra_limiter.hit(get_llm_request_limits(user_uuid, workspace_id, model))
+    return result
+
+
+def deduct_llm_tokens(workspace_id: int, tokens: int) -> None:
+    """
+    Deduct the tokens actually used by a request from the workspace quota.
+    """
+    if not CONFIG.FLASK_LIMITER_IS_ENABLED or tokens <= 0:
+        return
+    get_gcra_limiter().deduct(get_llm_token_quota(workspace_id), math.ceil(tokens))
@@ -0,0 +1,328 @@
+"""
+Real-time fan-out of chat events to the clients of a thread or channel.
+
+Events are published to the `realtime_hub`, which never blocks the caller: they
+are buffered and sent by a background thread once per time slice. Within a
+slice, token deltas of the same streamed reply are coalesced into a single
+event, and events are sent in as few backend calls as possible (batches of
+single channel events, multi channel triggers).
+
+The transport is pluggable (`STEAGO_REALTIME_BACKEND`):
+
+    pusher   Pusher Channels (default)
+    local    In-process WebSocket server, see `websocket.py`. Clients
+             authenticate with their access token, and may only follow the
+             threads and channels of their workspace.
+    none     Events are dropped
+"""
+
+import atexit
+import os
+import threading
+import time
+from functools import partial
+from typing import Optional, Union
+from uuid import UUID
+
+from .log import logger
+
+REALTIME_BACKEND = os.environ.get("STEAGO_REALTIME_BACKEND", "pusher")
+REALTIME_SLICE_INTERVAL = float(os.environ.get("STEAGO_REALTIME_SLICE_INTERVAL", 0.1))
+REALTIME_MAX_PENDING = int(os.environ.get("STEAGO_REALTIME_MAX_PENDING", 10000))
+
+DELTA_EVENT = "message-delta"
+
+
+def thread_channel(thread_uuid) -> str:
+    return f"thread-{thread_uuid}"
+
+
+def chat_channel(channel_uuid) -> str:
+    return f"channel-{channel_uuid}"
+
+
+# =============================================================================
+# Backends
+# =============================================================================
+
+
+class RealtimeBackend:
+    """
+    Transport of realtime events. Called from the hub thread only.
+    """
+
+    # Events per `trigger_batch()` call
+    max_batch_size = 10
+    # Channels per `trigger()` call
+    max_channels = 100
+
+    def trigger(self, channels: list[str], event: str, data: dict) -> None:
+        """
+        Send one event to several channels.
+        """
+        raise NotImplementedError
+
+    def trigger_batch(self, events: list[tuple[str, str, dict]]) -> None:
+        """
+        Send several `(channel, event, data)` events.
+        """
+        raise NotImplementedError
+
+
+class NullBackend(RealtimeBackend):
+    def trigger(self, channels: list[str], event: str, data: dict) -> None:
+        pass
+
+    def trigger_batch(self, events: list[tuple[str, str, dict]]) -> None:
+        pass
+
+
+class PusherBackend(RealtimeBackend):
+    def __init__(self) -> None:
+        self._client = None
+
+    @property
+    def client(self):
+        # Imported on first use, keeps the SDK out of app startup
+        if self._client is None:
+            import pusher
+
+            self._client = pusher.Pusher(
+                app_id=os.environ.get("STEAGO_PUSHER_APP_ID"),
+                key=os.environ.get("STEAGO_PUSHER_KEY"),
+                secret=os.environ.get("STEAGO_PUSHER_SECRET"),
+                cluster=os.environ.get("STEAGO_PUSHER_CLUSTER", "eu"),
+                ssl=True,
+            )
+        return self._client
+
+    def trigger(self, channels: list[str], event: str, data: dict) -> None:
+        self.client.trigger(channels, event, data)
+
+    def trigger_batch(self, events: list[tuple[str, str, dict]]) -> None:
+        self.client.trigger_batch(
+            [{"channel": channel, "name": event, "data": data} for channel, event, data in events]
+        )
+
+
+def authorize_channels(app, token: Optional[str], channels: list[str]) -> bool:
+    """
+    Check that the bearer of an access token may follow `channels`: an
+    active user, and threads and channels of their workspace only.
+    """
+    if not token or not channels:
+        return False
+
+    from flask_jwt_extended import decode_token
+    from flask_jwt_extended.exceptions import JWTExtendedException
+    from jwt import PyJWTError
+    from sqlalchemy import func, select
+
+    from ...chat.models.channel import ChatChannel
+    from ...chat.models.thread import ChatThread
+    from ..db.primary import primary_db as db
+    from .identity import get_identity_snapshot
+    from .status import is_principal_allowed
+
+    models = {"thread": ChatThread, "channel": ChatChannel}
+    uuids: dict[str, set] = {prefix: set() for prefix in models}
+    for channel in channels:
+        prefix, _, channel_uuid = channel.partition("-")
+        if prefix not in models:
+            return False
+        try:
+            uuids[prefix].add(UUID(channel_uuid))
+        except ValueError:
+            return False
+
+    with app.app_context():
+        try:
+            claims = decode_token(token)
+        except (JWTExtendedException, PyJWTError):
+            return False
+        snapshot = get_identity_snapshot(claims[app.config["JWT_IDENTITY_CLAIM"]])
+        if snapshot is None or not is_principal_allowed(snapshot.id, snapshot.workspace_id):
+            return False
+
+        for prefix, model in models.items():
+            if not uuids[prefix]:
+                continue
+            count = db.session.scalar(
+                select(func.count()).where(
+                    model.uuid.in_(uuids[prefix]), model.workspace_id == snapshot.workspace_id
+                )
+            )
+            if count != len(uuids[prefix]):
+                return False
+    return True
+
+
+class LocalBackend(RealtimeBackend):
+    # In-process, no request size limits
+    max_batch_size = 1000
+    max_channels = 1000
+
+    def __init__(self, app, host: Optional[str] = None, port: Optional[int] = None) -> None:
+        from .websocket import LocalWebSocketServer
+
+        self.server = LocalWebSocketServer(
+            host or os.environ.get("STEAGO_REALTIME_LOCAL_HOST", "127.0.0.1"),
+            port if port is not None else int(os.environ.get("STEAGO_REALTIME_LOCAL_PORT", 9272)),
+            authorize=partial(authorize_channels, app),
+        )
+        self.server.start()
+
+    def trigger(self, channels: list[str], event: str, data: dict) -> None:
+        self.server.broadcast([(channel, event, data) for channel in channels])
+
+    def trigger_batch(self, events: list[tuple[str, str, dict]]) -> None:
+        self.server.broadcast(events)
+
+
+def create_backend(name: str, app=None) -> RealtimeBackend:
+    if name == "pusher":
+        return PusherBackend()
+    if name == "local":
+        if app is None:
+            raise RuntimeError("The local realtime backend needs `realtime_hub.init_app(app)`")
+        return LocalBackend(app)
+    if name == "none":
+        return NullBackend()
+    raise ValueError(f"Unknown realtime backend: {name}")
+
+
+# =============================================================================
+# Hub
+# =============================================================================
+
+
+class RealtimeHub:
+    def __init__(
+        self,
+        backend: Optional[RealtimeBackend] = None,
+        interval: float = REALTIME_SLICE_INTERVAL,
+        max_pending: int = REALTIME_MAX_PENDING,
+    ) -> None:
+        self.interval = interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._backend = backend
+        self._app = None
+        # Pending events, in order: [channels, event, data]. The data of delta
+        # events is completed at flush time from their list of parts.
+        self._pending: list[list] = []
+        # (channel, reply key) -> parts of the still open delta event
+        self._open_deltas: dict[tuple[str, str], list[str]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        atexit.register(self.flush)
+
+    def init_app(self, app) -> None:
+        self._app = app
+
+    @property
+    def backend(self) -> RealtimeBackend:
+        if self._backend is None:
+            self._backend = create_backend(REALTIME_BACKEND, self._app)
+        return self._backend
+
+    def set_backend(self, backend: Optional[RealtimeBackend]) -> None:
+        self._backend = backend
+
+    # Publishing
+    # -------------------------------------------------------------------------
+
+    def publish(self, channels: Union[str, list[str]], event: str, data: dict) -> None:
+        """
+        Queue an event for one or more channels.
+        """
+        if isinstance(channels, str):
+            channels = [channels]
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending.append([list(channels), event, data])
+            # Later deltas must not be merged into events sent before this one
+            self._open_deltas.clear()
+        self._notify()
+
+    def publish_delta(self, channel: str, key: str, delta: str) -> None:
+        """
+        Queue a token delta of the streamed reply `key`. Deltas of the same
+        reply within a time slice are sent as one `message-delta` event.
+        """
+        with self._lock:
+            parts = self._open_deltas.get((channel, key))
+            if parts is not None:
+                parts.append(delta)
+                return
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            parts = self._open_deltas[(channel, key)] = [delta]
+            self._pending.append([[channel], DELTA_EVENT, {"key": key, "parts": parts}])
+        self._notify()
+
+    # Delivery
+    # -------------------------------------------------------------------------
+
+    def _notify(self) -> None:
+        self._ensure_worker()
+        self._wakeup.set()
+
+    def _ensure_worker(self) -> None:
+        # Started on first use, and again in a forked child
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run, name="realtime-hub", daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # Let the rest of the slice accumulate before sending
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Realtime flush failed.")
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._open_deltas.clear()
+        if not pending:
+            return
+
+        backend = self.backend
+        batch: list[tuple[str, str, dict]] = []
+
+        def send_batch():
+            for start in range(0, len(batch), backend.max_batch_size):
+                backend.trigger_batch(batch[start : start + backend.max_batch_size])
+            batch.clear()
+
+        for channels, event, data in pending:
+            if event == DELTA_EVENT:
+                data = {"key": data["key"], "delta": "".join(data["parts"])}
+            if len(channels) == 1:
+                batch.append((channels[0], event, data))
+                continue
+            # Keep the order of events
+            send_batch()
+            for start in range(0, len(channels), backend.max_channels):
+                backend.trigger(channels[start : start + backend.max_channels], event, data)
+        send_batch()
+
+
+realtime_hub = RealtimeHub()
+
+
+def publish_event(channels: Union[str, list[str]], event: str, data: dict) -> None:
+    realtime_hub.publish(channels, event, data)
@@ -0,0 +1,221 @@
+"""
+Serialization of API responses.
+
+`JSONProvider` replaces Flask's default JSON provider. It encodes with orjson
+when it is installed (`STEAGO_JSON_BACKEND`: `auto`, `orjson` or `json`),
+which handles UUIDs, datetimes and dataclasses natively, and falls back to
+the standard library otherwise. Both backends give the same output.
+Datetimes are HTTP dates, like Flask's, unless `STEAGO_JSON_ISO_DATETIMES`
+is set (ISO 8601, encoded natively by orjson). HTTP dates keep responses
+compatible with existing clients, at a cost: orjson hands every datetime
+back to Python to format it, which makes timestamp-heavy listings noticeably
+slower to encode. Set it once the clients parse ISO 8601.
+
+`RowSerializer` turns the rows of a column `select` into dicts, with the
+lookups planned once per serializer, so hot listings skip the ORM entirely:
+
+    MESSAGE_SERIALIZER = RowSerializer(
+        uuid=ChatMessage.uuid,
+        role=(ChatMessage.user_id, get_role),
+        html=PARAMETER,
+        created_ts=ChatMessage.created_ts,
+    )
+    rows = db.session.execute(select(*MESSAGE_SERIALIZER.columns, ChatMessage.id))
+    [MESSAGE_SERIALIZER(row, html=html.get(row.id)) for row in rows]
+"""
+
+import os
+from datetime import date
+from functools import lru_cache
+from operator import itemgetter
+from typing import Any, Callable, Iterable, Optional
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+from .log import logger
+
+JSON_BACKEND = os.environ.get("STEAGO_JSON_BACKEND", "auto")
+JSON_ISO_DATETIMES = os.environ.get("STEAGO_JSON_ISO_DATETIMES", "false").lower() == "true"
+
+
+def _load_orjson():
+    if JSON_BACKEND == "json":
+        return None
+    try:
+        import orjson
+    except ImportError:
+        if JSON_BACKEND == "orjson":
+            raise
+        return None
+    return orjson
+
+
+# =============================================================================
+# JSON provider
+# =============================================================================
+
+
+class JSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider with an optional orjson backend, set in
+    `configure_app`. `sort_keys` and `compact` apply as in Flask's.
+    """
+
+    def __init__(self, app) -> None:
+        super().__init__(app)
+        self._orjson = _load_orjson()
+
+    @staticmethod
+    def default(o: Any) -> Any:
+        if isinstance(o, date):
+            return o.isoformat() if JSON_ISO_DATETIMES else http_date(o)
+        return DefaultJSONProvider.default(o)
+
+    @property
+    def backend(self) -> str:
+        return "json" if self._orjson is None else "orjson"
+
+    # -------------------------------------------------------------------------
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if self._orjson is not None and kwargs.keys() <= {"indent", "separators"}:
+            data = self._dumps_orjson(obj, indent=kwargs.get("indent"))
+            if data is not None:
+                return data.decode()
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        if self._orjson is not None and not kwargs:
+            return self._orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args: Any, **kwargs: Any):
+        if self._orjson is None:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = None
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            indent = 2
+        data = self._dumps_orjson(obj, indent=indent)
+        if data is None:
+            return super().response(obj)
+        return self._app.response_class(data + b"\n", mimetype=self.mimetype)
+
+    def _dumps_orjson(self, obj: Any, indent: Optional[int] = None) -> Optional[bytes]:
+        orjson = self._orjson
+        option = orjson.OPT_NON_STR_KEYS
+        if not JSON_ISO_DATETIMES:
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=self.default, option=option)
+        except orjson.JSONEncodeError:
+            # E.g. integers over 64 bits, left to the standard library
+            logger.debug("orjson could not encode a response, falling back to json.")
+            return None
+
+
+# =============================================================================
+# Row serializers
+# =============================================================================
+
+
+class _Parameter:
+    def __repr__(self) -> str:
+        return "PARAMETER"
+
+
+# Field of a `RowSerializer` given as a keyword argument of the call
+PARAMETER = _Parameter()
+
+
+class RowSerializer:
+    """
+    Serializer of the rows of `select(*serializer.columns, ...)` into dicts.
+
+    Each keyword argument is an output field, in order: a column (its value),
+    a `(column, function)` pair (the function of its value), or `PARAMETER`
+    (a keyword argument of the call, `None` by default). More columns can be
+    selected after `columns`, e.g. to use them in the view.
+    """
+
+    def __init__(self, **fields) -> None:
+        self.fields = fields
+        columns: list = []
+        names: list[str] = []
+        indexes: list[int] = []
+        functions: list[tuple[int, Callable]] = []
+        parameters: list[str] = []
+
+        for name, field in fields.items():
+            if field is PARAMETER:
+                parameters.append(name)
+                continue
+            column, function = field if isinstance(field, tuple) else (field, None)
+            for i, selected in enumerate(columns):
+                # Compared by identity, `==` makes a SQL expression
+                if selected is column:
+                    break
+            else:
+                columns.append(column)
+                i = len(columns) - 1
+            if function is not None:
+                functions.append((len(names), function))
+            names.append(name)
+            indexes.append(i)
+
+        self.columns = tuple(columns)
+        self._names = tuple(names)
+        self._functions = tuple(functions)
+        self._parameters = frozenset(parameters)
+        # Sets the order of the fields, parameters included
+        self._template = dict.fromkeys(fields) if parameters else None
+        if len(indexes) == 1:
+            # `itemgetter` of a single item does not return a tuple
+            self._get_values = lambda row, i=indexes[0]: (row[i],)
+        elif indexes:
+            self._get_values = itemgetter(*indexes)
+        else:
+            self._get_values = lambda row: ()
+
+    def __call__(self, row, **parameters) -> dict:
+        values = self._get_values(row)
+        if self._functions:
+            values = list(values)
+            for i, function in self._functions:
+                values[i] = function(values[i])
+        if self._template is None:
+            if parameters:
+                raise TypeError(f"Unexpected parameters: {', '.join(parameters)}")
+            return dict(zip(self._names, values))
+
+        unexpected = parameters.keys() - self._parameters
+        if unexpected:
+            raise TypeError(f"Unexpected parameters: {', '.join(sorted(unexpected))}")
+        item = self._template.copy()
+        item.update(zip(self._names, values))
+        item.update(parameters)
+        return item
+
+    def many(self, rows: Iterable) -> list[dict]:
+        return list(map(self, rows))
+
+
+@lru_cache(maxsize=None)
+def get_model_serializer(model, exclude: tuple[str, ...] = ("id",)) -> RowSerializer:
+    """
+    Serializer of every column of `model` but the `exclude`d ones, e.g. for
+    change feeds.
+    """
+    return RowSerializer(
+        **{
+            attr.key: attr.class_attribute
+            for attr in model.__mapper__.column_attrs
+            if attr.key not in exclude
+        }
+    )
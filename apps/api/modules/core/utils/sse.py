@@ -0,0 +1,66 @@
+"""
+Server-Sent Events helpers.
+
+Responses are produced by plain generators and written by the WSGI server as
+the client consumes them, so a slow client slows down the producer
+(backpressure), and a client that goes away closes the generator
+(`GeneratorExit`), which producers use to cancel work. Producers reading
+ahead on another thread must bound what they buffer, like the completion
+relay (`STREAM_READ_AHEAD`).
+"""
+
+import json
+from typing import Any, Iterable, Optional
+
+from flask import Response, stream_with_context
+
+
+def format_sse(
+    data: Any,
+    event: Optional[str] = None,
+    id: Optional[str] = None,
+    retry: Optional[int] = None,
+) -> str:
+    """
+    Format a single SSE frame. Non-string data is sent as compact JSON.
+
+    Returns:
+        string: The encoded frame, terminated by a blank line
+    """
+    if not isinstance(data, str):
+        data = json.dumps(data, separators=(",", ":"), default=str)
+
+    lines = []
+    if id is not None:
+        lines.append(f"id: {id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    if retry is not None:
+        lines.append(f"retry: {retry}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def format_sse_comment(comment: str = "") -> str:
+    """
+    Format an SSE comment frame, used as a keep-alive.
+    """
+    return f": {comment}\n\n"
+
+
+def sse_response(frames: Iterable[str], status: int = 200) -> Response:
+    """
+    Wrap an iterable of already formatted SSE frames in a streaming response.
+
+    The request context is kept alive until the generator finishes, and
+    proxies (nginx) are asked not to buffer the body.
+    """
+    return Response(
+        stream_with_context(frames),
+        status=status,
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
@@ -0,0 +1,284 @@
+"""
+In-process snapshot of the suspended and deleted workspaces and users.
+
+Every authenticated request must be refused once its user or workspace is
+suspended or deleted. Instead of joining both tables per request, each worker
+keeps the (small) sets of blocked workspace and user ids in memory:
+
+    1. Loaded in full when the listener (re)connects
+    2. Kept current by Postgres `LISTEN/NOTIFY`: triggers on the user and
+       workspace tables notify `STATUS_NOTIFY_CHANNEL` on every status change
+
+The listener confirms its connection with a round trip every
+`STATUS_HEARTBEAT_INTERVAL` seconds. A notification is delivered before the
+reply to any query sent after its commit, so the snapshot reflects every
+change committed before the last confirmation. When that confirmation is
+older than `STATUS_MAX_STALENESS` (listener down, or behind PgBouncer without
+`STEAGO_DB_DIRECT_URI`), checks fall back to the DB, so a blocked principal is
+never let in for longer than that.
+"""
+
+import os
+import select
+import threading
+import time
+from functools import wraps
+from typing import Callable, Optional
+
+from flask import abort
+from flask import g as flask_g
+from sqlalchemy import select as sql_select
+
+from ..db.primary import primary_db as db
+from ..models.enums import USER_STATUS, WORKSPACE_STATUS
+from .log import logger
+
+STATUS_NOTIFY_CHANNEL = "steago_status"
+
+STATUS_MAX_STALENESS = float(os.environ.get("STEAGO_STATUS_MAX_STALENESS", 30))
+STATUS_HEARTBEAT_INTERVAL = 5.0
+# Delay before reconnecting a failed listener
+STATUS_RECONNECT_DELAY = 5.0
+
+BLOCKED_WORKSPACE_STATUSES = (WORKSPACE_STATUS.SUSPENDED, WORKSPACE_STATUS.DELETED)
+BLOCKED_USER_STATUSES = (USER_STATUS.SUSPENDED, USER_STATUS.DELETED)
+
+# Status sent by the triggers for a deleted row
+STATUS_ROW_DELETED = -1
+
+
+# =============================================================================
+
+
+class StatusSnapshot:
+    """
+    Blocked workspace and user ids, kept current by a listener thread.
+    """
+
+    def __init__(self, max_staleness: float = STATUS_MAX_STALENESS) -> None:
+        self.max_staleness = max_staleness
+        self._app = None
+        self._blocked_workspaces: set[int] = set()
+        self._blocked_users: set[int] = set()
+        # `time.monotonic()` of the last time the snapshot was known current
+        self.confirmed_at = 0.0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def init_app(self, app) -> None:
+        self._app = app
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.monotonic() - self.confirmed_at <= self.max_staleness
+
+    # -------------------------------------------------------------------------
+
+    def is_allowed(self, user_id: int, workspace_id: int) -> Optional[bool]:
+        """
+        Check a principal against the snapshot.
+
+        Returns:
+            bool: Whether neither the user nor its workspace is blocked, or
+            `None` if the snapshot is too stale to tell
+        """
+        self._ensure_worker()
+        if not self.is_fresh:
+            return None
+        return (
+            user_id not in self._blocked_users
+            and workspace_id not in self._blocked_workspaces
+        )
+
+    # -------------------------------------------------------------------------
+
+    def reload(self) -> None:
+        """
+        Load the blocked ids from the DB, replacing the snapshot.
+        """
+        from ..models.unified import get_unified_user, get_unified_workspace
+
+        User = get_unified_user()
+        Workspace = get_unified_workspace()
+
+        with self._app.app_context():
+            workspaces = set(
+                db.session.scalars(
+                    sql_select(Workspace.id).where(
+                        Workspace.status.in_(BLOCKED_WORKSPACE_STATUSES)
+                    )
+                )
+            )
+            users = set(
+                db.session.scalars(
+                    sql_select(User.id).where(User.status.in_(BLOCKED_USER_STATUSES))
+                )
+            )
+            db.session.remove()
+
+        with self._lock:
+            self._blocked_workspaces = workspaces
+            self._blocked_users = users
+
+    def apply(self, payload: str) -> None:
+        """
+        Apply a `<kind>:<id>:<status>` notification, `kind` being `w`
+        (workspace) or `u` (user).
+        """
+        kind, row_id, status = payload.split(":")
+        row_id, status = int(row_id), int(status)
+        if kind == "w":
+            blocked, blocked_statuses = self._blocked_workspaces, BLOCKED_WORKSPACE_STATUSES
+        elif kind == "u":
+            blocked, blocked_statuses = self._blocked_users, BLOCKED_USER_STATUSES
+        else:
+            return
+
+        with self._lock:
+            if status in blocked_statuses:
+                blocked.add(row_id)
+            else:
+                # Active again, or the row is gone (`STATUS_ROW_DELETED`)
+                blocked.discard(row_id)
+
+    # -------------------------------------------------------------------------
+
+    def _ensure_worker(self) -> None:
+        # Started on first use, and again in a forked child
+        if self._app is None:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run, name="status-listener", daemon=True
+                    )
+                    self._thread.start()
+
+    def _connect(self):
+        # A dedicated connection, outside of the pool: it is held for the
+        # life of the process
+        from ..db.pool import get_direct_url
+
+        with self._app.app_context():
+            engine = db.engine
+        cargs, cparams = engine.dialect.create_connect_args(get_direct_url(engine))
+        connection = engine.dialect.dbapi.connect(*cargs, **cparams)
+        connection.autocommit = True
+        return connection
+
+    def _run(self) -> None:
+        while True:
+            connection = None
+            try:
+                connection = self._connect()
+                cursor = connection.cursor()
+                cursor.execute(f"LISTEN {STATUS_NOTIFY_CHANNEL}")
+                # Listening before loading, so no change falls in between
+                started_at = time.monotonic()
+                self.reload()
+                self.confirmed_at = started_at
+                self._listen(connection, cursor)
+            except Exception:
+                logger.exception("Status listener failed, reconnecting.")
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+            time.sleep(STATUS_RECONNECT_DELAY)
+
+    def _listen(self, connection, cursor) -> None:
+        while True:
+            timeout = self.confirmed_at + STATUS_HEARTBEAT_INTERVAL - time.monotonic()
+            if timeout > 0:
+                readable, _, _ = select.select([connection], [], [], timeout)
+                if readable:
+                    connection.poll()
+            else:
+                # Round trip: every notification committed before it was sent
+                # has arrived once the reply is in
+                sent_at = time.monotonic()
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+                self._apply_notifies(connection)
+                self.confirmed_at = sent_at
+                continue
+            self._apply_notifies(connection)
+
+    def _apply_notifies(self, connection) -> None:
+        while connection.notifies:
+            notify = connection.notifies.pop(0)
+            try:
+                self.apply(notify.payload)
+            except ValueError:
+                logger.warning(f"Invalid status notification: {notify.payload!r}")
+
+
+status_snapshot = StatusSnapshot()
+
+
+# =============================================================================
+
+
+def _is_allowed_from_db(user_id: int) -> bool:
+    from ..models.unified import get_unified_user, get_unified_workspace
+
+    User = get_unified_user()
+    Workspace = get_unified_workspace()
+
+    row = db.session.execute(
+        sql_select(User.status, Workspace.status)
+        .join(Workspace, Workspace.id == User.workspace_id)
+        .where(User.id == user_id)
+    ).one_or_none()
+    if row is None:
+        return False
+    user_status, workspace_status = row
+    return (
+        user_status not in BLOCKED_USER_STATUSES
+        and workspace_status not in BLOCKED_WORKSPACE_STATUSES
+    )
+
+
+def is_principal_allowed(user_id: int, workspace_id: int) -> bool:
+    """
+    Check that neither a user nor its workspace is suspended or deleted, from
+    the snapshot when it is fresh enough, from the DB otherwise.
+    """
+    allowed = status_snapshot.is_allowed(user_id, workspace_id)
+    if allowed is None:
+        allowed = _is_allowed_from_db(user_id)
+    return allowed
+
+
+def status_gated(auth_required: Callable) -> Callable:
+    """
+    Wrap an auth decorator factory (e.g. `jwt_required`) so that the routes it
+    protects also refuse suspended or deleted users and workspaces (403).
+
+        set_auth_required(status_gated(jwt_required))
+    """
+
+    @wraps(auth_required)
+    def gated_auth_required(*args, **kwargs):
+        protect = auth_required(*args, **kwargs)
+
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*function_args, **function_kwargs):
+                # Set by the JWT user lookup, `None` without a (valid) token
+                # on optional routes
+                snapshot = getattr(flask_g, "identity_snapshot", None)
+                if snapshot is not None and not is_principal_allowed(
+                    snapshot.id, snapshot.workspace_id
+                ):
+                    abort(403)
+                return function(*function_args, **function_kwargs)
+
+            return protect(wrapper)
+
+        return decorator
+
+    return gated_auth_required
@@ -0,0 +1,240 @@
+"""
+Minimal, self-hosted WebSocket server (RFC 6455, server to client text frames
+only), used by the local realtime backend.
+
+Clients subscribe to channels with the query string of the URL, and their
+access token (browsers cannot set headers on a WebSocket):
+
+    ws://127.0.0.1:9272/?channels=thread-<uuid>,channel-<uuid>&token=<jwt>
+
+and receive every event published to them as a JSON text frame:
+
+    {"channel": "...", "event": "...", "data": {...}}
+
+Subscriptions are checked by the `authorize(token, channels)` callback, like
+Pusher private channels: the realtime backend only lets users follow the
+threads and channels of their workspace.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import threading
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from .log import logger
+
+_WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Events buffered per client before it is considered too slow and dropped
+CLIENT_QUEUE_SIZE = 1000
+
+
+def _encode_text_frame(text: str) -> bytes:
+    payload = text.encode("utf-8")
+    length = len(payload)
+    if length < 126:
+        header = bytes((0x81, length))
+    elif length < 1 << 16:
+        header = bytes((0x81, 126)) + length.to_bytes(2, "big")
+    else:
+        header = bytes((0x81, 127)) + length.to_bytes(8, "big")
+    return header + payload
+
+
+# Seconds to wait for the server to listen
+START_TIMEOUT = 10
+
+
+class _Client:
+    """
+    A connected client: its pending frames, and the task serving it.
+    """
+
+    __slots__ = ("queue", "task", "channels")
+
+    def __init__(self, task: Optional[asyncio.Task]) -> None:
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.task = task
+        self.channels: list[str] = []
+
+
+class LocalWebSocketServer:
+    """
+    Args:
+        authorize: `authorize(token, channels)`, whether the bearer of an
+            access token (`None` without one) may follow `channels`. Called
+            on a worker thread. Without it every subscription is accepted.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 9272,
+        authorize: Optional[Callable[[Optional[str], list[str]], bool]] = None,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.authorize = authorize
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        # channel -> clients
+        self._subscribers: dict[str, set[_Client]] = {}
+
+    # Lifecycle
+    # -------------------------------------------------------------------------
+
+    def start(self) -> None:
+        """
+        Start serving on a background thread with its own event loop.
+
+        Raises:
+            OSError: If the port is taken, e.g. by another worker
+            RuntimeError: If the server did not start in time
+        """
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        errors: list[BaseException] = []
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._server = self._loop.run_until_complete(
+                    asyncio.start_server(self._handle, self.host, self.port)
+                )
+            except BaseException as e:
+                errors.append(e)
+                started.set()
+                self._loop.close()
+                return
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, name="realtime-websocket", daemon=True).start()
+        if not started.wait(START_TIMEOUT):
+            raise RuntimeError(f"Local realtime server did not start on {self.host}:{self.port}")
+        if errors:
+            self._loop = None
+            logger.error(f"Local realtime server could not listen on {self.host}:{self.port}.")
+            raise errors[0]
+        logger.info(f"Local realtime server listening on ws://{self.host}:{self.port}")
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    # Publishing (any thread)
+    # -------------------------------------------------------------------------
+
+    def broadcast(self, events: list[tuple[str, str, dict]]) -> None:
+        """
+        Send `(channel, event, data)` events to the subscribed clients.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._broadcast, events)
+
+    def _broadcast(self, events: list[tuple[str, str, dict]]) -> None:
+        for channel, event, data in events:
+            subscribers = self._subscribers.get(channel)
+            if not subscribers:
+                continue
+            frame = _encode_text_frame(
+                json.dumps({"channel": channel, "event": event, "data": data}, default=str)
+            )
+            for client in list(subscribers):
+                try:
+                    client.queue.put_nowait(frame)
+                except asyncio.QueueFull:
+                    # Too slow, close it rather than buffer without bound
+                    self._drop(client)
+
+    def _drop(self, client: _Client) -> None:
+        self._unsubscribe(client)
+        if client.task is not None:
+            client.task.cancel()
+
+    def _unsubscribe(self, client: _Client) -> None:
+        for channel in client.channels:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(client)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    # Connections
+    # -------------------------------------------------------------------------
+
+    async def _handshake(self, reader, writer) -> Optional[list[str]]:
+        head = await reader.readuntil(b"\r\n\r\n")
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+        headers = {
+            key.strip().lower(): value.strip()
+            for key, _, value in (line.partition(":") for line in header_lines if line)
+        }
+        key = headers.get("sec-websocket-key")
+        if not key:
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return None
+
+        query = parse_qs(urlsplit(request_line.split(" ")[1]).query)
+        channels = [c for value in query.get("channels", []) for c in value.split(",") if c]
+        token = query.get("token", [None])[0]
+        if self.authorize is not None:
+            allowed = await asyncio.get_running_loop().run_in_executor(
+                None, self.authorize, token, channels
+            )
+            if not allowed:
+                writer.write(b"HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\n\r\n")
+                return None
+
+        accept = base64.b64encode(
+            hashlib.sha1((key + _WEBSOCKET_GUID).encode()).digest()
+        ).decode()
+        writer.write(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+            ).encode()
+        )
+        return channels
+
+    async def _handle(self, reader, writer) -> None:
+        client = _Client(asyncio.current_task())
+        try:
+            channels = await self._handshake(reader, writer) or []
+            client.channels = channels
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(client)
+
+            # Any frame from the client (or EOF) ends the connection, clients
+            # only listen.
+            closed = asyncio.ensure_future(reader.read(2))
+            try:
+                while channels:
+                    frame = asyncio.ensure_future(client.queue.get())
+                    try:
+                        done, _ = await asyncio.wait(
+                            {frame, closed}, return_when=asyncio.FIRST_COMPLETED
+                        )
+                    finally:
+                        frame.cancel()
+                    if closed in done:
+                        break
+                    writer.write(frame.result())
+                    await writer.drain()
+            finally:
+                closed.cancel()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # Dropped as too slow
+            pass
+        finally:
+            self._unsubscribe(client)
+            writer.close()
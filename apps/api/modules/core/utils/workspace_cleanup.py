@@ -0,0 +1,97 @@
+"""
+Permanent deletion of the workspaces marked `WORKSPACE_STATUS.DELETED`.
+
+Rows are deleted child tables first, in chunks of `WORKSPACE_DELETE_CHUNK_SIZE`
+committed one by one, so a large workspace never holds long locks on the user
+and chat tables. A deletion interrupted midway simply resumes on retry.
+"""
+
+import os
+
+from sqlalchemy import delete, select
+
+from ...chat.models.channel import ChatChannel
+from ...chat.models.message import ChatMessage
+from ...chat.models.thread import ChatThread
+from ..db.primary import primary_db as db
+from ..models.enums import WORKSPACE_STATUS
+from .identity import invalidate_workspace_identities
+from .jobs import enqueue_job, job_handler, job_scheduler, refresh_job_lock
+from .log import logger
+
+WORKSPACE_DELETE_CHUNK_SIZE = int(os.environ.get("STEAGO_WORKSPACE_DELETE_CHUNK_SIZE", 1000))
+
+# Deletions go after the interactive jobs
+WORKSPACE_DELETE_PRIORITY = -10
+
+
+# =============================================================================
+
+
+def delete_in_chunks(model, *where, chunk_size: int = WORKSPACE_DELETE_CHUNK_SIZE) -> int:
+    """
+    Delete the rows of `model` matching `where`, `chunk_size` rows per
+    transaction. Rows cascading from them are deleted with their chunk.
+
+    Returns:
+        int: The number of rows deleted
+    """
+    count = 0
+    while True:
+        chunk = select(model.id).where(*where).limit(chunk_size)
+        result = db.session.execute(delete(model).where(model.id.in_(chunk)))
+        db.session.commit()
+        # Large workspaces take longer than the job timeout
+        refresh_job_lock()
+        count += result.rowcount
+        if result.rowcount < chunk_size:
+            return count
+
+
+@job_handler("core.delete_workspace")
+def delete_workspace(workspace_id: int) -> None:
+    from ..models.unified import get_unified_user, get_unified_workspace
+
+    Workspace = get_unified_workspace()
+    User = get_unified_user()
+
+    workspace = db.session.get(Workspace, workspace_id)
+    if workspace is None:
+        return
+    if workspace.status != WORKSPACE_STATUS.DELETED:
+        # Restored since the job was queued
+        logger.info(f"Workspace {workspace_id} is not marked deleted, skipping.")
+        return
+    db.session.rollback()
+
+    threads = select(ChatThread.id).where(ChatThread.workspace_id == workspace_id)
+    # Embeddings, renders and token counts cascade from the messages, and
+    # summaries from the threads
+    messages = delete_in_chunks(ChatMessage, ChatMessage.thread_id.in_(threads))
+    delete_in_chunks(ChatThread, ChatThread.workspace_id == workspace_id)
+    delete_in_chunks(ChatChannel, ChatChannel.workspace_id == workspace_id)
+    invalidate_workspace_identities(workspace_id)
+    users = delete_in_chunks(User, User.workspace_id == workspace_id)
+
+    db.session.execute(delete(Workspace).where(Workspace.id == workspace_id))
+    db.session.commit()
+    logger.info(
+        f"Deleted workspace {workspace_id} ({users} users, {messages} messages)."
+    )
+
+
+@job_scheduler
+def enqueue_workspace_deletions() -> None:
+    from ..models.unified import get_unified_workspace
+
+    Workspace = get_unified_workspace()
+    workspace_ids = db.session.scalars(
+        select(Workspace.id).where(Workspace.status == WORKSPACE_STATUS.DELETED)
+    ).all()
+    for workspace_id in workspace_ids:
+        enqueue_job(
+            "core.delete_workspace",
+            {"workspace_id": workspace_id},
+            priority=WORKSPACE_DELETE_PRIORITY,
+            idempotency_key=f"core.delete_workspace:{workspace_id}",
+        )
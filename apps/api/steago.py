@@ -6,6 +6,13 @@
     :license: AGPL-3.0 (See `/LICENSE` for more details).
     :author: Augustus D'Souza <augustus@clergo.com>
 
+    The app is built by the `create_app()` factory. Importing this module is
+    kept cheap: blueprints (and the provider SDKs and heavy libraries they
+    pull in) are only imported when the app is created.
+
+        flask --app steago run
+        gunicorn --preload "steago:create_app()"
+
 """
 
 """
@@ -18,18 +25,17 @@ The "import-ant" part
 """
 # ruff: noqa: E402
 
-import json
 import os
 import time
 from datetime import timedelta
 
-from flask import Flask, jsonify, redirect, request
-from flask import g as flask_g
+from flask import Flask, jsonify, redirect
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, jwt_required
 from flask_migrate import Migrate
-from modules.ai.utils.prompt import load_all_prompts
+from modules.core.db.pool import get_engine_options
 from modules.core.db.primary import primary_db
+from modules.core.db.replica import get_replica_binds
 from modules.core.models.unified import (
     set_unified_user,
     set_unified_workspace,
@@ -37,10 +43,16 @@ from modules.core.models.unified import (
 from modules.core.models.user import CoreUser
 from modules.core.models.workspace import CoreWorkspace
 from modules.core.utils.auth import set_auth_required
+from modules.core.utils.browser_context import SteagoAppGlobals
 from modules.core.utils.cache import cache
 from modules.core.utils.compress import compress
 from modules.core.utils.config import CONFIG
-from modules.core.utils.log import logger
+from modules.core.utils.db import write_behind
+from modules.core.utils.identity import load_identity
+from modules.core.utils.metrics import init_metrics
+from modules.core.utils.realtime import realtime_hub
+from modules.core.utils.serialization import JSONProvider
+from modules.core.utils.status import status_gated, status_snapshot
 
 """
 ////////////////////////////////////////////////////////////////////////////////
@@ -51,21 +63,23 @@ You "con-figure" this out!
 ////////////////////////////////////////////////////////////////////////////////
 """
 
-# Instantiate a Flask app
-app = Flask(__name__)
 
-# Print a pretty message on the terminal for our reference in logs
-if app.debug:
-    print("--> Server: Starting server in DEBUG mode.")
-else:
-    print("--> Server: Starting server in PRODUCTION mode.")
+def configure_app(app: Flask) -> None:
+    # Print a pretty message on the terminal for our reference in logs
+    if app.debug:
+        print("--> Server: Starting server in DEBUG mode.")
+    else:
+        print("--> Server: Starting server in PRODUCTION mode.")
+
+    # Set a 'SECRET_KEY' to enable the Flask session cookies
+    app.config["SECRET_KEY"] = CONFIG.FLASK_SECRET_KEY
 
-# Set a 'SECRET_KEY' to enable the Flask session cookies
-app.config["SECRET_KEY"] = CONFIG.FLASK_SECRET_KEY
+    # Encode with orjson when it is installed
+    app.json = JSONProvider(app)
 
-# Turn off auto-sorting of JSON keys by flask
-# app.config["JSON_SORT_KEYS"] = False
-app.json.sort_keys = False
+    # Turn off auto-sorting of JSON keys by flask
+    # app.config["JSON_SORT_KEYS"] = False
+    app.json.sort_keys = False
 
 
 """
@@ -74,24 +88,29 @@ FLASK JWT EXTENDED
 ================================================================================
 """
 
-# Set a 'JWT_SECRET_KEY' to protect JWT tokens
-app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY")
+# Initialized with the app in `configure_jwt`
+app_jwt = JWTManager()
+
+
+def configure_jwt(app: Flask) -> None:
+    # Set a 'JWT_SECRET_KEY' to protect JWT tokens
+    app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY")
 
-# JWT RFC recommends using 'sub' for identity claim
-app.config["JWT_IDENTITY_CLAIM"] = "sub"
+    # JWT RFC recommends using 'sub' for identity claim
+    app.config["JWT_IDENTITY_CLAIM"] = "sub"
 
-# Set a 'JWT_SECRET_KEY' to protect JWT tokens
-app.config["JWT_TOKEN_LOCATION"] = ["headers"]
+    # Set a 'JWT_SECRET_KEY' to protect JWT tokens
+    app.config["JWT_TOKEN_LOCATION"] = ["headers"]
 
-# NOTE: 10 years! What? This simple JWT auth mechanism is only for self-hosted
-#       open source! Feel free to change to your own auth mechanism. We've made
-#       it simple to swap in an entirely custom JWT based auth mechanism and
-#       set it in the "Set auth wrapper" section below.
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(days=3650)
-app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(days=3650)
+    # NOTE: 10 years! What? This simple JWT auth mechanism is only for self-hosted
+    #       open source! Feel free to change to your own auth mechanism. We've made
+    #       it simple to swap in an entirely custom JWT based auth mechanism and
+    #       set it in the "Set auth wrapper" section below.
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(days=3650)
+    app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(days=3650)
 
-# Initialize JWT extension
-app_jwt = JWTManager(app)
+    # Initialize JWT extension
+    app_jwt.init_app(app)
 
 
 # JWT Blocklist checker
@@ -122,8 +141,8 @@ def user_lookup_callback(_jwt_header, jwt_data):
     https://flask-jwt-extended.readthedocs.io/en/stable/automatic_user_loading/
     """
     identity = jwt_data["sub"]
-    user = CoreUser.query.filter_by(uuid=identity).one_or_none()
-    return user
+    # Served from the identity cache, see `modules.core.utils.identity`
+    return load_identity(identity)
 
 
 """
@@ -132,7 +151,9 @@ Set auth wrapper
 ================================================================================
 """
 
-set_auth_required(jwt_required)
+# Suspended or deleted users and workspaces are refused (403), see
+# `modules.core.utils.status`
+set_auth_required(status_gated(jwt_required))
 
 """
 ================================================================================
@@ -140,53 +161,54 @@ SQL ALCHEMY
 ================================================================================
 """
 
-app.config["SQLALCHEMY_DATABASE_URI"] = CONFIG.DATABASE_PRIMARY_POSTGRES_URI
+migrate = Migrate()
 
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_pre_ping": True,
-}
 
-# Set additional DB config based on server mode
-if app.debug:
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = True
-    # app.config["SQLALCHEMY_ECHO"] = True
-else:
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+def configure_db(app: Flask) -> None:
+    app.config["SQLALCHEMY_DATABASE_URI"] = CONFIG.DATABASE_PRIMARY_POSTGRES_URI
 
-primary_db.init_app(app)
+    # Pool settings (size, recycle, PgBouncer mode), see `modules.core.db.pool`
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = get_engine_options()
+    # Read replicas, used by the read-only routes, see `modules.core.db.replica`
+    app.config["SQLALCHEMY_BINDS"] = get_replica_binds()
 
+    # Set additional DB config based on server mode
+    if app.debug:
+        app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = True
+        # app.config["SQLALCHEMY_ECHO"] = True
+    else:
+        app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
-migrate = Migrate(app, primary_db)
+    primary_db.init_app(app)
 
+    migrate.init_app(app, primary_db)
 
-"""
-================================================================================
-Flask-CORS
-================================================================================
-"""
+    # Background writer for non-critical metadata (e.g. thread `modified_ts`)
+    write_behind.init_app(app)
+
+    # Blocked users and workspaces, kept current with LISTEN/NOTIFY
+    status_snapshot.init_app(app)
 
-CORS(app, origins=CONFIG.REQUEST_ORIGINS_LIST)
+    # The local realtime backend checks subscriptions against the DB
+    realtime_hub.init_app(app)
 
 
 """
 ================================================================================
-Flask-Caching
+Flask-CORS, Flask-Caching, Flask-Compress
 ================================================================================
 """
 
-# cache.init_app(app)
-cache.init_app(app)
 
+def configure_extensions(app: Flask) -> None:
+    CORS(app, origins=CONFIG.REQUEST_ORIGINS_LIST)
 
-"""
-================================================================================
-Flask-Compress
-================================================================================
-"""
+    # cache.init_app(app)
+    cache.init_app(app)
 
-# app.config["COMPRESS_MIN_SIZE"] = 0
-app.config["COMPRESS_STREAMS"] = False
-compress.init_app(app)
+    # Encoding picked per response (size, type, cacheability), SSE frames are
+    # compressed and flushed one by one, see `modules.core.utils.compress`
+    compress.init_app(app)
 
 
 """
@@ -204,39 +226,26 @@ Special Route Wrappers
 ================================================================================
 """
 
-if app.debug:
-
-    @app.before_request
-    def set_server_delay():
-        """
-        Set server delay before each route, if asked for.
-        """
-        if CONFIG.SERVER_DELAY:
-            time.sleep(CONFIG.SERVER_DELAY_TIME)
 
+def set_server_delay():
+    """
+    Set server delay before each route, if asked for.
+    """
+    if CONFIG.SERVER_DELAY:
+        time.sleep(CONFIG.SERVER_DELAY_TIME)
 
-@app.before_request
-def inject_analytics_browser_context():
-    # Get Browser context for Analytics.
-    context_string = request.headers.get("C-Browser-Context", "null")
-    context = json.loads(context_string)
-    # print("context ->", context)
 
-    if context and "ip" not in context:
-        context["ip"] = request.environ.get(
-            "HTTP_X_FORWARDED_FOR", request.remote_addr
-        )
+def register_request_hooks(app: Flask) -> None:
+    # First, so the timings include the other hooks (auth, rate limits)
+    init_metrics(app)
 
-    # Skip logger warning for routes such as ping
-    if (
-        app.debug
-        and not context
-        and not request.path.startswith("/ping")
-        and request.method != "OPTIONS"
-    ):
-        logger.warning("Unable to get browser context as it was not sent!")
+    if app.debug:
+        app.before_request(set_server_delay)
 
-    flask_g.browser_context = context
+    # NOTE: The browser context (for analytics) is not parsed here, but only
+    #       when a handler reads `flask_g.browser_context`, see
+    #       `modules.core.utils.browser_context`.
+    app.app_ctx_globals_class = SteagoAppGlobals
 
 
 """
@@ -245,15 +254,7 @@ Initialize Limiter
 ===============================================================================
 """
 
-if CONFIG.FLASK_LIMITER_IS_ENABLED:
-    from modules.core.utils.rate_limiter import limiter
-
-    limiter.init_app(app)
-else:
-    app.config["RATELIMIT_ENABLED"] = False
-
 
-@app.errorhandler(429)
 def internal_error_429(error):
     return (
         jsonify(
@@ -267,7 +268,6 @@ def internal_error_429(error):
     )
 
 
-@app.errorhandler(401)
 def internal_error_401(error):
     return (
         jsonify(
@@ -281,6 +281,32 @@ def internal_error_401(error):
     )
 
 
+def internal_error_403(error):
+    return (
+        jsonify(
+            {
+                "status": "error",
+                "error": "forbidden",
+                "message": "Forbidden request",
+            }
+        ),
+        403,
+    )
+
+
+def configure_limiter(app: Flask) -> None:
+    if CONFIG.FLASK_LIMITER_IS_ENABLED:
+        from modules.core.utils.rate_limiter import limiter
+
+        limiter.init_app(app)
+    else:
+        app.config["RATELIMIT_ENABLED"] = False
+
+    app.register_error_handler(429, internal_error_429)
+    app.register_error_handler(401, internal_error_401)
+    app.register_error_handler(403, internal_error_403)
+
+
 """
 ////////////////////////////////////////////////////////////////////////////////
 
@@ -294,13 +320,28 @@ All routes lead to Steago
 ================================================================================
 Register Blueprints
 ================================================================================
+NOTE: Blueprints are imported here, and not at the top of the module, so that
+      the provider SDKs (openai, groq, pusher) and heavy libraries (bs4,
+      markdown2) they pull in are only loaded when the app is created.
 """
 
-from modules.chat.routers import api_chat
-from modules.core.routers import api_core
 
-app.register_blueprint(api_core)
-app.register_blueprint(api_chat)
+def register_blueprints(app: Flask) -> None:
+    from modules.chat.history import api_chat_history
+    from modules.chat.related import api_chat_related
+    from modules.chat.routers import api_chat
+    from modules.chat.search import api_chat_search
+    from modules.chat.stream import api_chat_stream
+    from modules.chat.sync import api_chat_sync
+    from modules.core.routers import api_core
+
+    app.register_blueprint(api_core)
+    app.register_blueprint(api_chat)
+    app.register_blueprint(api_chat_stream)
+    app.register_blueprint(api_chat_history)
+    app.register_blueprint(api_chat_search)
+    app.register_blueprint(api_chat_related)
+    app.register_blueprint(api_chat_sync)
 
 
 """
@@ -313,28 +354,47 @@ NOTE: PLEASE KEEP THESE IMPORTS AS IS, THEY ARE FOR ALEMBIC.
 """
 
 
-# AI
-from modules.ai.models.prompt import AIPrompt  # noqa: F401
+def load_models() -> None:
+    # AI
+    from modules.ai.models.context import AIContextEntry  # noqa: F401
+    from modules.ai.models.context import AIThreadSummary  # noqa: F401
+    from modules.ai.models.embedding import AIMessageEmbedding  # noqa: F401
+    from modules.ai.models.prompt import AIPrompt  # noqa: F401
+
+    # Chat
+    from modules.chat.models.channel import ChatChannel  # noqa: F401
+    from modules.chat.models.message import ChatMessage  # noqa: F401
+    from modules.chat.models.render import ChatMessageRender  # noqa: F401
+    from modules.chat.models.thread import ChatThread  # noqa: F401
 
-# Chat
-from modules.chat.models.channel import ChatChannel  # noqa: F401
-from modules.chat.models.message import ChatMessage  # noqa: F401
-from modules.chat.models.thread import ChatThread  # noqa: F401
+    # Core
+    from modules.core.models.job import CoreJob  # noqa: F401
 
-# Core
-# from modules.core.models.user import CoreUser --> already imported above
-# from modules.core.models.workspace import CoreWorkspace --> already imported above
+    # from modules.core.models.user import CoreUser --> already imported above
+    # from modules.core.models.workspace import CoreWorkspace --> already imported above
+
+    # Load unified models
+    set_unified_user(CoreUser)
+    set_unified_workspace(CoreWorkspace)
 
-# Load unified models
-set_unified_user(CoreUser)
-set_unified_workspace(CoreWorkspace)
 
 # =====================================================================
 # PROMPTS
 # =====================================================================
-# Create all missing prompts
-with app.app_context():
-    load_all_prompts(debug=app.debug)
+
+
+def load_prompts(app: Flask) -> None:
+    from modules.ai.utils.prompt_registry import sync_prompts
+
+    # Create all missing prompts (only when their definitions changed) and load
+    # the in-memory prompt registry
+    with app.app_context():
+        sync_prompts(debug=app.debug)
+
+        # Drop the connections opened while booting, so that workers forked
+        # from a preloaded app (`gunicorn --preload`) never share a socket.
+        for engine in primary_db.engines.values():
+            engine.dispose()
 
 
 # =====================================================================
@@ -342,7 +402,6 @@ with app.app_context():
 # =====================================================================
 
 
-@app.get("/")
 def home():
     return redirect("https://steago.ai")
 
@@ -351,9 +410,92 @@ def home():
 
 
 # Ping-pong route for status, health checks
-@app.get("/ping")
 def api_ping():
     return {"ping": "pong"}
 
 
 # ------------------------------------------------------------------------------
+
+
+def register_core_routes(app: Flask) -> None:
+    app.get("/")(home)
+    app.get("/ping")(api_ping)
+
+
+# =====================================================================
+# COMMANDS
+# =====================================================================
+
+
+def rerender_messages():
+    """Re-render stored message HTML after a renderer version bump."""
+    import click
+
+    from modules.chat.utils.render import rerender_stale_messages
+
+    count = rerender_stale_messages()
+    click.echo(f"Re-rendered {count} messages.")
+
+
+# ------------------------------------------------------------------------------
+
+
+def backfill_embeddings():
+    """Embed the messages that have no embedding yet."""
+    import click
+
+    from modules.ai.utils.retrieval import backfill_embeddings
+
+    count = backfill_embeddings()
+    click.echo(f"Embedded {count} messages.")
+
+
+# ------------------------------------------------------------------------------
+
+
+def register_commands(app: Flask) -> None:
+    import click
+
+    app.cli.command("rerender-messages")(rerender_messages)
+    app.cli.command("backfill-embeddings")(backfill_embeddings)
+
+    @app.cli.command("jobs-worker")
+    @click.option("--processes", default=2, show_default=True, help="Worker processes.")
+    @click.option("--kind", "kinds", multiple=True, help="Only run jobs of this kind.")
+    def jobs_worker(processes, kinds):
+        """Run background job workers until stopped."""
+        from modules.core.utils.jobs import run_worker_pool
+
+        run_worker_pool(processes, kinds or None)
+
+
+"""
+////////////////////////////////////////////////////////////////////////////////
+
+PART V :
+Put it all together
+
+////////////////////////////////////////////////////////////////////////////////
+"""
+
+
+def create_app() -> Flask:
+    """
+    Create and configure the Steago API app.
+    """
+    # Instantiate a Flask app
+    app = Flask(__name__)
+
+    configure_app(app)
+    configure_jwt(app)
+    configure_db(app)
+    configure_extensions(app)
+    register_request_hooks(app)
+    configure_limiter(app)
+    register_blueprints(app)
+    load_models()
+    load_prompts(app)
+    register_core_routes(app)
+    register_commands(app)
+
+    return app
@@ -0,0 +1,138 @@
+"""Completion cache: single-flight, errors, opt-out and empty replies."""
+
+import importlib.util
+import threading
+import time
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+@pytest.fixture
+def completion_cache(monkeypatch):
+    from flask import Flask
+
+    from modules.ai.utils import completion_cache
+    from modules.core.utils.cache import cache
+    from modules.core.utils.lru import LRUCache
+
+    app = Flask(__name__)
+    cache.init_app(app, config={"CACHE_TYPE": "SimpleCache"})
+    monkeypatch.setattr(completion_cache, "_local_cache", LRUCache(maxsize=8, ttl=60))
+    completion_cache.completion_cache_stats.reset()
+    with app.app_context():
+        yield completion_cache
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def run_concurrently(completion_cache, release, count: int = 3) -> list:
+    """
+    Call `cached_completion` from `count` threads while the provider call is
+    held until `release` is set.
+    """
+    results = []
+
+    def call():
+        try:
+            results.append(completion_cache.cached_completion("model", MESSAGES))
+        except Exception as e:
+            results.append(e)
+
+    stats = completion_cache.completion_cache_stats
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    threads[0].start()
+    wait_for(lambda: completion_cache._inflight)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for(lambda: stats.as_dict()["coalesced"] == count - 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_concurrent_requests_share_one_call(completion_cache, monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def create(model, messages, **params):
+        calls.append(model)
+        release.wait(5)
+        return "Hi"
+
+    monkeypatch.setattr(completion_cache, "_create_completion", create)
+
+    assert run_concurrently(completion_cache, release) == ["Hi"] * 3
+    assert len(calls) == 1
+    assert completion_cache.cached_completion("model", MESSAGES) == "Hi"
+    assert len(calls) == 1 and not completion_cache._inflight
+
+
+def test_errors_reach_every_waiting_caller(completion_cache, monkeypatch):
+    release = threading.Event()
+
+    def create(model, messages, **params):
+        release.wait(5)
+        raise RuntimeError("provider failed")
+
+    monkeypatch.setattr(completion_cache, "_create_completion", create)
+
+    results = run_concurrently(completion_cache, release)
+    assert len(results) == 3
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert not completion_cache._inflight
+
+
+def test_opted_out_workspaces_are_not_cached(completion_cache, monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        completion_cache, "_create_completion", lambda model, messages: calls.append(model) or "Hi"
+    )
+    monkeypatch.setattr(
+        completion_cache, "is_completion_cache_enabled", lambda workspace_id: workspace_id != 2
+    )
+
+    for _ in range(2):
+        assert completion_cache.cached_completion("model", MESSAGES, workspace_id=2) == "Hi"
+    assert len(calls) == 2
+    assert completion_cache.completion_cache_stats.as_dict()["bypassed"] == 2
+
+
+def test_empty_replies_are_not_cached(completion_cache, monkeypatch):
+    replies = iter(["", "Hi"])
+    monkeypatch.setattr(
+        completion_cache, "_create_completion", lambda model, messages: next(replies)
+    )
+    monkeypatch.setattr(
+        completion_cache, "iter_completion_deltas", lambda model, messages: (d for d in ["", ""])
+    )
+
+    assert completion_cache.cached_completion("model", MESSAGES) == ""
+    assert completion_cache.cached_completion("model", MESSAGES) == "Hi"
+
+    messages = [{"role": "user", "content": "Bye"}]
+    assert list(completion_cache.cached_completion_deltas("model", messages)) == ["", ""]
+    key = completion_cache.completion_cache_key("model", messages, {})
+    assert completion_cache.get_cached_completion(key) is None
+
+
+def test_opt_out_flags_are_invalidated(completion_cache):
+    from modules.core.utils.cache import cache
+
+    cache.set(completion_cache._workspace_flag_key(2), False)
+    assert not completion_cache.is_completion_cache_enabled(2)
+
+    completion_cache.invalidate_completion_cache_flag(2)
+    assert cache.get(completion_cache._workspace_flag_key(2)) is None
@@ -0,0 +1,98 @@
+"""Compression policy: size threshold, cached bodies by ETag, SSE streams."""
+
+import gzip
+import importlib.util
+import zlib
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None
+    or importlib.util.find_spec("flask_compress") is None,
+    reason="requires the full API source tree",
+)
+
+
+@pytest.fixture
+def client():
+    from flask import Flask
+
+    from modules.core.utils.compress import CompressionPolicy
+    from modules.core.utils.sse import format_sse, sse_response
+
+    app = Flask(__name__)
+    policy = CompressionPolicy()
+    policy.init_app(app)
+    # Only gzip, whatever is installed
+    policy.encodings = {"gzip"}
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/large")
+    def large():
+        return {"items": [{"id": i, "content": "lorem ipsum " * 4} for i in range(200)]}
+
+    @app.get("/cached")
+    def cached():
+        response = large()
+        response = app.make_response(response)
+        response.set_etag("v1", weak=True)
+        return response
+
+    @app.get("/events")
+    def events():
+        return sse_response(format_sse({"n": n}) for n in range(3))
+
+    return app.test_client()
+
+
+def test_small_responses_are_not_compressed(client):
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_view_etags_are_cached(client):
+    from modules.core.utils.compress import compression_cache_stats
+
+    compression_cache_stats.reset()
+    headers = {"Accept-Encoding": "gzip"}
+    first = client.get("/cached", headers=headers)
+    second = client.get("/cached", headers=headers)
+
+    assert first.headers["Content-Encoding"] == "gzip"
+    assert second.get_data() == first.get_data()
+    assert gzip.decompress(first.get_data()).startswith(b'{"items"')
+    assert compression_cache_stats.as_dict()["hits"] == 1
+
+    headers["If-None-Match"] = first.headers["ETag"]
+    assert client.get("/cached", headers=headers).status_code == 304
+
+
+def test_hashed_etags_are_not_cached(client):
+    from modules.core.utils.compress import compression_cache_stats
+
+    compression_cache_stats.reset()
+    headers = {"Accept-Encoding": "gzip"}
+    first = client.get("/large", headers=headers)
+    client.get("/large", headers=headers)
+
+    assert first.headers["Content-Encoding"] == "gzip"
+    assert first.headers["ETag"].startswith("W/")
+    assert compression_cache_stats.as_dict()["hits"] == 0
+    assert compression_cache_stats.as_dict()["misses"] == 0
+
+    headers["If-None-Match"] = first.headers["ETag"]
+    assert client.get("/large", headers=headers).status_code == 304
+
+
+def test_sse_frames_are_flushed_one_by_one(client):
+    response = client.get("/events", headers={"Accept-Encoding": "gzip"}, buffered=False)
+    assert response.headers["Content-Encoding"] == "gzip"
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    frames = [decompressor.decompress(chunk) for chunk in response.response]
+    # Every frame decodes as soon as it arrives
+    assert frames[:3] == [f'data: {{"n":{n}}}\n\n'.encode() for n in range(3)]
+    response.close()
@@ -0,0 +1,60 @@
+"""Column-projected reads."""
+
+import importlib.util
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+
+@pytest.fixture
+def people(tmp_path):
+    from flask import Flask
+    from sqlalchemy import Column, Integer, MetaData, Table, Text, insert
+
+    from modules.core.db.primary import primary_db as db
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path}/primary.db"
+    db.init_app(app)
+
+    table = Table(
+        "person", MetaData(), Column("id", Integer, primary_key=True), Column("name", Text)
+    )
+    with app.app_context():
+        table.create(db.engine)
+        db.session.execute(insert(table), [{"id": i, "name": f"p{i}"} for i in (1, 2, 3)])
+        db.session.commit()
+        yield table
+
+
+def test_projection_reads_records(people):
+    from modules.core.utils.db import Projection
+
+    projection = Projection("Person", people.c.id, people.c.name)
+    records = projection.all(projection.select().order_by(people.c.id))
+
+    assert records == [(1, "p1"), (2, "p2"), (3, "p3")]
+    assert type(records[0]) is projection.record and records[0].name == "p1"
+    assert not hasattr(records[0], "__dict__")
+    assert projection.one_or_none(projection.select().where(people.c.id == 9)) is None
+
+
+def test_prefetch_reads_related_rows_at_once(people):
+    from sqlalchemy import event
+
+    from modules.core.db.primary import primary_db as db
+    from modules.core.utils.db import Projection, prefetch
+
+    projection = Projection("Person", people.c.id, people.c.name)
+    statements = []
+    event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    authors = prefetch(projection, people.c.id, [1, 3, 3, None, 7])
+
+    assert {key: record.name for key, record in authors.items()} == {1: "p1", 3: "p3"}
+    assert len(statements) == 1
+    assert prefetch(projection, people.c.id, [None]) == {}
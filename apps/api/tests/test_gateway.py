@@ -0,0 +1,85 @@
+"""LLM gateway against the fake provider: fan-out, deadlines, cancellation."""
+
+import asyncio
+import importlib.util
+
+import pytest
+
+pytest.importorskip("httpx")
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+
+@pytest.fixture
+def make_gateway():
+    from modules.ai.utils.fake_provider import FakeProvider
+    from modules.ai.utils.gateway import LLMGateway, ProviderConfig
+
+    started = []
+
+    def make(first_token_delay: float = 0.0):
+        provider = FakeProvider(tokens=5, token_delay=0, first_token_delay=first_token_delay)
+        base_url = provider.start()
+        gateway = LLMGateway(
+            {
+                "openai": ProviderConfig("openai", base_url, "STEAGO_TEST_NO_KEY"),
+                "anthropic": ProviderConfig(
+                    "anthropic", base_url, "STEAGO_TEST_NO_KEY", api_format="anthropic"
+                ),
+            }
+        )
+        started.append((provider, gateway))
+        return provider, gateway
+
+    yield make
+    for provider, gateway in started:
+        gateway.close()
+        provider.stop()
+
+
+def request(provider: str = "openai"):
+    from modules.ai.utils.gateway import CompletionRequest
+
+    return CompletionRequest(provider, "fake-model", [{"role": "user", "content": "Hi"}])
+
+
+def test_fan_out_reports_each_request(make_gateway):
+    provider, gateway = make_gateway()
+
+    results = gateway.fan_out_sync(
+        [request("openai"), request("anthropic"), request("missing")], timeout=10
+    )
+
+    assert [result.ok for result in results] == [True, True, False]
+    assert results[0].content == results[1].content == "".join(provider.tokens)
+    assert "missing" in results[2].error
+
+
+def test_deadline_is_reported_per_request(make_gateway):
+    _, gateway = make_gateway(first_token_delay=2)
+
+    results = gateway.fan_out_sync([request(), request()], timeout=0.2)
+
+    assert [result.error for result in results] == ["timeout", "timeout"]
+
+
+def test_cancelling_the_caller_cancels_the_calls(make_gateway):
+    _, gateway = make_gateway(first_token_delay=2)
+
+    async def cancel_midway():
+        task = asyncio.ensure_future(gateway.fan_out([request(), request()], timeout=10))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_midway())
+
+    async def pending():
+        await asyncio.sleep(0.05)
+        return len(asyncio.all_tasks()) - 1
+
+    assert asyncio.run_coroutine_threadsafe(pending(), gateway._get_loop()).result(5) == 0
@@ -0,0 +1,61 @@
+"""Job retries: backoff bounds and the outcome recorded for each attempt."""
+
+import importlib.util
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    from modules.core.utils import jobs
+
+    finished = []
+    monkeypatch.setattr(
+        jobs, "_finish_job", lambda job_id, attempts, **values: finished.append(values)
+    )
+    monkeypatch.setattr(jobs.db.session, "rollback", lambda: None, raising=False)
+    jobs.finished = finished
+    return jobs
+
+
+def test_retry_delay_grows_and_is_capped():
+    from modules.core.utils.jobs import JOB_RETRY_MAX_DELAY, get_retry_delay
+
+    assert get_retry_delay(1) <= get_retry_delay(5) * 16
+    for attempts in range(1, 40):
+        delay = get_retry_delay(attempts)
+        assert 0 < delay <= JOB_RETRY_MAX_DELAY
+
+
+def test_run_job_outcomes(jobs):
+    from modules.core.models.enums import JOB_STATUS
+
+    calls = []
+
+    @jobs.job_handler("test.flaky")
+    def flaky(fail: bool):
+        calls.append(fail)
+        assert jobs._running_job is not None
+        if fail:
+            raise RuntimeError("boom")
+
+    assert jobs.run_job((1, "test.flaky", {"fail": False}, 1, 3))
+    assert not jobs.run_job((2, "test.flaky", {"fail": True}, 1, 3))
+    assert not jobs.run_job((3, "test.flaky", {"fail": True}, 3, 3))
+    assert not jobs.run_job((4, "test.missing", {}, 1, 3))
+
+    assert calls == [False, True, True]
+    statuses = [values["status"] for values in jobs.finished]
+    assert statuses == [
+        JOB_STATUS.SUCCEEDED,
+        JOB_STATUS.QUEUED,
+        JOB_STATUS.FAILED,
+        JOB_STATUS.QUEUED,
+    ]
+    assert "boom" in jobs.finished[1]["last_error"]
+    assert jobs._running_job is None and not jobs.refresh_job_lock()
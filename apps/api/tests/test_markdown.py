@@ -0,0 +1,43 @@
+"""Incremental rendering of streamed replies matches a full render."""
+
+import importlib.util
+
+import pytest
+
+pytest.importorskip("markdown2")
+pytest.importorskip("bs4")
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+REPLIES = [
+    "# Title\n\nA paragraph\non two lines.\n\n- a\n- b\n\n- loose\n\nAfter the list.",
+    "```python\nx = 1\n\n\ny = 2\n```\n\nText\n\n~~~\nunclosed\n\nstill code",
+    "> quote\n\n> same quote\n\n| a | b |\n|---|---|\n| 1 | 2 |\n\n---\n\n1. one\n\n   more",
+    "See [the docs][docs].\n\nMore text.\n\n[docs]: https://steago.ai",
+    "> quote\n\n    indented\n\nswallowed?\n\n<div>raw</div>\n\nend",
+    "\n\nHello there.\n\nSecond paragraph.",
+]
+
+
+@pytest.mark.parametrize("reply", REPLIES)
+@pytest.mark.parametrize("chunk_size", [1, 7])
+def test_incremental_matches_full_render(reply, chunk_size):
+    from modules.chat.utils.markdown import IncrementalMarkdownRenderer, render_markdown
+
+    renderer = IncrementalMarkdownRenderer()
+    for start in range(0, len(reply), chunk_size):
+        renderer.feed(reply[start : start + chunk_size])
+        assert renderer.html == render_markdown(reply[: start + chunk_size])
+    assert renderer.text == reply
+
+
+def test_completed_blocks_are_rendered_once():
+    from modules.chat.utils.markdown import IncrementalMarkdownRenderer
+
+    renderer = IncrementalMarkdownRenderer()
+    renderer.feed("First paragraph.\n\nSecond\n")
+    assert renderer.blocks == ["<p>First paragraph.</p>\n"]
+    assert renderer.tail_html == "<p>Second</p>\n"
@@ -0,0 +1,97 @@
+"""Lock-free metrics and their `/metrics` exposition."""
+
+import importlib.util
+import threading
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+
+def test_thread_shards_are_summed():
+    from modules.core.utils.metrics import Counter, Histogram, render_metrics
+
+    counter = Counter("test_shards_total", "Test counter.", ("kind",))
+    histogram = Histogram("test_shards_seconds", "Test histogram.", buckets=(0.1, 1))
+
+    def work():
+        for _ in range(1000):
+            counter.inc("a")
+        histogram.observe(0.5)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.inc("b", amount=2)
+
+    text = render_metrics()
+    assert 'test_shards_total{kind="a"} 4000' in text
+    assert 'test_shards_total{kind="b"} 2' in text
+    assert 'test_shards_seconds_bucket{le="0.1"} 0' in text
+    assert 'test_shards_seconds_bucket{le="1"} 4' in text
+    assert 'test_shards_seconds_bucket{le="+Inf"} 4' in text
+    assert "test_shards_seconds_count 4" in text
+    # Still there once the threads are gone and their shards retired
+    assert 'test_shards_total{kind="a"} 4000' in render_metrics()
+
+
+def test_requests_and_queries_are_timed(tmp_path):
+    from flask import Flask
+    from sqlalchemy import create_engine, text
+
+    from modules.core.utils.metrics import init_metrics
+
+    engine = create_engine(f"sqlite:///{tmp_path}/metrics.db")
+    app = Flask(__name__)
+    app.debug = True
+    init_metrics(app)
+
+    @app.get("/probe")
+    def probe():
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            connection.execute(text("SELECT 2"))
+        return "ok"
+
+    client = app.test_client()
+    assert client.get("/probe").status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert 'steago_http_requests_total{endpoint="probe",method="GET",status="200"} 1' in body
+    assert 'steago_http_request_db_queries_bucket{endpoint="probe",le="2"} 1' in body
+    assert 'steago_http_request_db_queries_bucket{endpoint="probe",le="1"} 0' in body
+
+
+def test_metrics_are_not_served_without_a_token(monkeypatch):
+    from flask import Flask
+
+    from modules.core.utils import metrics
+
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", None)
+    app = Flask(__name__)
+    metrics.init_metrics(app)
+
+    assert app.test_client().get("/metrics").status_code == 404
+
+
+def test_failed_queries_leave_nothing_on_the_connection():
+    from sqlalchemy import create_engine, event, exc, text
+
+    from modules.core.utils import metrics
+
+    engine = create_engine("sqlite://")
+    event.listen(engine, "before_cursor_execute", metrics._before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", metrics._after_cursor_execute)
+    with engine.connect() as connection:
+        with pytest.raises(exc.OperationalError):
+            connection.execute(text("SELECT * FROM missing"))
+        connection.execute(text("SELECT 1"))
+        # The pooled connection outlives the request
+        assert not connection.info
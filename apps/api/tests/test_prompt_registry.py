@@ -0,0 +1,28 @@
+"""Prompt registry: prompts defined in code, and loaded from the DB."""
+
+import importlib.util
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+
+def test_defined_prompts_until_loaded():
+    from modules.ai.utils.prompt_registry import PromptRegistry, get_rows_digest
+
+    registry = PromptRegistry()
+    registry.define("greet", "Hello {name}")
+    assert registry.render("greet", name="Ada") == "Hello Ada"
+
+    rows = [("greet", 1, "Hi {name}"), ("greet", 2, "Hey {name}")]
+    registry.load(rows)
+    assert registry.render("greet", name="Ada") == "Hey Ada"
+    assert registry.render("greet", 1, name="Ada") == "Hi Ada"
+    with pytest.raises(KeyError):
+        registry.get("other")
+
+    assert get_rows_digest(rows) == get_rows_digest(rows[::-1])
+    assert get_rows_digest(rows) != get_rows_digest(rows[:1])
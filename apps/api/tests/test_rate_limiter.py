@@ -0,0 +1,72 @@
+"""GCRA rate limiter unit tests, against a local Redis stand-in."""
+
+import importlib.util
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.config") is None,
+    reason="requires the full API source tree",
+)
+
+
+@pytest.fixture
+def gcra_limiter():
+    import fakeredis
+
+    from modules.core.utils.rate_limiter import GCRALimiter
+
+    return GCRALimiter(fakeredis.FakeRedis())
+
+
+def test_parse_rate_limit():
+    """Flask-Limiter style limits are parsed into a count and a period."""
+    from modules.core.utils.rate_limiter import RateLimit
+
+    assert RateLimit.parse("60/minute") == RateLimit(60, 60)
+    assert RateLimit.parse("1000/days") == RateLimit(1000, 86400)
+
+
+def test_burst_up_to_limit_then_deny(gcra_limiter):
+    """A full burst is allowed, the next request is denied with a retry time."""
+    from modules.core.utils.rate_limiter import RateLimit
+
+    limits = {"user:1": RateLimit(5, 60)}
+    assert all(gcra_limiter.hit(limits).allowed for _ in range(5))
+
+    result = gcra_limiter.hit(limits)
+    assert not result.allowed
+    assert result.key == "user:1"
+    assert 0 < result.retry_after <= 12
+
+
+def test_denied_keys_are_not_updated(gcra_limiter):
+    """Keys are updated together, and only when every key allows the request."""
+    from modules.core.utils.rate_limiter import RateLimit
+
+    user_limit = {"user:1": RateLimit(10, 60)}
+    limits = {**user_limit, "workspace:1": RateLimit(2, 60)}
+
+    assert gcra_limiter.hit(limits).allowed
+    assert gcra_limiter.hit(limits).allowed
+    assert gcra_limiter.hit(limits).key == "workspace:1"
+
+    # Only the two allowed requests counted against the user
+    assert all(gcra_limiter.hit(user_limit).allowed for _ in range(8))
+    assert not gcra_limiter.hit(user_limit).allowed
+
+
+def test_token_quota_deduct_and_peek(gcra_limiter):
+    """Deducted usage can go into debt, which `peek` then reports."""
+    from modules.core.utils.rate_limiter import RateLimit
+
+    quota = {"tokens:workspace:1": RateLimit(1000, 3600)}
+    assert gcra_limiter.peek(quota).allowed
+
+    gcra_limiter.deduct(quota, 900)
+    assert gcra_limiter.peek(quota).allowed
+
+    gcra_limiter.deduct(quota, 300)
+    result = gcra_limiter.peek(quota)
+    assert not result.allowed
+    assert result.retry_after > 0
@@ -0,0 +1,72 @@
+"""Realtime hub coalescing and batching, against an in-memory backend."""
+
+import importlib.util
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+
+@pytest.fixture
+def hub():
+    from modules.core.utils.realtime import RealtimeBackend, RealtimeHub
+
+    class RecordingBackend(RealtimeBackend):
+        max_batch_size = 2
+
+        def __init__(self):
+            self.calls = []
+
+        def trigger(self, channels, event, data):
+            self.calls.append(("trigger", channels, event, data))
+
+        def trigger_batch(self, events):
+            self.calls.append(("trigger_batch", events))
+
+    return RealtimeHub(RecordingBackend())
+
+
+def test_deltas_of_a_slice_are_coalesced(hub):
+    """All deltas of a reply within a slice are sent as one event."""
+    for delta in ("Hel", "lo ", "world"):
+        hub.publish_delta("thread-1", "reply-1", delta)
+    hub.publish_delta("thread-2", "reply-2", "Hi")
+    hub.flush()
+
+    assert hub.backend.calls == [
+        (
+            "trigger_batch",
+            [
+                ("thread-1", "message-delta", {"key": "reply-1", "delta": "Hello world"}),
+                ("thread-2", "message-delta", {"key": "reply-2", "delta": "Hi"}),
+            ],
+        )
+    ]
+
+
+def test_event_order_is_kept(hub):
+    """Deltas are not merged across other events, multi channel events are
+    sent in one trigger, and batches are split at the backend limit."""
+    hub.publish_delta("thread-1", "reply-1", "a")
+    hub.publish("thread-1", "message-created", {"uuid": "m1"})
+    hub.publish_delta("thread-1", "reply-1", "b")
+    hub.publish(["channel-1", "channel-2"], "thread-updated", {"uuid": "t1"})
+    hub.flush()
+
+    assert hub.backend.calls == [
+        (
+            "trigger_batch",
+            [
+                ("thread-1", "message-delta", {"key": "reply-1", "delta": "a"}),
+                ("thread-1", "message-created", {"uuid": "m1"}),
+            ],
+        ),
+        (
+            "trigger_batch",
+            [("thread-1", "message-delta", {"key": "reply-1", "delta": "b"})],
+        ),
+        ("trigger", ["channel-1", "channel-2"], "thread-updated", {"uuid": "t1"}),
+    ]
@@ -0,0 +1,80 @@
+"""Read-replica routing, with SQLite files standing in for Postgres."""
+
+import importlib.util
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    from flask import Flask
+    from sqlalchemy import text
+
+    from modules.core.db import replica
+    from modules.core.db.pool import get_engine_options
+    from modules.core.db.primary import primary_db as db
+
+    monkeypatch.setattr(replica, "REPLICA_URIS", [f"sqlite:///{tmp_path}/replica.db"])
+    monkeypatch.setattr(replica, "REPLICA_BIND_NAMES", ["replica_0"])
+    pinned = set()
+    monkeypatch.setattr(replica, "pin_to_primary", lambda *keys: pinned.update(keys))
+    monkeypatch.setattr(replica, "is_pinned", lambda keys: bool(pinned & set(keys)))
+
+    options = get_engine_options()
+    options.pop("connect_args")
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path}/primary.db"
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+    app.config["SQLALCHEMY_BINDS"] = {
+        "replica_0": {**options, "url": replica.REPLICA_URIS[0]}
+    }
+    db.init_app(app)
+
+    with app.app_context():
+        for name, engine in db.engines.items():
+            with engine.begin() as connection:
+                connection.execute(text("CREATE TABLE probe (source TEXT)"))
+                source = "primary" if name is None else "replica"
+                connection.execute(text(f"INSERT INTO probe VALUES ('{source}')"))
+    app.pinned = pinned
+    return app
+
+
+def read_source():
+    from sqlalchemy import column, select, table
+
+    from modules.core.db.primary import primary_db as db
+
+    return db.session.scalar(select(column("source")).select_from(table("probe")))
+
+
+def test_reads_go_to_the_replica_until_a_write(app):
+    from sqlalchemy import column, insert, table
+
+    from modules.core.db.primary import primary_db as db
+    from modules.core.db.replica import use_replica
+
+    with app.app_context():
+        assert read_source() == "primary"
+        with use_replica():
+            assert read_source() == "replica"
+            db.session.execute(insert(table("probe", column("source"))).values(source="new"))
+            db.session.commit()
+            # Read your writes: the rest of the session stays on the primary
+            assert read_source() == "primary"
+
+
+def test_pinned_keys_read_from_the_primary(app):
+    from modules.core.db.replica import use_replica
+
+    app.pinned.add("user:1")
+    with app.app_context():
+        with use_replica("user:1"):
+            assert read_source() == "primary"
+        with use_replica("user:2"):
+            assert read_source() == "replica"
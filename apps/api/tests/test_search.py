@@ -0,0 +1,52 @@
+"""Message search route: validation and snippets."""
+
+import importlib.util
+import inspect
+from types import SimpleNamespace
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+
+@pytest.fixture
+def search(monkeypatch):
+    from flask import Flask
+
+    from modules.chat import search
+
+    monkeypatch.setattr(search, "current_user", SimpleNamespace(workspace_id=1))
+    app = Flask(__name__)
+
+    def call(query_string: str):
+        # Past authentication and the replica routing
+        view = inspect.unwrap(search.search_workspace_messages)
+        with app.test_request_context(f"/chat/search?{query_string}"):
+            response, status = view()
+            return response.get_json(), status
+
+    return call
+
+
+def test_empty_queries_are_rejected(search):
+    for query_string in ("", "q=", "q=%20%20"):
+        body, status = search(query_string)
+        assert status == 400 and body["error"] == "invalid-query"
+
+
+def test_bad_cursors_are_rejected_before_searching(search):
+    # No database here: the cursor must be checked first
+    body, status = search("q=hello&cursor=not-a-cursor")
+    assert status == 400 and body["error"] == "invalid-cursor"
+
+
+def test_snippets_are_escaped():
+    from modules.chat.search import format_snippet
+
+    snippet = "<script>\x02alert\x03</script> & \x02co\x03"
+    assert format_snippet(snippet) == (
+        "&lt;script&gt;<mark>alert</mark>&lt;/script&gt; &amp; <mark>co</mark>"
+    )
@@ -0,0 +1,85 @@
+"""JSON provider backends, and row serializers."""
+
+import importlib.util
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+PAYLOAD = {
+    "uuid": uuid.UUID("0b5c2f8e-61a4-4d8b-9a52-1d7c0e3f4a21"),
+    "created_ts": datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    "price": Decimal("1.50"),
+    "name": "Zoë",
+    "items": [1, None, True],
+}
+
+
+def make_app(backend: str):
+    from flask import Flask
+
+    from modules.core.utils import serialization
+
+    app = Flask(__name__)
+    provider = serialization.JSONProvider(app)
+    if backend == "json":
+        provider._orjson = None
+    app.json = provider
+    app.json.sort_keys = False
+    return app
+
+
+@pytest.mark.parametrize(
+    "backend",
+    [
+        "json",
+        pytest.param(
+            "orjson",
+            marks=pytest.mark.skipif(
+                importlib.util.find_spec("orjson") is None, reason="orjson is not installed"
+            ),
+        ),
+    ],
+)
+def test_backends_encode_alike(backend):
+    app = make_app(backend)
+    assert app.json.backend == backend
+    with app.app_context():
+        response = app.json.response(PAYLOAD)
+        assert app.json.loads(response.get_data()) == {
+            "uuid": "0b5c2f8e-61a4-4d8b-9a52-1d7c0e3f4a21",
+            "created_ts": "Fri, 02 Jan 2026 03:04:05 GMT",
+            "price": "1.50",
+            "name": "Zoë",
+            "items": [1, None, True],
+        }
+        assert app.json.loads(app.json.dumps(PAYLOAD)) == app.json.loads(response.get_data())
+
+
+def test_row_serializer_reads_row_tuples():
+    from sqlalchemy import Column, Integer, MetaData, Table, Text
+
+    from modules.core.utils.serialization import PARAMETER, RowSerializer
+
+    table = Table("t", MetaData(), Column("id", Integer), Column("a", Integer), Column("b", Text))
+    serializer = RowSerializer(
+        a=table.c.a,
+        double=(table.c.a, lambda a: a * 2),
+        extra=PARAMETER,
+        b=table.c.b,
+    )
+
+    assert [c.key for c in serializer.columns] == ["a", "b"]
+    assert serializer((2, "x"), extra=1) == {"a": 2, "double": 4, "extra": 1, "b": "x"}
+    # More columns can follow
+    assert serializer.many([(3, "y", 99)]) == [{"a": 3, "double": 6, "extra": None, "b": "y"}]
+    # Fields keep their declared order
+    assert list(serializer((2, "x"))) == ["a", "double", "extra", "b"]
+    with pytest.raises(TypeError):
+        serializer((2, "x"), other=1)
@@ -0,0 +1,74 @@
+"""Startup (import time) benchmark of the API module."""
+
+import importlib.util
+import os
+import subprocess
+import sys
+
+import pytest
+
+API_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative `import steago` time allowed, in milliseconds
+STARTUP_IMPORT_BUDGET_MS = int(os.environ.get("STEAGO_STARTUP_IMPORT_BUDGET_MS", 1500))
+
+# Only imported when the app is created, never when the module is imported
+DEFERRED_MODULES = (
+    "openai",
+    "groq",
+    "pusher",
+    "bs4",
+    "markdown2",
+    "httpx",
+    "tiktoken",
+    "numpy",
+)
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.config") is None,
+    reason="requires the full API source tree",
+)
+
+
+def _import_steago():
+    env = {
+        "STEAGO_CORE_USER_MODEL_TABLE": "core_user",
+        "STEAGO_CORE_WORKSPACE_MODEL_TABLE": "core_workspace",
+        **os.environ,
+    }
+    script = (
+        "import sys, steago; "
+        f"print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+    )
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=API_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def _cumulative_import_us(importtime_log: str, module: str) -> int:
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    for line in importtime_log.splitlines():
+        parts = [part.strip() for part in line.removeprefix("import time:").split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    raise AssertionError(f"No import time reported for {module}")
+
+
+def test_import_does_not_load_deferred_modules():
+    """Provider SDKs and heavy libraries are not loaded by `import steago`."""
+    result = _import_steago()
+    assert result.stdout.strip() == ""
+
+
+def test_import_time_within_budget():
+    """`import steago` stays within the startup budget."""
+    result = _import_steago()
+    import_ms = _cumulative_import_us(result.stderr, "steago") / 1000
+    assert import_ms <= STARTUP_IMPORT_BUDGET_MS, (
+        f"import steago took {import_ms:.0f}ms, budget is {STARTUP_IMPORT_BUDGET_MS}ms"
+    )
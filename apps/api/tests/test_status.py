@@ -0,0 +1,44 @@
+"""Status snapshot: notifications and the staleness bound."""
+
+import importlib.util
+import time
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+
+@pytest.fixture
+def snapshot():
+    from modules.core.utils.status import StatusSnapshot
+
+    snapshot = StatusSnapshot(max_staleness=30)
+    snapshot.confirmed_at = time.monotonic()
+    return snapshot
+
+
+def test_notifications_block_and_unblock(snapshot):
+    from modules.core.models.enums import USER_STATUS, WORKSPACE_STATUS
+
+    assert snapshot.is_allowed(1, 10) is True
+
+    snapshot.apply(f"u:1:{USER_STATUS.SUSPENDED.value}")
+    assert snapshot.is_allowed(1, 10) is False
+    assert snapshot.is_allowed(2, 10) is True
+
+    snapshot.apply(f"u:1:{USER_STATUS.ACTIVE.value}")
+    snapshot.apply(f"w:10:{WORKSPACE_STATUS.DELETED.value}")
+    assert snapshot.is_allowed(1, 10) is False
+    assert snapshot.is_allowed(1, 11) is True
+
+    # Row deleted
+    snapshot.apply("w:10:-1")
+    assert snapshot.is_allowed(1, 10) is True
+
+
+def test_stale_snapshot_is_not_trusted(snapshot):
+    snapshot.confirmed_at = time.monotonic() - 31
+    assert snapshot.is_allowed(1, 10) is None
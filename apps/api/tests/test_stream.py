@@ -0,0 +1,104 @@
+"""Completion relay: cancellation and errors."""
+
+import importlib.util
+import threading
+import time
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+
+def test_disconnect_reports_the_partial_reply():
+    from modules.ai.utils.stream import relay_completion
+
+    closed = threading.Event()
+    completed, aborted = [], []
+
+    def deltas():
+        try:
+            yield "Hello"
+            yield " there"
+            yield " again"
+        finally:
+            closed.set()
+
+    frames = relay_completion(
+        deltas(), completed.append, flush_interval=0, on_abort=aborted.append
+    )
+    # The stream comment, then one frame per delta
+    for _ in range(3):
+        next(frames)
+    frames.close()
+
+    # On the reader thread
+    assert closed.wait(5) and not completed
+    assert aborted == ["Hello there"]
+
+
+def test_errors_report_the_partial_reply():
+    from modules.ai.utils.stream import relay_completion
+
+    aborted = []
+
+    def deltas():
+        yield "Hello"
+        raise RuntimeError("provider failed")
+
+    frames = list(relay_completion(deltas(), lambda text: {}, on_abort=aborted.append))
+
+    assert "completion-failed" in frames[-1]
+    assert aborted == ["Hello"]
+
+
+def test_held_back_deltas_are_flushed_on_time():
+    from modules.ai.utils.stream import relay_completion
+
+    def deltas():
+        yield "Hello"
+        yield " there"
+        time.sleep(0.5)
+        yield " again"
+
+    frames = relay_completion(deltas(), lambda text: {}, flush_interval=0.1)
+    next(frames)
+    started_at = time.monotonic()
+    assert "Hello" in next(frames)
+    # Held back by the first frame, sent before the last delta arrives
+    assert " there" in next(frames)
+    assert time.monotonic() - started_at < 0.4
+    assert " again" in next(frames)
+
+
+def test_stalled_clients_release_the_reader(monkeypatch):
+    from modules.ai.utils import stream
+
+    monkeypatch.setattr(stream, "STREAM_READ_AHEAD", 2)
+    monkeypatch.setattr(stream, "STREAM_STALL_TIMEOUT", 0.2)
+    monkeypatch.setattr(stream, "_POLL_INTERVAL", 0.05)
+    closed = threading.Event()
+    read, aborted = [], []
+
+    def deltas():
+        try:
+            while True:
+                read.append("x")
+                yield "x"
+        finally:
+            closed.set()
+
+    frames = stream.relay_completion(
+        deltas(), lambda text: {}, flush_interval=0, on_abort=aborted.append
+    )
+    next(frames)
+    next(frames)
+    # The client stops reading: the reader stops too, then gives up
+    assert closed.wait(5)
+    assert len(read) <= 5
+
+    rest = list(frames)
+    assert "completion-failed" in rest[-1]
+    assert aborted and aborted[0] == "x" * len(aborted[0])
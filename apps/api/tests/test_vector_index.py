@@ -0,0 +1,60 @@
+"""Local embedder and IVF index, offline."""
+
+import importlib.util
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.config") is None,
+    reason="requires the full API source tree",
+)
+
+
+def test_local_embedder_is_deterministic():
+    """Same text, same unit vector; shared words make texts closer."""
+    from modules.ai.utils.embeddings import LocalEmbeddingProvider
+
+    provider = LocalEmbeddingProvider(dim=64)
+    a, b, c = provider.embed(
+        ["deploy the billing service", "deploy the billing service today", "lunch menu"]
+    )
+    assert np.array_equal(a, provider.embed(["deploy the billing service"])[0])
+    assert a.dtype == np.float32
+    assert np.isclose(np.linalg.norm(a), 1.0)
+    assert a @ b > a @ c
+
+
+def test_ivf_search_matches_exact_search():
+    """Probing a few lists finds (almost) the same neighbours as brute force."""
+    from modules.ai.utils.vector_index import IVFIndex, VectorStore, normalize
+
+    rng = np.random.default_rng(0)
+    centers = normalize(rng.normal(size=(50, 32)))
+    vectors = normalize(centers[rng.integers(0, 50, 5000)] + 0.1 * rng.normal(size=(5000, 32)))
+
+    index = IVFIndex(VectorStore(32, capacity=16), min_size=1000)
+    for start in range(0, 5000, 500):
+        ids = np.arange(start, start + 500)
+        index.add(ids, vectors[start : start + 500], ids // 10)
+
+    recall = 0.0
+    for query in vectors[:50]:
+        result = index.search(query, k=10)
+        assert index.is_trained
+        exact = np.argsort(-(vectors @ query))[:10]
+        recall += len(set(result.ids.tolist()) & set(exact.tolist())) / 10
+    assert recall / 50 >= 0.9
+
+
+def test_search_excludes_group():
+    from modules.ai.utils.vector_index import IVFIndex, VectorStore, normalize
+
+    vectors = normalize(np.eye(4, dtype=np.float32) + 0.01)
+    index = IVFIndex(VectorStore(4))
+    index.add([10, 11, 12, 13], vectors, [1, 1, 2, 3])
+
+    result = index.search(vectors[0], k=2, exclude_group=1)
+    assert 1 not in result.groups.tolist()
+    assert len(result.ids) == 2
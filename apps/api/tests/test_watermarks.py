@@ -0,0 +1,108 @@
+"""Watermarks: versions, invalidation on commit, and the change feed."""
+
+import importlib.util
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def app(tmp_path):
+    from flask import Flask
+
+    from modules.chat.models.thread import ChatThread
+    from modules.core.db.primary import primary_db as db
+    from modules.core.utils.cache import cache
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path}/primary.db"
+    db.init_app(app)
+    cache.init_app(app, config={"CACHE_TYPE": "SimpleCache"})
+
+    with app.app_context():
+        ChatThread.__table__.create(db.engine)
+    return app
+
+
+def add_thread(workspace_id: int, ts: datetime):
+    from modules.chat.models.thread import ChatThread
+    from modules.core.db.primary import primary_db as db
+
+    thread = ChatThread()
+    thread.workspace_id = workspace_id
+    thread.created_ts = thread.modified_ts = ts
+    db.session.add(thread)
+    db.session.commit()
+    return thread
+
+
+def test_versions_round_trip():
+    from modules.chat.utils.watermarks import format_version, parse_version
+
+    assert parse_version(format_version(T0, 3, 12.5)) == (T0, 3)
+    assert parse_version(format_version(None, 0, None)) == (None, 0)
+    assert parse_version("not-a-version") is None
+
+
+def test_commits_invalidate_the_cached_watermark(app):
+    from modules.chat.utils.watermarks import get_watermark
+    from modules.core.db.primary import primary_db as db
+
+    with app.app_context():
+        thread = add_thread(1, T0)
+        first = get_watermark("threads", 1)
+        assert get_watermark("threads", 1) == first
+
+        # Same count and high-water mark, but an older row changed
+        add_thread(1, T0 + timedelta(seconds=10))
+        second = get_watermark("threads", 1)
+        assert second != first
+        thread.modified_ts = T0 + timedelta(seconds=5)
+        db.session.commit()
+        assert get_watermark("threads", 1) != second
+
+        # Other workspaces are not affected
+        assert get_watermark("threads", 2) == get_watermark("threads", 2)
+
+
+def test_deletions_reset_the_change_feed(app):
+    from modules.chat.models.thread import ChatThread
+    from modules.chat.utils.watermarks import get_changed_rows, parse_version, read_watermark
+    from modules.core.db.primary import primary_db as db
+
+    with app.app_context():
+        old = add_thread(1, T0 - timedelta(hours=1))
+        add_thread(1, T0)
+        since = parse_version(read_watermark("threads", 1))
+
+        new = add_thread(1, T0 + timedelta(minutes=1))
+        rows, reset = get_changed_rows(
+            ChatThread, 1, since, parse_version(read_watermark("threads", 1))
+        )
+        # The rows of the last seconds are sent again
+        assert [row.id for row in rows] == [old.id + 1, new.id] and not reset
+
+        db.session.delete(old)
+        db.session.commit()
+        _, reset = get_changed_rows(
+            ChatThread, 1, since, parse_version(read_watermark("threads", 1))
+        )
+        assert reset
+
+
+def test_user_writes_change_the_users_version(app):
+    from modules.core.utils.identity import get_users_version, invalidate_identity
+
+    with app.app_context():
+        first = get_users_version(1)
+        assert get_users_version(1) == first
+
+        invalidate_identity("user-uuid", 1)
+        assert get_users_version(1) != first
@@ -0,0 +1,80 @@
+"""Local WebSocket server: subscriptions, slow clients, startup errors."""
+
+import asyncio
+import base64
+import importlib.util
+import os
+import socket
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    importlib.util.find_spec("modules.core.utils.log") is None,
+    reason="requires the full API source tree",
+)
+
+
+@pytest.fixture
+def server():
+    from modules.core.utils.websocket import LocalWebSocketServer
+
+    server = LocalWebSocketServer(
+        port=0, authorize=lambda token, channels: token == "good" and channels == ["thread-1"]
+    )
+    server.start()
+    yield server
+    server.stop()
+
+
+def handshake(server, query: str) -> bytes:
+    key = base64.b64encode(os.urandom(16)).decode()
+    with socket.create_connection((server.host, server.port), timeout=5) as sock:
+        sock.sendall(
+            (
+                f"GET /?{query} HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n"
+                f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n\r\n"
+            ).encode()
+        )
+        return sock.recv(1024)
+
+
+def test_subscriptions_are_authorized(server):
+    assert handshake(server, "channels=thread-1&token=good").startswith(b"HTTP/1.1 101")
+    assert handshake(server, "channels=thread-1&token=bad").startswith(b"HTTP/1.1 403")
+    assert handshake(server, "channels=thread-2&token=good").startswith(b"HTTP/1.1 403")
+
+
+def test_taken_port_fails_loudly(server):
+    from modules.core.utils.websocket import LocalWebSocketServer
+
+    with pytest.raises(OSError):
+        LocalWebSocketServer(port=server.port).start()
+
+
+def test_slow_clients_are_dropped(monkeypatch):
+    from modules.core.utils import websocket
+
+    monkeypatch.setattr(websocket, "CLIENT_QUEUE_SIZE", 1)
+    server = websocket.LocalWebSocketServer()
+
+    class Task:
+        cancelled = False
+
+        def cancel(self):
+            self.cancelled = True
+
+    slow = websocket._Client(Task())
+    fast = websocket._Client(Task())
+    fast.queue = asyncio.Queue()
+    for client, channels in ((slow, ["thread-1", "thread-2"]), (fast, ["thread-1"])):
+        client.channels = channels
+        for channel in channels:
+            server._subscribers.setdefault(channel, set()).add(client)
+
+    server._broadcast([("thread-1", "delta", {"n": n}) for n in range(3)])
+    server._broadcast([("thread-2", "delta", {"n": 3})])
+
+    assert slow.task.cancelled
+    assert server._subscribers == {"thread-1": {fast}}
+    # The others still get every event
+    assert fast.queue.qsize() == 3